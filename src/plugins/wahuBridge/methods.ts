@@ -5,6 +5,7 @@ export type datetime = string
 export type PixivRecomMode = 'day' | 'week' | 'month' | 'day_male' | 'day_female' | 'week_original' | 'week_rookie'
 export type PixivSearchTarget = 'partial_match_for_tags' | 'exact_match_for_tags' | 'title_and_caption' | 'keyword'
 export type PixivSort = 'date_desc' | 'date_asc' | 'popular_desc'
+export type PagesPolicy = 'source' | 'target' | 'union'
 
 interface PixivComment {
     cid: number;
@@ -116,6 +117,8 @@ interface DownloadProgress {
     gid: string;
     total_size: number | null;
     downloaded_size: number;
+    resumed_size: number;
+    retries: number;
     descript: string | null;
     status: 'inprogress' | 'finished' | 'error' | 'pending';
 }
@@ -154,7 +157,18 @@ interface IllustBookmarkingConfig {
     subscribe_pages: number;
 }
 
-export type {PixivComment, PixivUserSummery, IllustTag, IllustDetail, PixivUserDetail, PixivUserPreview, IllustBookmark, FileEntry, TrendingTagIllusts, FileTracingConfig, RepoSyncAddReport, AccountSession, FileEntryWithURL, DownloadProgress, CliScriptInfo, WeighedIllustTag, CountedIllustTag, TagRegressionModel, IllustBookmarkingConfig}
+interface JobStatus {
+    name: string;
+    interval: number;
+    running: boolean;
+    run_count: number;
+    next_run: number | null;
+    last_start: number | null;
+    last_latency: number | null;
+    last_error: string | null;
+}
+
+export type {PixivComment, PixivUserSummery, IllustTag, IllustDetail, PixivUserDetail, PixivUserPreview, IllustBookmark, FileEntry, TrendingTagIllusts, FileTracingConfig, RepoSyncAddReport, AccountSession, FileEntryWithURL, DownloadProgress, CliScriptInfo, WeighedIllustTag, CountedIllustTag, TagRegressionModel, IllustBookmarkingConfig, JobStatus}
 
 export async function cli_list () : Promise<Array<CliScriptInfo>> {
     return await wahuRPCCall('cli_list', [])as Array<CliScriptInfo>}
@@ -180,6 +194,15 @@ export async function ibd_copy (name: string, target: string, iids: Array<number
 export async function ibd_export_json (name: string) : Promise<string> {
     return await wahuRPCCall('ibd_export_json', [name])as string}
 
+export async function ibd_export_ndjson (name: string) : Promise<AsyncGenerator<string, undefined, null>> {
+    return await wahuRPCCall('ibd_export_ndjson', [name])as AsyncGenerator<string, undefined, null>}
+
+export async function ibd_export_ndjson_file (name: string, path: string) : Promise<null> {
+    return await wahuRPCCall('ibd_export_ndjson_file', [name, path])as null}
+
+export async function ibd_export_snapshot (name: string, path: string) : Promise<[number, number]> {
+    return await wahuRPCCall('ibd_export_snapshot', [name, path])as [number, number]}
+
 export async function ibd_filter_restricted (name: string) : Promise<Array<number>> {
     return await wahuRPCCall('ibd_filter_restricted', [name])as Array<number>}
 
@@ -198,15 +221,30 @@ export async function ibd_ilst_detail (name: string, iid: number) : Promise<null
 export async function ibd_import_json (name: string, json_str: string) : Promise<null> {
     return await wahuRPCCall('ibd_import_json', [name, json_str])as null}
 
+export async function ibd_import_ndjson (name: string) : Promise<AsyncGenerator<string, undefined, null | string>> {
+    return await wahuRPCCall('ibd_import_ndjson', [name])as AsyncGenerator<string, undefined, null | string>}
+
+export async function ibd_import_ndjson_file (name: string, path: string) : Promise<[number, number]> {
+    return await wahuRPCCall('ibd_import_ndjson_file', [name, path])as [number, number]}
+
+export async function ibd_import_snapshot (name: string, path: string) : Promise<[number, number]> {
+    return await wahuRPCCall('ibd_import_snapshot', [name, path])as [number, number]}
+
 export async function ibd_list () : Promise<Array<string>> {
     return await wahuRPCCall('ibd_list', [])as Array<string>}
 
 export async function ibd_list_bm (name: string) : Promise<Array<IllustBookmark>> {
     return await wahuRPCCall('ibd_list_bm', [name])as Array<IllustBookmark>}
 
+export async function ibd_merge (name: string, target: string, pages: PagesPolicy) : Promise<[number, number]> {
+    return await wahuRPCCall('ibd_merge', [name, target, pages])as [number, number]}
+
 export async function ibd_new (name: string) : Promise<null> {
     return await wahuRPCCall('ibd_new', [name])as null}
 
+export async function ibd_page_bm (name: string, after: null | Array<number>, limit: number) : Promise<[Array<IllustBookmark>, null | Array<number>]> {
+    return await wahuRPCCall('ibd_page_bm', [name, after, limit])as [Array<IllustBookmark>, null | Array<number>]}
+
 export async function ibd_query (name: string, qs: string) : Promise<Array<[number, number]>> {
     return await wahuRPCCall('ibd_query', [name, qs])as Array<[number, number]>}
 
@@ -216,6 +254,9 @@ export async function ibd_query_bm (name: string, iid: number) : Promise<null |
 export async function ibd_query_help () : Promise<string> {
     return await wahuRPCCall('ibd_query_help', [])as string}
 
+export async function ibd_query_multi (names: Array<string>, qs: string, limit: null | number) : Promise<AsyncGenerator<Array<[string, number, number]>, undefined, null>> {
+    return await wahuRPCCall('ibd_query_multi', [names, qs, limit])as AsyncGenerator<Array<[string, number, number]>, undefined, null>}
+
 export async function ibd_query_uid (name: string, uid: number) : Promise<Array<number>> {
     return await wahuRPCCall('ibd_query_uid', [name, uid])as Array<number>}
 
@@ -228,8 +269,8 @@ export async function ibd_set_bm (name: string, iid: number, pages: Array<number
 export async function ibd_set_config (name: string, config: IllustBookmarkingConfig) : Promise<null> {
     return await wahuRPCCall('ibd_set_config', [name, config])as null}
 
-export async function ibd_update (name: string) : Promise<null> {
-    return await wahuRPCCall('ibd_update', [name])as null}
+export async function ibd_update (name: string, update_all: boolean) : Promise<AsyncGenerator<string, undefined, null | string>> {
+    return await wahuRPCCall('ibd_update', [name, update_all])as AsyncGenerator<string, undefined, null | string>}
 
 export async function ibd_update_subs (name: string, page_num: null | number) : Promise<AsyncGenerator<string, undefined, null | string>> {
     return await wahuRPCCall('ibd_update_subs', [name, page_num])as AsyncGenerator<string, undefined, null | string>}
@@ -288,6 +329,12 @@ export async function ir_update_index (name: string) : Promise<Array<FileEntry>>
 export async function ir_validate (name: string) : Promise<[Array<FileEntry>, Array<Path>]> {
     return await wahuRPCCall('ir_validate', [name])as [Array<FileEntry>, Array<Path>]}
 
+export async function job_run (name: string) : Promise<null> {
+    return await wahuRPCCall('job_run', [name])as null}
+
+export async function job_status () : Promise<Array<JobStatus>> {
+    return await wahuRPCCall('job_status', [])as Array<JobStatus>}
+
 export async function p_account_session () : Promise<null | AccountSession> {
     return await wahuRPCCall('p_account_session', [])as null | AccountSession}
 
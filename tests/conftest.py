@@ -9,11 +9,13 @@ from wahu_backend.wahu_config.load_config import load_config
 from wahu_backend.illust_bookmarking.illust_bookmark_database import IllustBookmarkDatabase
 from wahu_backend.wahu_core.wahu_context import WahuContext
 import asyncio
+import dataclasses
 import pytest
 from wahu_backend.aiopixivpy.datastructure_processing import (
     process_pixiv_illust_dict, process_pixiv_user_detail_dict,
     process_pixiv_user_summery_dict)
 from wahu_backend.aiopixivpy.datastructure_user import PixivUserPreview
+from wahu_backend.illust_bookmarking import IllustBookmark
 from pixiv_dict_examples import (illust_dict1, illust_dict2, user_detail_dict,
                                  user_preview_dict)
 import pyximport
@@ -57,3 +59,46 @@ async def wahu_ctx():
     ctx = WahuContext(cfg)
 
     return ctx
+
+
+@pytest.fixture
+def make_ibd():
+    """返回新建内存中插画数据库的函数，建立的数据库在测试结束后关闭"""
+
+    ibds: list[IllustBookmarkDatabase] = []
+
+    def make() -> IllustBookmarkDatabase:
+        ibd = IllustBookmarkDatabase('test', ':memory:')
+        ibd.connect()
+        ibds.append(ibd)
+        return ibd
+
+    yield make
+
+    for ibd in ibds:
+        ibd.close()
+
+
+@pytest.fixture
+def seed_iids():
+    """`ibd` 中 `(详情的 iid, 收藏的 iid)` ，测试模块可以覆盖"""
+
+    return range(1, 8), range(1, 11)
+
+
+@pytest.fixture
+def ibd(make_ibd, seed_iids):
+    """
+    内存中的插画数据库. 详情为 `illust_dict1` 换上 `seed_iids` 中的 iid ，再加上 `illust_dict2` ；
+    收藏为 `IllustBookmark(iid, [0, iid], iid * 10)`
+    """
+
+    illust_iids, bookmark_iids = seed_iids
+    illust_detail1 = process_pixiv_illust_dict(illust_dict1)
+
+    ibd = make_ibd()
+    ibd.illusts_te.insert([
+        dataclasses.replace(illust_detail1, iid=iid) for iid in illust_iids
+    ] + [process_pixiv_illust_dict(illust_dict2)])
+    ibd.bookmarks_te.insert([IllustBookmark(iid, [0, iid], iid * 10) for iid in bookmark_iids])
+    return ibd
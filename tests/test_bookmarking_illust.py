@@ -1,4 +1,6 @@
+import asyncio
 import dataclasses
+import sqlite3
 
 import pytest
 import pytest_asyncio
@@ -8,7 +10,9 @@ from pixiv_dict_examples import illust_dict1, illust_dict2
 
 from wahu_backend.aiopixivpy import IllustDetail
 from wahu_backend.aiopixivpy.datastructure_processing import process_pixiv_illust_dict
-from wahu_backend.illust_bookmarking import IllustBookmarkDatabase
+from wahu_backend.illust_bookmarking import IllustBookmark, IllustBookmarkDatabase
+from wahu_backend.illust_bookmarking.illust_bookmark_database import fetch_details
+from wahu_backend.wahu_core.wahu_cli import AsyncGenPipe
 
 illust_detail1 = process_pixiv_illust_dict(illust_dict1)
 illust_detail2 = process_pixiv_illust_dict(illust_dict2)
@@ -121,6 +125,142 @@ class TestUpdateDetail:
             0].title == 'Kotori!Kotori!'
 
 
+@pytest.mark.asyncio
+class TestFetchDetails:
+
+    @staticmethod
+    async def test_concurrency_and_chunks():
+        running = 0
+        max_running = 0
+
+        async def slow_get_detail(iid):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if iid % 5 == 0:
+                raise RuntimeError('不存在')
+            return dataclasses.replace(illust_detail1, iid=iid)
+
+        chunks = []
+
+        async def write(details):
+            chunks.append([d.iid for d in details])
+
+        pipe = AsyncGenPipe()
+        failed = await fetch_details(
+            range(1, 21), slow_get_detail, write,
+            concurrency=3, chunk_size=4, pipe=pipe)
+
+        assert max_running == 3
+        assert failed == [5, 10, 15, 20]
+        assert all(len(c) == 4 for c in chunks)
+        assert sorted(sum(chunks, [])) == [i for i in range(1, 21) if i % 5 != 0]
+
+    @staticmethod
+    async def test_write_error_stops():
+
+        async def write(details):
+            raise sqlite3.OperationalError()
+
+        with pytest.raises(sqlite3.OperationalError):
+            await fetch_details(
+                [illust_detail1.iid, illust_detail2.iid], get_detail, write, chunk_size=1)
+
+    @staticmethod
+    async def test_resume():
+        ibd = IllustBookmarkDatabase('test', ':memory:')
+        ibd.connect()
+        await ibd.set_bookmark(illust_detail1.iid, [0])
+        await ibd.set_bookmark(illust_detail2.iid, [0])
+
+        async def get_detail2_only(iid):
+            if iid == illust_detail2.iid:
+                return illust_detail2
+            raise RuntimeError()
+
+        num, failed = await ibd.update_detail(get_detail2_only, chunk_size=1)
+        ibd.rollback()
+
+        assert (num, failed) == (1, [illust_detail1.iid])
+        assert ibd.illusts_te.has(illust_detail2.iid)
+        assert ibd.stale_detail_iids() == [illust_detail1.iid]
+
+        num, failed = await ibd.update_detail(get_detail)
+
+        assert (num, failed) == (1, [])
+        assert ibd.stale_detail_iids() == []
+        ibd.close()
+
+
+def test_stale_detail_iids():
+    ibd = IllustBookmarkDatabase('test', ':memory:')
+    ibd.connect()
+    ibd.bookmarks_te.insert([
+        IllustBookmark(illust_detail1.iid, [0], 0),
+        IllustBookmark(illust_detail2.iid, [0], 0),
+        IllustBookmark(1, [0], 0)
+    ])
+    ibd.illusts_te.insert([illust_detail1, illust_detail2])
+    ibd.db_con.execute(
+        'UPDATE illusts SET fetched_at=fetched_at-1000 WHERE iid=?', (illust_detail1.iid, ))
+
+    assert ibd.stale_detail_iids() == [1]
+    assert ibd.stale_detail_iids(500) == sorted([1, illust_detail1.iid])
+    assert ibd.stale_detail_iids(0) == sorted([1, illust_detail1.iid, illust_detail2.iid])
+
+    plan = ' '.join(str(r) for r in ibd.db_con.execute(
+        'EXPLAIN QUERY PLAN SELECT b.iid FROM bookmarks b '
+        'LEFT JOIN illusts i ON i.iid=b.iid WHERE i.iid IS NULL'))
+    assert 'SEARCH i' in plan
+    ibd.close()
+
+
+def make_merge_dbs(tmp_path):
+    src = IllustBookmarkDatabase('src', tmp_path / 'src.db')
+    src.connect()
+    src.bookmarks_te.insert([
+        IllustBookmark(illust_detail1.iid, [0, 1], 10),
+        IllustBookmark(illust_detail2.iid, [0], 10)
+    ])
+    src.illusts_te.insert([illust_detail1, illust_detail2])
+    src.commit()
+    src.close()
+
+    dst = IllustBookmarkDatabase('dst', tmp_path / 'dst.db')
+    dst.connect()
+    dst.bookmarks_te.insert([IllustBookmark(illust_detail1.iid, [2], 5)])
+    dst.commit()
+    return dst
+
+
+@pytest.mark.parametrize('pages, num_bookmarks, expected', [
+    ('source', 2, IllustBookmark(illust_detail1.iid, [0, 1], 10)),
+    # 冲突的行被跳过，不计入复制的数量
+    ('target', 1, IllustBookmark(illust_detail1.iid, [2], 5)),
+    ('union', 2, IllustBookmark(illust_detail1.iid, [0, 1, 2], 5))
+])
+def test_merge_from(tmp_path, pages, num_bookmarks, expected):
+    dst = make_merge_dbs(tmp_path)
+
+    assert dst.merge_from(tmp_path / 'src.db', pages=pages) == (2, num_bookmarks)
+    assert dst.bookmarks_te.select(expected.iid)[0] == expected
+    assert dst.bookmarks_te.count() == 2
+    assert dst.illusts_te.select(illust_detail2.iid)[0] == illust_detail2
+    assert [r[1] for r in dst.db_con.execute('PRAGMA database_list')] == ['main']
+    dst.close()
+
+
+def test_merge_from_iids(tmp_path):
+    dst = make_merge_dbs(tmp_path)
+
+    assert dst.merge_from(tmp_path / 'src.db', [illust_detail2.iid]) == (1, 1)
+    assert dst.bookmarks_te.select(illust_detail1.iid)[0].pages == [2]
+    assert not dst.illusts_te.has(illust_detail1.iid)
+    dst.close()
+
+
 @pytest.mark.asyncio
 @pytest.mark.usefixtures('init_with_detail')
 class TestQuery:
@@ -150,6 +290,19 @@ class TestQuery:
 
         assert ret == None
 
+    @staticmethod
+    async def test_bookmarks_page(ibd):
+        first, after = ibd.bookmarks_page(limit=1)
+        assert len(first) == 1 and after is not None
+
+        second, after = ibd.bookmarks_page(after, limit=1)
+        assert len(second) == 1
+        assert {first[0].iid, second[0].iid} == {illust_detail1.iid, illust_detail2.iid}
+        assert first[0].add_timestamp >= second[0].add_timestamp
+
+        rest, after = ibd.bookmarks_page(after, limit=1)
+        assert rest == [] and after is None
+
 
 def get_user_illusts(uid):
     if uid != 123:
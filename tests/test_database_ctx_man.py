@@ -0,0 +1,130 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from wahu_backend.illust_bookmarking import IllustBookmark, IllustBookmarkDatabase
+from wahu_backend.sqlite_tools.database_ctx_man import DatabaseContextManager
+
+
+@pytest.fixture
+def ibd_dcm(tmp_path):
+    return DatabaseContextManager(
+        IllustBookmarkDatabase('test', tmp_path / 'test.db'),
+        idle_timeout=0.05
+    )
+
+
+@pytest.mark.asyncio
+class TestConnection:
+
+    @staticmethod
+    async def test_connection_kept(ibd_dcm):
+        with await ibd_dcm() as ibd:
+            con = ibd.db_con
+
+        with await ibd_dcm() as ibd:
+            assert ibd.db_con is con
+
+        with await ibd_dcm(readonly=True) as ibd:
+            reader_con = ibd.db_con
+
+        with await ibd_dcm(readonly=True) as ibd:
+            assert ibd.db_con is reader_con
+
+        await ibd_dcm.close()
+
+    @staticmethod
+    async def test_idle_close(ibd_dcm):
+        with await ibd_dcm(readonly=True) as ibd:
+            pass
+
+        assert ibd_dcm.connected
+        await asyncio.sleep(0.1)
+        assert not ibd_dcm.connected
+
+    @staticmethod
+    async def test_readonly_refuse_write(ibd_dcm):
+        with pytest.raises(sqlite3.OperationalError):
+            with await ibd_dcm(readonly=True) as ibd:
+                assert ibd.config.name == 'test'
+                ibd.bookmarks_te.insert([IllustBookmark(1, [0], 0)])
+
+        await ibd_dcm.close()
+
+
+@pytest.mark.asyncio
+async def test_readers_alongside_writer(ibd_dcm):
+    writer_holding = asyncio.Event()
+    writer_release = asyncio.Event()
+
+    async def writer():
+        with await ibd_dcm() as ibd:
+            ibd.bookmarks_te.insert([IllustBookmark(1, [0], 0)])
+            writer_holding.set()
+            await writer_release.wait()
+
+    async def reader() -> bool:
+        with await ibd_dcm(readonly=True) as ibd:
+            return ibd.bookmarks_te.has(1)
+
+    writer_task = asyncio.create_task(writer())
+    await writer_holding.wait()
+
+    # 写入者持有数据库时，只读者不需等待，且看不到未提交的内容
+    results = await asyncio.wait_for(
+        asyncio.gather(*(reader() for _ in range(5))), timeout=1)
+    assert results == [False] * 5
+
+    writer_release.set()
+    await writer_task
+
+    assert await reader()
+
+    await ibd_dcm.close()
+
+
+@pytest.mark.asyncio
+class TestRun:
+
+    @staticmethod
+    async def test_run_write_read(ibd_dcm):
+        await ibd_dcm.run(
+            lambda ibd: ibd.bookmarks_te.insert([IllustBookmark(1, [0], 0)]))
+
+        bm = await ibd_dcm.run(lambda ibd: ibd.query_bookmark(1), readonly=True)
+        assert bm.pages == [0]
+
+        await ibd_dcm.close()
+
+    @staticmethod
+    async def test_run_off_loop(ibd_dcm):
+        main_thread = threading.get_ident()
+
+        threads = await asyncio.gather(
+            ibd_dcm.run(lambda ibd: threading.get_ident()),
+            ibd_dcm.run(lambda ibd: threading.get_ident(), readonly=True)
+        )
+        assert main_thread not in threads
+
+        await ibd_dcm.close()
+
+    @staticmethod
+    async def test_loop_not_blocked(ibd_dcm):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        tsk = asyncio.create_task(ticker())
+        await ibd_dcm.run(lambda ibd: time.sleep(0.2), readonly=True)
+        tsk.cancel()
+
+        assert ticks > 5
+
+        await ibd_dcm.close()
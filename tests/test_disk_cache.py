@@ -0,0 +1,152 @@
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from wahu_backend.pixiv_image import PixivImagePool
+from wahu_backend.pixiv_image.disk_cache import DiskImageCache
+
+IMAGE = bytes(range(256)) * 40
+
+
+class LocalImagePool(PixivImagePool):
+    scheme = 'http'
+
+
+def test_eviction(tmp_path):
+    cache = DiskImageCache(tmp_path, 10)
+    cache.put('img/a.jpg', b'aaaa')
+    cache.put('img/b.jpg', b'bbbb')
+
+    # 命中的 a 变为最近访问，淘汰的是 b
+    assert cache.get('img/a.jpg') == b'aaaa'
+    cache.put('img/c.jpg', b'cccc')
+
+    assert list(cache.keys()) == ['img/a.jpg', 'img/c.jpg']
+    assert not cache.path_of('img/b.jpg').exists()
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 0, 1)
+
+    # 超过预算的不缓存
+    cache.put('img/d.jpg', b'd' * 11)
+    assert 'img/d.jpg' not in cache
+    assert cache.used == 8
+    cache.close()
+
+
+def test_persistence(tmp_path):
+    cache = DiskImageCache(tmp_path, 100)
+    cache.put('img/a.jpg', b'a' * 40)
+    cache.put('img/b.png', b'b' * 40)
+    cache.get('img/a.jpg')
+    cache.close()
+
+    # 重新打开后保留内容和访问顺序
+    cache = DiskImageCache(tmp_path, 100)
+    assert list(cache.keys()) == ['img/b.png', 'img/a.jpg']
+    assert cache.used == 80
+    assert cache.path_of('img/b.png').suffix == '.png'
+    assert cache.get('img/b.png') == b'b' * 40
+    cache.close()
+
+    # 预算变小时，打开时淘汰
+    cache = DiskImageCache(tmp_path, 50)
+    assert list(cache.keys()) == ['img/b.png']
+    cache.close()
+
+
+def test_missing_file(tmp_path):
+    cache = DiskImageCache(tmp_path, 100)
+    cache.put('img/a.jpg', b'aaaa')
+    cache.path_of('img/a.jpg').unlink()
+
+    assert cache.get('img/a.jpg') is None
+    assert 'img/a.jpg' not in cache and cache.used == 0
+    cache.close()
+
+
+def test_deferred_atime(tmp_path, monkeypatch):
+    cache = DiskImageCache(tmp_path, 100)
+    cache.put('img/a.jpg', b'a' * 10)
+    cache.put('img/b.jpg', b'b' * 10)
+
+    # 命中不写入索引
+    changes = cache._con.total_changes
+    cache.get('img/a.jpg')
+    assert cache._con.total_changes == changes
+
+    # 积攒够了一并写入
+    monkeypatch.setattr('wahu_backend.pixiv_image.disk_cache.ATIME_FLUSH_SIZE', 2)
+    cache.get('img/b.jpg')
+    cache.get('img/a.jpg')
+    assert cache._con.total_changes == changes + 2
+    cache.close()
+
+    cache = DiskImageCache(tmp_path, 100)
+    assert list(cache.keys()) == ['img/b.jpg', 'img/a.jpg']
+    cache.close()
+
+
+def test_clean_on_open(tmp_path):
+    cache = DiskImageCache(tmp_path, 100)
+    cache.put('img/a.jpg', b'aaaa')
+    cache.put('img/b.jpg', b'bbbb')
+    cache.close()
+
+    path_a = cache.path_of('img/a.jpg')
+    part = path_a.with_name(path_a.name + '.part')
+    part.write_bytes(b'aa')
+    orphan = path_a.with_name('0' * 40 + '.jpg')
+    orphan.write_bytes(b'orphan')
+    cache.path_of('img/b.jpg').unlink()
+
+    cache = DiskImageCache(tmp_path, 100)
+    assert not part.exists() and not orphan.exists()
+    assert list(cache.keys()) == ['img/a.jpg'] and cache.used == 4
+    assert cache.get('img/a.jpg') == b'aaaa'
+    assert (tmp_path / 'index.db').exists()
+    cache.close()
+
+
+@pytest_asyncio.fixture
+async def server():
+    requests = []
+
+    async def image(req: web.Request) -> web.Response:
+        requests.append(req.match_info['name'])
+        return web.Response(body=IMAGE, content_type='image/jpeg')
+
+    app = web.Application()
+    app.add_routes([web.get('/img/{name}', image)])
+
+    server = TestServer(app, host='127.0.0.1')
+    await server.start_server()
+    server.requests = requests
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_lookup_order(server, tmp_path):
+    def make_pool():
+        return LocalImagePool(
+            host=f'127.0.0.1:{server.port}',
+            disk_cache=DiskImageCache(tmp_path, 2 ** 20)
+        )
+
+    pool = make_pool()
+    assert await pool.get_image('img/a.jpg') == IMAGE
+    assert await pool.get_image('img/a.jpg') == IMAGE
+    assert server.requests == ['a.jpg']
+    assert (pool.thumbnails.hits, pool.disk_cache.hits) == (1, 0)
+    await pool.close_session()
+
+    # 新的图片池内存缓存为空，从磁盘读取后放入内存
+    pool = make_pool()
+    assert await pool.get_image('img/a.jpg') == IMAGE
+    assert pool.disk_cache.hits == 1 and 'img/a.jpg' in pool.thumbnails
+    assert server.requests == ['a.jpg']
+
+    await pool.download_to('img/a.jpg', tmp_path / 'a.jpg')
+    assert (tmp_path / 'a.jpg').read_bytes() == IMAGE
+    assert server.requests == ['a.jpg']
+    await pool.close_session()
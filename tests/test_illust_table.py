@@ -0,0 +1,254 @@
+import dataclasses
+import random
+import sqlite3
+
+import pytest
+from wahu_backend.aiopixivpy.datastructure_illust import (IllustDetail,
+                                                          IllustTag,
+                                                          PixivUserSummery)
+from wahu_backend.illust_bookmarking.illust_table import FTS_TABLE, IllustTableEditor
+from wahu_backend.sqlite_tools import SqliteTableEditor
+
+
+def make_illusts(illust_detail: IllustDetail) -> list[IllustDetail]:
+    user_a = PixivUserSummery('a', 1, False, 'A', '')
+    user_b = PixivUserSummery('b', 2, False, 'B', '')
+    tag_x = IllustTag('x', 'X')
+    tag_y = IllustTag('y', None)  # type: ignore
+
+    return [
+        dataclasses.replace(illust_detail, iid=1, user=user_a, tags=[tag_x, tag_y]),
+        dataclasses.replace(illust_detail, iid=2, user=user_a, tags=[tag_x]),
+        dataclasses.replace(illust_detail, iid=3, user=user_b, tags=[tag_x, tag_x]),
+    ]
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(':memory:')
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def editor(con):
+    te = IllustTableEditor()
+    te.bind(con.cursor())
+    te.create_if_not()
+    return te
+
+
+class TestSync:
+    @staticmethod
+    def test_insert(editor, illust_detail):
+        editor.insert(make_illusts(illust_detail))
+
+        assert editor.tag_count() == [(IllustTag('x', 'X'), 3), (IllustTag('y', None), 1)]
+        assert sorted(editor.iids_of_user(1)) == [1, 2]
+        assert editor.iids_of_user(3) == []
+
+    @staticmethod
+    def test_reinsert_replaces_tags(editor, illust_detail):
+        illusts = make_illusts(illust_detail)
+        editor.insert(illusts)
+        editor.insert([dataclasses.replace(illusts[0], tags=[])])
+
+        assert editor.tag_count() == [(IllustTag('x', 'X'), 2)]
+
+    @staticmethod
+    def test_delete(editor, illust_detail):
+        editor.insert(make_illusts(illust_detail))
+
+        editor.delete([1, 3])
+        assert editor.tag_count() == [(IllustTag('x', 'X'), 1)]
+
+        editor.delete()
+        assert editor.tag_count() == []
+
+    @staticmethod
+    def test_user_count(editor, illust_detail):
+        editor.insert(make_illusts(illust_detail))
+
+        ret = editor.user_count(1)
+        assert [(u.uid, n) for u, n in ret] == [(1, 2)]
+
+    @staticmethod
+    def test_select_ignores_user_uid(editor, illust_detail):
+        illusts = make_illusts(illust_detail)
+        editor.insert(illusts)
+
+        assert editor.select(1) == [illusts[0]]
+
+
+def test_migrate_old_table(con, illust_detail):
+    old = SqliteTableEditor('illusts', IllustDetail)
+    old.bind(con.cursor())
+    old.create()
+    old.insert(make_illusts(illust_detail))
+
+    te = IllustTableEditor()
+    te.bind(con.cursor())
+    te.create_if_not()
+
+    assert te.tag_count()[0] == (IllustTag('x', 'X'), 3)
+    assert sorted(te.iids_of_user(1)) == [1, 2]
+
+    plan = ' '.join(str(r) for r in con.execute(
+        'EXPLAIN QUERY PLAN SELECT iid FROM illusts WHERE user_uid=1'))
+    assert 'illusts_user_uid' in plan
+
+    assert con.execute('SELECT fetched_at FROM illusts').fetchall() == [(None, )] * 3
+    te.insert(make_illusts(illust_detail)[:1])
+    assert con.execute('SELECT fetched_at FROM illusts WHERE iid=1').fetchone()[0] is not None
+
+
+def test_copy_from(con, illust_detail, tmp_path):
+    illusts = make_illusts(illust_detail)
+
+    src_con = sqlite3.connect(tmp_path / 'src.db')
+    src = IllustTableEditor()
+    src.bind(src_con.cursor())
+    src.create()
+    src.insert(illusts)
+    src_con.commit()
+    src_con.close()
+
+    con.execute('ATTACH DATABASE ? AS src', (str(tmp_path / 'src.db'), ))
+
+    # 用 Python 写入的表作为对照
+    expected = IllustTableEditor()
+    expected.bind(con.cursor())
+    expected.create()
+    expected.insert(illusts)
+    tables = ['illust_tags', 'tags', FTS_TABLE]
+    expected_rows = [sorted(con.execute(f'SELECT * FROM {t}').fetchall()) for t in tables]
+    expected.delete()
+    con.execute('DELETE FROM tags')
+
+    te = IllustTableEditor()
+    te.bind(con.cursor())
+    assert te.copy_from('src', [1, 3]) == 2
+    assert sorted(r.iid for r in te.select()) == [1, 3]
+    assert te.copy_from('src') == 3
+
+    assert te.select() == illusts
+    assert [sorted(con.execute(f'SELECT * FROM {t}').fetchall()) for t in tables] == expected_rows
+    assert None not in {r[0] for r in con.execute('SELECT fetched_at FROM illusts')}
+
+
+class TestFulltext:
+    @staticmethod
+    def test_usable():
+        from wahu_backend.illust_bookmarking.illust_table import fts_usable
+
+        assert not fts_usable('ab', 100)
+        assert not fts_usable('ab-cd-ef', 100)
+        # 分数线 80 时，不含共同 trigram 的片段也可能达到分数线，例如 'cdc' 与 'cd-'
+        assert not fts_usable('abcdefghijkl', 80)
+        assert not fts_usable('abcd', 90)
+        assert fts_usable('abcde', 90)
+        assert fts_usable('ABC', 100)
+
+    @staticmethod
+    def test_candidates(editor, illust_detail):
+        illusts = make_illusts(illust_detail)
+        illusts[0].title = 'Kotori Minami'
+        illusts[1].title = 'Umi Sonoda'
+        illusts[2].title = 'kotori again'
+        editor.insert(illusts)
+
+        ret = editor.fts_candidates('title', 'kotori', 90)
+        assert sorted(iid for iid, _ in ret) == [1, 3]
+
+        editor.delete([3])
+        ret = editor.fts_candidates('title', 'kotori', 90)
+        assert ret == [(1, 'Kotori Minami')]
+
+        assert editor.fts_candidates('title', 'ko', 90) is None
+
+    @staticmethod
+    def test_disabled(con, illust_detail):
+        from wahu_backend.illust_bookmarking import illust_table
+
+        illust_table.set_fulltext_index(False)
+        try:
+            te = IllustTableEditor()
+            te.bind(con.cursor())
+            te.create_if_not()
+            te.insert(make_illusts(illust_detail))
+
+            assert not te.has_fts()
+            assert te.fts_candidates('title', 'kotori', 90) is None
+        finally:
+            illust_table.set_fulltext_index(True)
+
+        # 重新开启后，从已有的详情建立全文索引
+        te.create_if_not()
+        assert te.has_fts()
+        assert con.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}').fetchone()[0] == 3
+
+
+def test_query_compatible(illust_detail):
+    from wahu_backend.illust_bookmarking import IllustBookmarkDatabase, illust_table
+
+    words = ['kotori', 'minami', 'sonoda', 'umi', 'honoka', 'kousaka', 'eli']
+    illusts = [
+        dataclasses.replace(
+            illust_detail, iid=i,
+            title=' '.join(words[(i * k) % len(words)] for k in range(1, 4)) + str(i))
+        for i in range(1, 60)
+    ]
+
+    results = []
+    for enabled in (True, False):
+        illust_table.set_fulltext_index(enabled)
+        try:
+            ibd = IllustBookmarkDatabase('test', ':memory:')
+            ibd.connect()
+            ibd.illusts_te.insert(illusts)
+            assert ibd.illusts_te.has_fts() == enabled
+
+            results.append([ibd.query_title(kw, cutoff) for kw, cutoff in
+                            (('kotori', 80), ('kotoru', 80), ('sonoda', 90), ('kousaka', 75))])
+            ibd.close()
+        finally:
+            illust_table.set_fulltext_index(True)
+
+    assert results[0] == results[1]
+
+
+def test_query_same_as_scan(illust_detail):
+    """随机生成标题和关键词，比较使用全文索引与遍历全表的查询结果"""
+
+    from wahu_backend.illust_bookmarking import IllustBookmarkDatabase, illust_table
+
+    rand = random.Random(0)
+    illusts = [
+        dataclasses.replace(
+            illust_detail, iid=i,
+            title=''.join(rand.choice('abcdC- ') for _ in range(rand.randint(1, 14))))
+        for i in range(1, 120)
+    ] + [
+        dataclasses.replace(illust_detail, iid=120 + i, title=title)
+        for i, title in enumerate(['cd-', 'ca-cdaa-', '-adad add'])
+    ]
+    queries = [
+        (''.join(rand.choice('abcdC') for _ in range(rand.randint(3, 9))),
+         rand.choice([80, 85, 90, 95, 100]))
+        for _ in range(80)
+    ] + [('cdc', 80), ('cacdba', 80), ('adbacd', 80)]
+
+    results = []
+    for enabled in (True, False):
+        illust_table.set_fulltext_index(enabled)
+        try:
+            ibd = IllustBookmarkDatabase('test', ':memory:')
+            ibd.connect()
+            ibd.illusts_te.insert(illusts)
+            results.append([ibd.query_title(kw, cutoff) for kw, cutoff in queries])
+            ibd.close()
+        finally:
+            illust_table.set_fulltext_index(True)
+
+    assert any(illust_table.fts_usable(kw, cutoff) for kw, cutoff in queries)
+    assert results[0] == results[1]
@@ -0,0 +1,251 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from wahu_backend.pixiv_image import PixivImagePool
+from wahu_backend.pixiv_image.image_getter import PixivImageGetError
+
+IMAGE = bytes(range(256)) * 400
+
+
+class LocalImagePool(PixivImagePool):
+    scheme = 'http'
+
+
+# 每个响应最多发送这么多字节后断开
+FLAKY_LIMIT = 30000
+
+
+def parse_range(req: web.Request) -> tuple[int, int]:
+    a, _, b = req.headers.get('Range', 'bytes=0-').removeprefix('bytes=').partition('-')
+    return int(a), len(IMAGE) if b == '' else int(b) + 1
+
+
+@pytest_asyncio.fixture
+async def server():
+    requests = []
+
+    async def image(req: web.Request) -> web.StreamResponse:
+        name = req.match_info['name']
+
+        if name in ('ranged.jpg', 'flaky.jpg'):
+            start, end = parse_range(req)
+            requests.append((name, start, end))
+
+            if start >= len(IMAGE):
+                raise web.HTTPRequestRangeNotSatisfiable()
+
+            resp = web.StreamResponse(status=206, headers={
+                'Content-Length': str(end - start),
+                'Content-Range': f'bytes {start}-{end - 1}/{len(IMAGE)}'
+            })
+            await resp.prepare(req)
+
+            if name == 'flaky.jpg' and end - start > FLAKY_LIMIT:
+                await resp.write(IMAGE[start:start + FLAKY_LIMIT])
+                req.transport.close()
+            else:
+                await resp.write(IMAGE[start:end])
+            return resp
+
+        requests.append(name)
+
+        if name == 'broken.jpg':
+            resp = web.StreamResponse(headers={'Content-Length': str(len(IMAGE))})
+            await resp.prepare(req)
+            await resp.write(IMAGE[:1000])
+            # 在发送完之前断开
+            req.transport.close()
+            return resp
+
+        if name == 'missing.jpg':
+            raise web.HTTPNotFound()
+
+        # 不支持 Range
+        return web.Response(body=IMAGE, content_type='image/jpeg')
+
+    app = web.Application()
+    app.add_routes([web.get('/img/{name}', image)])
+
+    server = TestServer(app, host='127.0.0.1')
+    await server.start_server()
+    server.requests = requests
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def pool(server):
+    pool = LocalImagePool(host=f'127.0.0.1:{server.port}', chunk=1000, backoff=0)
+    yield pool
+    await pool.close_session()
+
+
+@pytest.mark.asyncio
+class TestDownload:
+
+    @staticmethod
+    async def test_get_image(pool):
+        assert await pool.get_image('img/a.jpg') == IMAGE
+
+        st, = pool.dl_stats
+        assert (st.status, st.total_size, st.downloaded_size) == ('finished', len(IMAGE), len(IMAGE))
+
+    @staticmethod
+    async def test_download_to(pool, tmp_path):
+        target = tmp_path / 'a.jpg'
+        await pool.download_to('img/a.jpg', target)
+
+        assert target.read_bytes() == IMAGE
+        assert list(tmp_path.iterdir()) == [target]
+        assert 'img/a.jpg' not in pool.thumbnails
+
+        # 已缓存的图片直接写入
+        await pool.get_image('img/b.jpg')
+        await pool.download_to('img/b.jpg', tmp_path / 'b.jpg')
+        assert (tmp_path / 'b.jpg').read_bytes() == IMAGE
+        assert len(pool.dl_stats) == 2
+
+    @staticmethod
+    async def test_concurrent(pool, server, tmp_path):
+        rets = await asyncio.gather(
+            *(pool.get_image('img/a.jpg') for _ in range(4)),
+            pool.download_to('img/a.jpg', tmp_path / 'a.jpg')
+        )
+
+        assert rets[:4] == [IMAGE] * 4
+        assert (tmp_path / 'a.jpg').read_bytes() == IMAGE
+        assert server.requests == ['a.jpg']
+        assert len(pool.dl_stats) == 1 and len(pool.flights) == 0
+
+    @staticmethod
+    async def test_concurrent_download_to(pool, server, tmp_path):
+        target = tmp_path / 'c.jpg'
+        await asyncio.gather(*(pool.download_to('img/c.jpg', target) for _ in range(3)))
+
+        assert target.read_bytes() == IMAGE
+        assert server.requests == ['c.jpg']
+        assert len(pool.download_flights) == 0
+
+    @staticmethod
+    async def test_exclusive_part(pool, server, tmp_path, monkeypatch):
+        active: list[str] = []
+        overlaps = []
+        download = pool._download
+
+        async def tracked(file_path, sink, st):
+            active.append(file_path)
+            overlaps.append(len(active))
+            try:
+                await asyncio.sleep(0.01)
+                await download(file_path, sink, st)
+            finally:
+                active.remove(file_path)
+
+        monkeypatch.setattr(pool, '_download', tracked)
+
+        # 不同的图片下载到同一个文件时依次进行，不会同时写入临时文件
+        target = tmp_path / 'a.jpg'
+        part = target.with_name('a.jpg.part')
+        part.write_bytes(IMAGE[:5000])
+        await asyncio.gather(
+            pool.download_to('img/ranged.jpg', target),
+            pool.download_to('img/c.jpg', target)
+        )
+
+        assert overlaps == [1, 1]
+        assert target.read_bytes() == IMAGE and not part.exists()
+        assert server.requests == [('ranged.jpg', 5000, len(IMAGE)), 'c.jpg']
+        assert len(pool.part_locks) == 0
+
+    @staticmethod
+    async def test_failed(pool, server, tmp_path):
+        with pytest.raises(PixivImageGetError):
+            await pool.download_to('img/broken.jpg', tmp_path / 'broken.jpg')
+
+        # 重试过，临时文件保留下来以便续传
+        assert server.requests == ['broken.jpg'] * 4
+        assert [p.name for p in tmp_path.iterdir()] == ['broken.jpg.part']
+        st, = pool.dl_stats
+        assert (st.status, st.retries) == ('error', 3)
+
+    @staticmethod
+    async def test_missing(pool, server, tmp_path):
+        with pytest.raises(PixivImageGetError) as exc_info:
+            await pool.download_to('img/missing.jpg', tmp_path / 'missing.jpg')
+
+        # 4xx 不重试，也不保留临时文件
+        assert exc_info.value.status == 404
+        assert server.requests == ['missing.jpg']
+        assert list(tmp_path.iterdir()) == []
+
+    @staticmethod
+    async def test_resume_after_break(pool, server, tmp_path):
+        target = tmp_path / 'flaky.jpg'
+        await pool.download_to('img/flaky.jpg', target)
+
+        assert target.read_bytes() == IMAGE
+        assert [r[1] for r in server.requests] == [0, 30000, 60000, 90000]
+
+        st, = pool.dl_stats
+        assert (st.retries, st.resumed_size, st.downloaded_size) == (3, 0, len(IMAGE))
+
+        assert await pool.get_image('img/flaky.jpg') == IMAGE
+
+    @staticmethod
+    async def test_resume_part(pool, server, tmp_path):
+        target = tmp_path / 'ranged.jpg'
+        (tmp_path / 'ranged.jpg.part').write_bytes(IMAGE[:5000])
+
+        await pool.download_to('img/ranged.jpg', target)
+
+        assert target.read_bytes() == IMAGE
+        assert server.requests == [('ranged.jpg', 5000, len(IMAGE))]
+        st, = pool.dl_stats
+        assert (st.resumed_size, st.downloaded_size, st.retries) == (5000, len(IMAGE), 0)
+
+    @staticmethod
+    @pytest.mark.parametrize('name, part', [
+        # 服务器不支持 Range
+        ('a.jpg', b'x' * 5000),
+        # 临时文件已经完整，服务器返回 416
+        ('ranged.jpg', IMAGE),
+    ])
+    async def test_restart(pool, tmp_path, name, part):
+        target = tmp_path / name
+        (tmp_path / f'{name}.part').write_bytes(part)
+
+        await pool.download_to(f'img/{name}', target)
+
+        assert target.read_bytes() == IMAGE
+        assert list(tmp_path.iterdir()) == [target]
+        st, = pool.dl_stats
+        assert st.resumed_size == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name, starts', [
+    ('ranged.jpg', [0, 51200]),
+    # 每段中断一次，从中断处重试
+    ('flaky.jpg', [0, 30000, 51200, 81200]),
+])
+async def test_segmented(server, tmp_path, name, starts):
+    pool = LocalImagePool(
+        host=f'127.0.0.1:{server.port}', chunk=1000, backoff=0,
+        segment_threshold=50000, segments=2)
+
+    assert await pool.get_image(f'img/{name}') == IMAGE
+
+    target = tmp_path / name
+    await pool.download_to(f'img/{name}', target)
+    assert target.read_bytes() == IMAGE
+
+    # 第一个请求只读取响应头，之后两段并行
+    assert sorted({r[1] for r in server.requests}) == starts
+    assert {r[2] for r in server.requests} == {len(IMAGE), 51200}
+    assert all(st.downloaded_size == len(IMAGE) for st in pool.dl_stats)
+
+    await pool.close_session()
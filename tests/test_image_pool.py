@@ -0,0 +1,56 @@
+from wahu_backend.pixiv_image import PixivImagePool
+from wahu_backend.pixiv_image.byte_lru import ByteLRU
+
+
+def test_lru_promotion():
+    lru = ByteLRU(10)
+    lru.put('a', b'aaaa')
+    lru.put('b', b'bbbb')
+
+    # 命中的 a 变为最近使用，淘汰的是 b
+    assert lru.get('a') == b'aaaa'
+    lru.put('c', b'cccc')
+
+    assert list(lru.keys()) == ['a', 'c']
+    assert lru.used == 8
+    assert (lru.hits, lru.misses, lru.evictions) == (1, 0, 1)
+
+    assert lru.get('b') is None
+    assert lru.misses == 1
+
+
+def test_lru_budget():
+    lru = ByteLRU(10)
+    lru.put('a', b'a' * 3)
+    lru.put('b', b'b' * 3)
+    lru.put('c', b'c' * 3)
+
+    # 大的值会淘汰多个
+    lru.put('d', b'd' * 8)
+    assert list(lru.keys()) == ['d']
+    assert lru.evictions == 3
+
+    # 超过预算的不缓存
+    lru.put('e', b'e' * 11)
+    assert 'e' not in lru
+    assert lru.used == 8
+
+    # 覆盖同一个键
+    lru.put('d', b'd')
+    assert lru.used == 1 and len(lru) == 1
+
+
+def test_pool_tiers():
+    pool = PixivImagePool(thumbnail_budget=100, original_budget=1000)
+
+    original = 'img-original/img/2017/06/12/00/36/32/63343772_p0.png'
+    thumbnail = 'c/360x360_70/img-master/img/2017/06/12/00/36/32/63343772_p0_square1200.jpg'
+
+    assert pool.tier(original) is pool.originals
+    assert pool.tier(thumbnail) is pool.thumbnails
+
+    pool.tier(original).put(original, b'x' * 500)
+    assert original in pool.originals and pool.thumbnails.used == 0
+
+    pool.clear()
+    assert pool.originals.used == 0
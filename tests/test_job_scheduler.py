@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from wahu_backend.wahu_core.core_exceptions import WahuRuntimeError
+from wahu_backend.wahu_core.job_scheduler import JobScheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.running: set[str] = set()
+        self.overlaps: list[set[str]] = []
+        self.max_running = 0
+
+    def job(self, name: str, duration: float = 0.02, fail: bool = False):
+        async def f():
+            self.running.add(name)
+            self.max_running = max(self.max_running, len(self.running))
+            if len(self.running) > 1:
+                self.overlaps.append(set(self.running))
+            await asyncio.sleep(duration)
+            self.running.discard(name)
+            if fail:
+                raise RuntimeError('失败')
+        return f
+
+
+@pytest.mark.asyncio
+class TestJobScheduler:
+
+    @staticmethod
+    async def test_concurrency_and_resources():
+        rec = Recorder()
+        js = JobScheduler(concurrency=2, jitter=0, startup_delay=0)
+
+        js.add('a', 0.01, rec.job('a'), ['ibd:x'])
+        js.add('b', 0.01, rec.job('b'), ['ibd:x', 'ir:y'])
+        js.add('c', 0.01, rec.job('c'), ['ibd:z'])
+        js.add('d', 0.01, rec.job('d'))
+
+        js.start()
+        await asyncio.sleep(0.2)
+        await js.stop()
+
+        assert rec.max_running == 2
+        assert not any({'a', 'b'} <= o for o in rec.overlaps)
+        assert all(s.run_count > 0 for s in js.status())
+
+    @staticmethod
+    async def test_status():
+        rec = Recorder()
+        js = JobScheduler(jitter=0, startup_delay=0)
+        js.add('ok', 10, rec.job('ok', 0.05))
+        js.add('bad', 10, rec.job('bad', fail=True))
+
+        js.start()
+        await asyncio.sleep(0.1)
+        await js.stop()
+
+        ok, bad = js.status()
+        assert ok.run_count == 1 and ok.last_latency >= 0.05 and ok.last_error is None
+        assert ok.next_run is not None and not ok.running
+        assert bad.run_count == 1 and 'RuntimeError' in bad.last_error
+
+    @staticmethod
+    async def test_run_now():
+        rec = Recorder()
+        js = JobScheduler(jitter=0, startup_delay=100)
+        js.add('a', 100, rec.job('a', 0))
+
+        js.start()
+        await asyncio.sleep(0.01)
+        assert js.status()[0].run_count == 0
+
+        js.run_now('a')
+        await asyncio.sleep(0.01)
+        assert js.status()[0].run_count == 1
+        await js.stop()
+
+        with pytest.raises(WahuRuntimeError):
+            js.run_now('b')
+
+    @staticmethod
+    async def test_add_remove_after_start():
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        rec = Recorder()
+        js = JobScheduler(jitter=0, startup_delay=100)
+        js.start()
+
+        # 启动后添加的任务一个间隔后运行
+        js.add('a', 0.01, rec.job('a', 0))
+        js.add('b', 0.01, slow)
+        await asyncio.sleep(0.05)
+        a, b = js.status()
+        assert a.run_count > 0 and b.running
+
+        # 删除正在运行的任务会取消它，删除不存在的任务什么也不做
+        await js.remove('b')
+        await js.remove('c')
+        assert cancelled.is_set()
+        assert js.status() == [a]
+
+        await js.remove('a')
+        count = a.run_count
+        await asyncio.sleep(0.05)
+        assert js.status() == [] and a.run_count == count
+        await js.stop()
+
+    @staticmethod
+    async def test_cancel_waiting_for_lock():
+        rec = Recorder()
+        js = JobScheduler(concurrency=3, jitter=0, startup_delay=100)
+        js.add('busy', 100, rec.job('busy', 10), ['ir:y'])
+        js.add('sync', 100, rec.job('sync', 0), ['ibd:x', 'ir:y'])
+        js.add('update', 100, rec.job('update', 0), ['ibd:x'])
+        js.start()
+
+        js.run_now('busy')
+        await asyncio.sleep(0.01)
+        js.run_now('sync')
+        await asyncio.sleep(0.01)
+        assert js.jobs['busy'].status.running and not js.jobs['sync'].status.running
+
+        # `sync` 已经拿到 `ibd:x` ，在等待 `ir:y` 时被删除，需要释放 `ibd:x`
+        await js.remove('sync')
+        js.run_now('update')
+        await asyncio.sleep(0.01)
+        assert js.jobs['update'].status.run_count == 1
+        await js.stop()
+
+    @staticmethod
+    async def test_dynamic_resources():
+        rec = Recorder()
+        js = JobScheduler(concurrency=2, jitter=0, startup_delay=100)
+        linked = ['ibd:x']
+        js.add('sync', 100, rec.job('sync', 0.05), lambda: linked)
+        js.add('update', 100, rec.job('update', 0.05), ['ibd:z'])
+        js.start()
+
+        # 资源在每次运行前求得
+        linked.append('ibd:z')
+        js.run_now('sync')
+        js.run_now('update')
+        await asyncio.sleep(0.2)
+        assert rec.overlaps == []
+        await js.stop()
+
+
+
+def test_jitter():
+    js = JobScheduler(jitter=0.1)
+
+    delays = [js._delay(100) for _ in range(100)]
+    assert all(90 <= d <= 110 for d in delays)
+    assert len(set(delays)) > 1
@@ -0,0 +1,81 @@
+import dataclasses
+import io
+
+import pytest
+from pixiv_dict_examples import illust_dict1, illust_dict2
+
+from wahu_backend.aiopixivpy.datastructure_processing import process_pixiv_illust_dict
+from wahu_backend.illust_bookmarking.ndjson import (NdjsonDecoder, NdjsonError,
+                                                    dump_chunks, dump_ndjson,
+                                                    dump_page, illust_from_dict,
+                                                    load_ndjson, parse_line)
+
+illust_detail1 = process_pixiv_illust_dict(illust_dict1)
+illust_detail2 = process_pixiv_illust_dict(illust_dict2)
+
+
+
+def test_round_trip(ibd, make_ibd):
+    f = io.StringIO(''.join(dump_chunks(ibd, 3)))
+
+    target = make_ibd()
+    assert load_ndjson(target, f, batch_size=4) == (8, 10)
+
+    assert sorted(target.illusts_te.select(), key=lambda i: i.iid) == \
+        sorted(ibd.illusts_te.select(), key=lambda i: i.iid)
+    assert sorted(target.bookmarks_te.select(), key=lambda b: b.iid) == \
+        sorted(ibd.bookmarks_te.select(), key=lambda b: b.iid)
+
+
+def test_decoder_arbitrary_chunks(ibd):
+    text = ''.join(dump_ndjson(ibd))
+    decoder = NdjsonDecoder(batch_size=5)
+
+    batches = []
+    for begin in range(0, len(text), 37):
+        batches.extend(decoder.feed(text[begin:begin + 37]))
+    batches.append(decoder.finish())
+
+    assert all(len(i) + len(b) == 5 for i, b in batches[:-1])
+    assert sum(len(i) for i, _ in batches) == 8
+    assert sum(len(b) for _, b in batches) == 10
+    assert [i for illusts, _ in batches for i in illusts][-1] == illust_detail2
+
+
+def test_dump_page(ibd):
+    chunks = []
+    cursor = None
+    while True:
+        chunk, cursor = dump_page(ibd, cursor, 3)
+        chunks.append(chunk)
+        if cursor is None:
+            break
+
+    lines = ''.join(chunks).splitlines()
+    assert len(lines) == 18
+    assert [parse_line(line).iid for line in lines[:8]] == [1, 2, 3, 4, 5, 6, 7, illust_detail2.iid]
+
+
+def test_bad_line(ibd, make_ibd):
+    target = make_ibd()
+    text = ''.join(dump_chunks(ibd)) + '{"bookmark": {"iid": 1}}\n'
+
+    with pytest.raises(NdjsonError):
+        load_ndjson(target, [text], batch_size=10)
+
+    # 出错之前的批次已经提交
+    assert target.illusts_te.count() == 8
+    assert target.bookmarks_te.count() == 2
+
+
+def test_illust_from_dict():
+    d = dataclasses.asdict(illust_detail1)
+    assert illust_from_dict(d) == illust_detail1
+    assert isinstance(d['user'], dict)
+
+    # 旧版本导出的标签可能是 `[name, translated]`
+    d['tags'] = [[t.name, t.translated] for t in illust_detail1.tags]
+    assert illust_from_dict(d) == illust_detail1
+
+    with pytest.raises(KeyError):
+        illust_from_dict({'iid': 1})
@@ -0,0 +1,157 @@
+import dataclasses
+import random
+
+import pytest
+from wahu_backend.aiopixivpy.datastructure_illust import IllustTag
+from wahu_backend.illust_bookmarking import IllustBookmarkDatabase, ngram_index
+from wahu_backend.illust_bookmarking.ngram_index import (IndexChange,
+                                                         NgramIndex,
+                                                         min_shared_ngrams)
+
+WORDS = ['kotori', 'minami', 'sonoda', 'umi', 'honoka', 'kousaka', 'eli']
+
+
+def make_illusts(illust_detail, num=40):
+    return [
+        dataclasses.replace(
+            illust_detail, iid=i,
+            title=' '.join(WORDS[(i * k) % len(WORDS)] for k in range(1, 4)) + str(i),
+            tags=[IllustTag(WORDS[i % len(WORDS)], None)])  # type: ignore
+        for i in range(1, num)
+    ]
+
+
+@pytest.fixture
+def memory_index():
+    ngram_index.set_memory_index(True)
+    yield
+    ngram_index.set_memory_index(False)
+
+
+@pytest.fixture
+def ibd(memory_index):
+    ibd = IllustBookmarkDatabase('test', ':memory:')
+    ibd.connect()
+    yield ibd
+    ibd.close()
+
+
+def test_min_shared_ngrams():
+    assert min_shared_ngrams('kotori', 100) == 5
+    assert min_shared_ngrams('kotori', 80) == 1
+    # 'cdc' 与 'cd-' 只共有一个 bigram ，分数却是 80
+    assert min_shared_ngrams('cdc', 80) is None
+    assert min_shared_ngrams('KOTORI', 100) == 5
+    assert min_shared_ngrams('ko', 50) is None
+    assert min_shared_ngrams('ko-ri', 100) is None
+
+
+class TestNgramIndex:
+    @staticmethod
+    def test_candidates(illust_detail):
+        index = NgramIndex()
+        index.build(lambda: make_illusts(illust_detail))
+
+        ret = index.candidates('title', 'sonoda', 100)
+        assert ret != []
+        assert all('sonoda' in title for _, title in ret)
+
+    @staticmethod
+    def test_changes_during_build(illust_detail):
+        illusts = make_illusts(illust_detail)
+        index = NgramIndex()
+
+        def read_all():
+            # 模拟读取期间另一连接提交了修改
+            index.apply([IndexChange('remove', iids=(1, )),
+                         IndexChange('add', illusts=(dataclasses.replace(illusts[1], title='zzz'), ))])
+            return illusts
+
+        index.build(read_all)
+
+        assert index.size == len(illusts) - 1
+        assert [iid for iid, _ in index.candidates('title', 'zzz', 100)] == [2]
+
+    @staticmethod
+    def test_memory_usage(illust_detail):
+        index = NgramIndex()
+        empty = index.memory_usage()
+        index.build(lambda: make_illusts(illust_detail))
+
+        assert index.memory_usage() > empty
+
+
+class TestDatabase:
+    @staticmethod
+    def test_incremental(ibd, illust_detail):
+        illusts = make_illusts(illust_detail)
+        ibd.illusts_te.insert(illusts[:10])
+        ibd.commit()
+
+        assert ibd.query_title('kotori', 100) != []
+        assert ibd.ngram_index.built and ibd.ngram_index.size == 10
+
+        ibd.illusts_te.insert(illusts[10:])
+        assert ibd.ngram_index.size == 10  # 提交前不可见
+        ibd.commit()
+        assert ibd.ngram_index.size == len(illusts)
+
+        ibd.illusts_te.delete([1])
+        ibd.rollback()
+        assert ibd.ngram_index.size == len(illusts)
+
+        ibd.illusts_te.delete()
+        ibd.commit()
+        assert ibd.query_title('kotori', 100) == []
+
+    @staticmethod
+    def test_clone_shares_index(ibd):
+        assert ibd.clone().ngram_index is ibd.ngram_index
+
+    @staticmethod
+    @pytest.mark.parametrize('query, keyword, cutoff', [
+        ('query_title', 'kotori', 80),
+        ('query_title', 'kotoru', 80),
+        ('query_title', 'ho', 60),
+        ('query_title', 'ho', 50),
+        ('query_tag', 'minami', 90),
+        ('query_caption', 'umi', 50),
+    ])
+    def test_same_as_scan(ibd, illust_detail, query, keyword, cutoff):
+        ibd.illusts_te.insert(make_illusts(illust_detail))
+        ibd.commit()
+
+        with_index = getattr(ibd, query)(keyword, cutoff)
+        ngram_index.set_memory_index(False)
+        without_index = getattr(ibd, query)(keyword, cutoff)
+
+        assert with_index == without_index
+
+
+def test_random_same_as_scan(ibd, illust_detail):
+    """随机生成标题和关键词，比较使用内存索引与遍历全表的查询结果"""
+
+    rand = random.Random(0)
+    ibd.illusts_te.insert([
+        dataclasses.replace(
+            illust_detail, iid=i,
+            title=''.join(rand.choice('abcdC- ') for _ in range(rand.randint(1, 14))))
+        for i in range(1, 120)
+    ] + [
+        dataclasses.replace(illust_detail, iid=120 + i, title=title)
+        for i, title in enumerate(['cd-', 'ca-cdaa-', '-adad add'])
+    ])
+    ibd.commit()
+
+    queries = [
+        (''.join(rand.choice('abcdC') for _ in range(rand.randint(2, 9))),
+         rand.choice([60, 70, 80, 90, 100]))
+        for _ in range(80)
+    ] + [('cdc', 80), ('cacdba', 80), ('adbacd', 80)]
+    assert any(min_shared_ngrams(kw, cutoff) is not None for kw, cutoff in queries)
+
+    with_index = [ibd.query_title(kw, cutoff) for kw, cutoff in queries]
+    ngram_index.set_memory_index(False)
+    without_index = [ibd.query_title(kw, cutoff) for kw, cutoff in queries]
+
+    assert with_index == without_index
@@ -0,0 +1,79 @@
+import dataclasses
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from pixiv_dict_examples import illust_dict1
+
+from wahu_backend.aiopixivpy.datastructure_processing import process_pixiv_illust_dict
+from wahu_backend.illust_bookmarking import IllustBookmark, IllustBookmarkDatabase
+from wahu_backend.sqlite_tools.database_ctx_man import DatabaseContextManager
+from wahu_backend.wahu_core.core_exceptions import WahuRuntimeError
+from wahu_backend.wahu_methods import WahuMethods
+
+illust_detail = process_pixiv_illust_dict(illust_dict1)
+
+
+def make_dcm(tmp_path, name, titles):
+    ibd = IllustBookmarkDatabase(name, tmp_path / f'{name}.db')
+    ibd.connect()
+    ibd.illusts_te.insert([
+        dataclasses.replace(illust_detail, iid=iid, title=title) for iid, title in titles.items()
+    ])
+    ibd.bookmarks_te.insert([IllustBookmark(iid, [0], 0) for iid in titles.keys()])
+    ibd.commit()
+    ibd.close()
+
+    return DatabaseContextManager(IllustBookmarkDatabase(name, tmp_path / f'{name}.db'))
+
+
+@pytest_asyncio.fixture
+async def ctx(tmp_path):
+    ctx = SimpleNamespace(
+        ilst_bmdbs={
+            'a': make_dcm(tmp_path, 'a', {1: 'kud', 2: 'kudryavka', 3: 'rin'}),
+            'b': make_dcm(tmp_path, 'b', {1: 'kud', 4: 'kud birthday'}),
+        },
+        config=SimpleNamespace(default_fuzzy_cutoff=50)
+    )
+    yield ctx
+
+    for dcm in ctx.ilst_bmdbs.values():
+        await dcm.close()
+
+
+async def collect(gen):
+    return [ret async for ret in gen]
+
+
+@pytest.mark.asyncio
+class TestQueryMulti:
+
+    @staticmethod
+    async def test_top_k(ctx):
+        rets = await collect(await WahuMethods.ibd_query_multi(ctx, ['a', 'b'], 'kud', 3))
+
+        assert len(rets) == 2
+        assert len(rets[0]) <= 3
+
+        final = rets[-1]
+        unlimited = (await collect(
+            await WahuMethods.ibd_query_multi(ctx, ['a', 'b'], 'kud', None)))[-1]
+
+        assert len(final) == 3 and len(unlimited) == 4
+        assert set(final) <= set(unlimited)
+        assert [s for _, _, s in final] == sorted((s for _, _, s in unlimited), reverse=True)[:3]
+
+    @staticmethod
+    async def test_uid(ctx):
+        rets = await collect(await WahuMethods.ibd_query_multi(
+            ctx, ['a', 'b', 'a'], f'-U {illust_detail.user.uid}', None))
+
+        assert len(rets) == 2
+        assert sorted((name, iid) for name, iid, _ in rets[-1]) == \
+            [('a', 1), ('a', 2), ('a', 3), ('b', 1), ('b', 4)]
+
+    @staticmethod
+    async def test_unknown_database(ctx):
+        with pytest.raises(WahuRuntimeError):
+            await WahuMethods.ibd_query_multi(ctx, ['a', 'c'], 'kud', None)
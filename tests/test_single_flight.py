@@ -0,0 +1,96 @@
+import asyncio
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from wahu_backend.aiopixivpy.api_ilst_pool import IllustPoolAPI
+from wahu_backend.async_util import KeyedLock, SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_coalesce():
+    sf: SingleFlight[str, int] = SingleFlight()
+    calls = []
+
+    async def f(x: int) -> int:
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x
+
+    rets = await asyncio.gather(*(sf.run('a', lambda: f(1)) for _ in range(5)), sf.run('b', lambda: f(2)))
+
+    assert rets == [1] * 5 + [2]
+    assert calls == [1, 2]
+    assert len(sf) == 0
+
+    # 结束后再次调用会重新运行
+    assert await sf.run('a', lambda: f(3)) == 3
+
+
+@pytest.mark.asyncio
+async def test_error_and_cancel():
+    sf: SingleFlight[str, int] = SingleFlight()
+    started = asyncio.Event()
+
+    async def fail() -> int:
+        started.set()
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    first = asyncio.create_task(sf.run('a', fail))
+    await started.wait()
+    second = asyncio.create_task(sf.run('a', fail))
+    await asyncio.sleep(0)
+
+    # 第一个调用者被取消，第二个仍然得到结果
+    first.cancel()
+    with pytest.raises(ValueError):
+        await second
+    assert 'a' not in sf
+
+
+@pytest.mark.asyncio
+async def test_keyed_lock():
+    lock: KeyedLock[str] = KeyedLock()
+    log = []
+
+    async def f(key: str, i: int):
+        async with lock(key):
+            log.append(('start', key, i))
+            await asyncio.sleep(0.01)
+            log.append(('end', key, i))
+
+    await asyncio.gather(f('a', 1), f('a', 2), f('b', 3))
+
+    # 同一个键依次进行，不同的键同时进行
+    assert [e for e in log if e[1] == 'a'] == [
+        ('start', 'a', 1), ('end', 'a', 1), ('start', 'a', 2), ('end', 'a', 2)]
+    assert log.index(('start', 'b', 3)) < log.index(('end', 'a', 1))
+    assert len(lock) == 0
+
+    with pytest.raises(ValueError):
+        async with lock('a'):
+            raise ValueError()
+    assert not lock.locked('a') and len(lock) == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_illust_detail():
+    calls = []
+
+    async def illust_detail(iid: int):
+        calls.append(iid)
+        await asyncio.sleep(0.01)
+        api.ilst_pool[iid] = f'detail {iid}'
+        return f'detail {iid}'
+
+    api = SimpleNamespace(
+        ilst_pool=OrderedDict(), ilst_flights=SingleFlight(), illust_detail=illust_detail)
+
+    rets = await asyncio.gather(*(IllustPoolAPI.pool_illust_detail(api, 1) for _ in range(3)))  # type: ignore
+    assert rets == ['detail 1'] * 3
+    assert calls == [1]
+
+    await IllustPoolAPI.pool_illust_detail(api, 1)  # type: ignore
+    assert calls == [1]
@@ -0,0 +1,64 @@
+import dataclasses
+
+import pytest
+from pixiv_dict_examples import illust_dict1, illust_dict2
+
+from wahu_backend.aiopixivpy.datastructure_processing import process_pixiv_illust_dict
+from wahu_backend.illust_bookmarking import IllustBookmark
+from wahu_backend.illust_bookmarking.snapshot import (Snapshot, SnapshotError,
+                                                      is_snapshot, load_snapshot,
+                                                      write_snapshot)
+
+illust_detail1 = process_pixiv_illust_dict(illust_dict1)
+illust_detail2 = process_pixiv_illust_dict(illust_dict2)
+
+
+@pytest.fixture
+def seed_iids():
+    return (5, 3, 1), range(1, 6)
+
+
+@pytest.fixture
+def snapshot_path(ibd, tmp_path):
+    path = tmp_path / 'db.snapshot'
+    with open(path, 'wb') as f:
+        assert write_snapshot(ibd, f) == (4, 5)
+    return path
+
+
+def test_read(ibd, snapshot_path):
+    assert is_snapshot(snapshot_path)
+
+    with Snapshot(snapshot_path) as snap:
+        assert (snap.num_illusts, snap.num_bookmarks) == (4, 5)
+        assert list(snap.iter_illusts()) == sorted(ibd.illusts_te.select(), key=lambda i: i.iid)
+        assert list(snap.iter_bookmarks()) == sorted(ibd.bookmarks_te.select(), key=lambda b: b.iid)
+
+        assert snap.find_illust(3) == dataclasses.replace(illust_detail1, iid=3)
+        assert snap.find_illust(2) is None
+        assert snap.find_bookmark(4) == IllustBookmark(4, [0, 4], 40)
+
+        # 相同的作者和标签只保存一次
+        assert len(snap.cols['us_uid']) == 2
+        assert len(snap.cols['tg_name']) == len(illust_detail1.tags) + len(illust_detail2.tags)
+
+
+def test_load(ibd, snapshot_path, make_ibd):
+    target = make_ibd()
+
+    assert load_snapshot(target, snapshot_path, batch_size=3) == (4, 5)
+    assert target.illusts_te.select(illust_detail2.iid) == [illust_detail2]
+    assert target.bookmarks_te.count() == 5
+
+
+def test_invalid(tmp_path, snapshot_path):
+    path = tmp_path / 'broken.snapshot'
+
+    path.write_bytes(b'not a snapshot')
+    assert not is_snapshot(path)
+    with pytest.raises(SnapshotError):
+        Snapshot(path)
+
+    path.write_bytes(snapshot_path.read_bytes()[:-16])
+    with pytest.raises(SnapshotError):
+        Snapshot(path)
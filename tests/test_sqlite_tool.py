@@ -2,6 +2,8 @@ import sqlite3
 
 import pytest
 from wahu_backend.aiopixivpy.datastructure_illust import IllustDetail
+from wahu_backend.illust_bookmarking import IllustBookmark
+from wahu_backend.sqlite_tools.st_exceptions import SqliteTableEditingKeyError
 from wahu_backend.sqlite_tools.table_editor import SqliteTableEditor
 
 
@@ -56,6 +58,17 @@ class TestInsert:
                              (illust_detail.iid,)).fetchall()
         assert len(ret) == 1
 
+    @staticmethod
+    def test_insert_returns_new_flags(editor, illust_detail):
+        editor.create_if_not()
+        editor.delete()
+
+        ret = editor.insert([illust_detail, illust_detail])
+        assert ret == [True, False]
+
+        ret = editor.insert([illust_detail])
+        assert ret == [False]
+
 
 @pytest.fixture(scope='class')
 def init_written_table(editor, illust_detail):
@@ -132,3 +145,122 @@ class TestUpdate:
 
         assert db_cur.execute('SELECT * FROM illustDetail WHERE title=?',
                               ('123',)).fetchone() != None
+
+
+class TestCodec:
+    @staticmethod
+    def test_round_trip(illust_detail):
+        from wahu_backend.sqlite_tools.codec import get_codec
+
+        codec = get_codec(IllustDetail)
+
+        assert get_codec(IllustDetail) is codec
+        assert codec.decode(codec.encode(illust_detail)) == illust_detail
+
+    @staticmethod
+    def test_encode_matches_adapters(illust_detail):
+        from wahu_backend.sqlite_tools.codec import get_codec
+
+        encoded = get_codec(IllustDetail).encode(illust_detail)
+
+        assert encoded == tuple(
+            IllustDetail.adapters[k].serialized(getattr(illust_detail, k))
+            for k in IllustDetail.keys)
+
+
+@pytest.fixture(scope='class')
+def bm_editor():
+    con = sqlite3.connect(':memory:')
+    te = SqliteTableEditor('bookmarks', IllustBookmark)
+    te.bind(con.cursor())
+    te.create()
+    # 时间戳有重复，检验分页时按索引区分
+    te.insert([IllustBookmark(iid, [0], iid // 3) for iid in range(10)])
+
+    yield te
+
+    con.close()
+
+
+class TestPaging:
+    @staticmethod
+    def test_select_iter(bm_editor):
+        ret = list(bm_editor.select_iter(batch_size=3))
+
+        assert sorted(bm.iid for bm in ret) == list(range(10))
+
+    @staticmethod
+    def test_select_iter_interleaved(bm_editor):
+        it = bm_editor.select_iter(batch_size=2)
+        first = next(it)
+
+        # 迭代中使用同一个 editor 不影响迭代
+        assert bm_editor.has(first.iid)
+        assert len(list(it)) == 9
+
+    @staticmethod
+    def test_select_page_index(bm_editor):
+        iids: list[int] = []
+        after = None
+
+        while True:
+            page = bm_editor.select_page(after, limit=4)
+            if page == []:
+                break
+            iids += [bm.iid for bm in page]
+            after = bm_editor.page_key(page[-1])
+
+        assert iids == list(range(10))
+
+    @staticmethod
+    def test_select_page_order_desc(bm_editor):
+        iids: list[int] = []
+        after = None
+
+        while True:
+            page = bm_editor.select_page(
+                after, limit=4, order_by='add_timestamp', desc=True)
+            if page == []:
+                break
+            iids += [bm.iid for bm in page]
+            after = bm_editor.page_key(page[-1], 'add_timestamp')
+
+        assert iids == list(reversed(range(10)))
+
+    @staticmethod
+    def test_select_page_bad_key(bm_editor):
+        with pytest.raises(SqliteTableEditingKeyError):
+            bm_editor.select_page(order_by='nope')
+
+
+class TestOrderLimitCount:
+    @staticmethod
+    def test_count(bm_editor):
+        assert bm_editor.count() == 10
+        assert bm_editor.count(3) == 1
+        assert bm_editor.count(add_timestamp=0) == 3
+        assert bm_editor.count(iid=0, add_timestamp=1) == 0
+
+    @staticmethod
+    def test_select_order_limit(bm_editor):
+        ret = bm_editor.select(order_by='add_timestamp', desc=True, limit=4)
+        assert [bm.iid for bm in ret] == [9, 8, 7, 6]
+
+        ret = bm_editor.select(order_by='add_timestamp', limit=2, offset=3)
+        assert [bm.iid for bm in ret] == [3, 4]
+
+    @staticmethod
+    def test_select_offset_only(bm_editor):
+        ret = bm_editor.select(order_by='iid', offset=8)
+        assert [bm.iid for bm in ret] == [8, 9]
+
+    @staticmethod
+    def test_index_created(bm_editor):
+        names = [r[0] for r in bm_editor.cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")]
+        assert 'bookmarks_add_timestamp' in names
+
+        plan = ' '.join(str(r) for r in bm_editor.cursor.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM bookmarks '
+            'ORDER BY add_timestamp DESC LIMIT 50'))
+        assert 'bookmarks_add_timestamp' in plan
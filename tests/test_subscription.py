@@ -0,0 +1,224 @@
+import asyncio
+import dataclasses
+from time import monotonic
+
+import pytest
+from pixiv_dict_examples import illust_dict1
+
+from wahu_backend.aiopixivpy.datastructure_processing import process_pixiv_illust_dict
+from wahu_backend.illust_bookmarking import IllustBookmarkDatabase
+from wahu_backend.illust_bookmarking.ib_datastructure import SubscriptionMark
+from wahu_backend.illust_bookmarking.subscription import (RateLimiter, Subscription,
+                                                          SubscriptionScheduler)
+from wahu_backend.wahu_core.wahu_cli import AsyncGenPipe
+
+illust_detail = process_pixiv_illust_dict(illust_dict1)
+
+
+def ilst(iid):
+    return dataclasses.replace(illust_detail, iid=iid)
+
+
+@pytest.fixture
+def ibd():
+    ibd = IllustBookmarkDatabase('test', ':memory:')
+    ibd.connect()
+    yield ibd
+    ibd.close()
+
+
+def make_sub(name, pages, fetched):
+    async def gen():
+        for page in pages:
+            fetched.append((name, page[0].iid))
+            yield page
+    return Subscription(name, gen())
+
+
+async def drain(pipe):
+    pipe.close()
+    return ''.join([line async for line in pipe])
+
+
+@pytest.mark.asyncio
+class TestScheduler:
+
+    @staticmethod
+    async def test_round_robin(ibd):
+        fetched = []
+        subs = [
+            make_sub('a', [[ilst(1)], [ilst(2)], [ilst(3)]], fetched),
+            make_sub('b', [[ilst(11)], [ilst(12)]], fetched)
+        ]
+
+        pipe = AsyncGenPipe()
+        await SubscriptionScheduler(ibd, pipe, RateLimiter(0), concurrency=1).run(subs)
+
+        assert fetched == [('a', 1), ('b', 11), ('a', 2), ('b', 12), ('a', 3)]
+        assert ibd.bookmarks_te.count() == 5
+        assert ibd.illusts_te.existing([1, 2, 3, 11, 12]) == {1, 2, 3, 11, 12}
+
+    @staticmethod
+    async def test_intelligent_stop(ibd):
+        ibd.illusts_te.insert([ilst(2)])
+
+        fetched = []
+        subs = [make_sub('a', [[ilst(1)], [ilst(2)], [ilst(3)]], fetched)]
+
+        pipe = AsyncGenPipe()
+        await SubscriptionScheduler(
+            ibd, pipe, RateLimiter(0), intelligent=True).run(subs)
+
+        assert fetched == [('a', 1), ('a', 2)]
+        assert ibd.bookmarks_te.has(1)
+        assert not ibd.bookmarks_te.has(3)
+
+    @staticmethod
+    async def test_page_num(ibd):
+        fetched = []
+        subs = [make_sub('a', [[ilst(1)], [ilst(2)], [ilst(3)]], fetched)]
+
+        pipe = AsyncGenPipe()
+        await SubscriptionScheduler(ibd, pipe, RateLimiter(0), page_num=2).run(subs)
+
+        assert fetched == [('a', 1), ('a', 2)]
+
+    @staticmethod
+    async def test_failed_subscription(ibd):
+
+        async def broken():
+            raise RuntimeError('网络错误')
+            yield
+
+        fetched = []
+        subs = [
+            Subscription('坏的订阅', broken()),
+            make_sub('a', [[ilst(1)], [ilst(2)]], fetched)
+        ]
+
+        pipe = AsyncGenPipe()
+        await SubscriptionScheduler(ibd, pipe, RateLimiter(0)).run(subs)
+
+        assert ibd.bookmarks_te.count() == 2
+        assert '坏的订阅 更新失败' in await drain(pipe)
+
+    @staticmethod
+    async def test_error_outside_fetch(ibd, monkeypatch):
+
+        class BrokenClose:
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                raise StopAsyncIteration
+
+            async def aclose(self):
+                raise RuntimeError('关闭失败')
+
+        def broken_known(ibd, page):
+            raise RuntimeError('查询失败')
+
+        monkeypatch.setattr(
+            'wahu_backend.illust_bookmarking.subscription.page_known', broken_known)
+
+        fetched = []
+        subs = [
+            Subscription('关闭出错', BrokenClose()),
+            make_sub('查询出错', [[ilst(1)], [ilst(2)]], fetched),
+            make_sub('a', [[ilst(11)]], fetched)._replace(key='a')
+        ]
+
+        # 出错的订阅不会让取页的任务退出，否则 `run` 会一直等待
+        pipe = AsyncGenPipe()
+        await asyncio.wait_for(SubscriptionScheduler(
+            ibd, pipe, RateLimiter(0), concurrency=1, intelligent=True).run(subs), 5)
+
+        output = await drain(pipe)
+        assert '关闭出错 更新失败: 关闭失败' in output
+        assert '查询出错 更新失败: 查询失败' in output
+        assert 'a 更新失败: 查询失败' in output
+        assert fetched == [('查询出错', 1), ('a', 11)]
+        assert ibd.subscription_marks() == {}
+
+
+def make_keyed_sub(key, pages, fetched):
+    return make_sub(key, pages, fetched)._replace(key=key)
+
+
+async def run_with_marks(ibd, subs):
+    pipe = AsyncGenPipe()
+    await SubscriptionScheduler(
+        ibd, pipe, RateLimiter(0), marks=ibd.subscription_marks()).run(subs)
+
+
+@pytest.mark.asyncio
+class TestMarks:
+
+    @staticmethod
+    async def test_user_works(ibd):
+        fetched = []
+        await run_with_marks(ibd, [make_keyed_sub('user:1', [[ilst(5), ilst(4)], [ilst(3)]], fetched)])
+
+        mark = ibd.subscription_marks()['user:1']
+        assert (mark.newest_iid, mark.recent_iids) == (5, [5, 4])
+
+        # 最新的作品被删除了，仍然能在更旧的作品处停止
+        fetched.clear()
+        await run_with_marks(ibd, [make_keyed_sub('user:1', [[ilst(7), ilst(4)], [ilst(3)]], fetched)])
+
+        assert fetched == [('user:1', 7)]
+        assert ibd.bookmarks_te.has(7)
+        assert ibd.subscription_marks()['user:1'].newest_iid == 7
+
+    @staticmethod
+    async def test_bookmarks(ibd):
+        fetched = []
+        await run_with_marks(ibd, [make_keyed_sub('bookmark:1', [[ilst(5), ilst(9)]], fetched)])
+
+        # 收藏的顺序与 ID 无关
+        fetched.clear()
+        await run_with_marks(ibd, [make_keyed_sub('bookmark:1', [[ilst(2), ilst(5)], [ilst(1)]], fetched)])
+
+        assert fetched == [('bookmark:1', 2)]
+        assert ibd.bookmarks_te.has(2)
+        assert not ibd.bookmarks_te.has(1)
+
+    @staticmethod
+    async def test_failed_keeps_mark(ibd):
+        ibd.marks_te.insert([SubscriptionMark('user:1', 1, [1], 0)])
+
+        async def broken():
+            yield [ilst(3)]
+            raise RuntimeError()
+
+        await run_with_marks(ibd, [Subscription('', broken(), 'user:1')])
+
+        assert ibd.subscription_marks()['user:1'].newest_iid == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    limiter = RateLimiter(50)
+
+    begin = monotonic()
+    for _ in range(6):
+        await limiter.acquire()
+
+    # 第一次使用积攒的令牌，之后每次等待 0.02 秒
+    assert monotonic() - begin >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_update_subscrip(ibd):
+    ibd.config_table_editor.v.subscribed_user_uid = [1]
+    ibd.config_table_editor.v.subscribed_bookmark_uid = [2]
+
+    def get_user_illusts(uid):
+        return make_sub('', [[ilst(uid * 10)], [ilst(uid * 10 + 1)]], []).pages
+
+    coro, pipe = await ibd.update_subscrip(
+        get_user_illusts, get_user_illusts, overwrite='append', concurrency=2, rate=0)
+    await coro
+
+    assert sorted(iid for iid, in ibd.bookmarks_te.select_cols(cols=['iid'])) == [10, 11, 20, 21]
+    assert [line async for line in pipe] != []
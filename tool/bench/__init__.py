@@ -0,0 +1,27 @@
+"""
+sqlite_tools 等模块的性能测试脚本
+使用 `python -m tool.bench.<脚本名>` 运行
+"""
+
+import sys
+sys.path.append('./')
+
+from wahu_backend.aiopixivpy.datastructure_illust import (IllustDetail,
+                                                          IllustTag,
+                                                          PixivUserSummery)
+
+
+def fake_illust_detail(iid: int) -> IllustDetail:
+    """生成一个用于测试的插画详情"""
+
+    url = f'/img-original/img/2022/01/01/00/00/00/{iid}_p0.jpg'
+    return IllustDetail(
+        iid, f'title {iid}', f'caption of illust {iid}',
+        1200, 800, False, False, 1, 0, 2,
+        [IllustTag(f'tag{iid % 97}', f'translated{iid % 97}'),
+         IllustTag(f'tag{iid % 13}', None)],  # type: ignore
+        iid % 1000, 'illust', iid % 5000,
+        PixivUserSummery(f'account{iid % 300}', iid % 300, False,
+                         f'user{iid % 300}', '/user-profile/img/x.jpg'),
+        True, 0, [url], [url], [url], [url]
+    )
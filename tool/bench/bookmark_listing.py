@@ -0,0 +1,55 @@
+"""比较在 Python 中排序与在 sqlite 中 ORDER BY ... LIMIT 列出最新收藏的速度"""
+
+import sqlite3
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+from wahu_backend.illust_bookmarking import IllustBookmark
+from wahu_backend.sqlite_tools import SqliteTableEditor
+
+
+def newest_in_python(te: SqliteTableEditor[IllustBookmark], num: int) -> list[IllustBookmark]:
+    """旧的方式：读出全部收藏后排序"""
+
+    bms = te.select()
+    bms.sort(key=lambda bm: bm.add_timestamp, reverse=True)
+    return bms[:num]
+
+
+def newest_in_sql(te: SqliteTableEditor[IllustBookmark], num: int) -> list[IllustBookmark]:
+    return te.select(order_by='add_timestamp', desc=True, limit=num)
+
+
+@click.command()
+@click.option('--num', '-n', type=int, default=100000, help='收藏条数')
+@click.option('--top', '-t', type=int, default=50, help='列出的最新收藏数')
+def main(num: int, top: int) -> None:
+    with TemporaryDirectory() as td:
+        con = sqlite3.connect(Path(td) / 'bench.db')
+        te = SqliteTableEditor('bookmarks', IllustBookmark)
+        te.bind(con.cursor())
+        te.create()
+        # 时间戳与 iid 无关，避免数据本身有序
+        te.insert([IllustBookmark(iid, [0], (iid * 7919) % num) for iid in range(num)])
+        con.commit()
+
+        for name, f in (('Python 排序', newest_in_python), ('ORDER BY', newest_in_sql)):
+            begin = perf_counter()
+            f(te, top)
+            elapsed = perf_counter() - begin
+            print(f'{name}: {elapsed * 1000:.2f}ms')
+
+        assert newest_in_python(te, top) == newest_in_sql(te, top)
+
+        begin = perf_counter()
+        cnt = te.count()
+        print(f'COUNT(*): {cnt} 条, {(perf_counter() - begin) * 1000:.2f}ms')
+
+        con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""比较全表扫描、全文索引和内存索引下 `query_title` 的速度"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+from wahu_backend.illust_bookmarking import (IllustBookmarkDatabase,
+                                             illust_table, ngram_index)
+
+from . import fake_illust_detail
+
+
+def run(db_path: Path, num: int, keyword: str, cutoff: int,
+        fulltext: bool, memory: bool = False) -> float:
+    illust_table.set_fulltext_index(fulltext)
+    ngram_index.set_memory_index(memory)
+
+    ibd = IllustBookmarkDatabase('bench', db_path)
+    ibd.connect()
+    if ibd.illusts_te.count() == 0:
+        ibd.illusts_te.insert(fake_illust_detail(i) for i in range(num))
+        ibd.commit()
+    elif fulltext:
+        ibd.commit()  # 重新开启全文索引时会在 connect 中建立
+
+    if memory:
+        begin = perf_counter()
+        ibd.ngram_index.build(ibd.illusts_te.select_iter)
+        print(f'建立内存索引: {(perf_counter() - begin) * 1000:.1f}ms, '
+              f'{ibd.ngram_index.memory_usage() / 1024 / 1024:.1f} MiB')
+
+    begin = perf_counter()
+    ret = ibd.query_title(keyword, cutoff)
+    elapsed = perf_counter() - begin
+
+    ibd.close()
+    name = '内存索引' if memory else '全文索引' if fulltext else '全表扫描'
+    print(f'{name}: {len(ret)} 条结果, {elapsed * 1000:.1f}ms')
+    return elapsed
+
+
+@click.command()
+@click.option('--num', '-n', type=int, default=20000, help='插画数')
+@click.option('--keyword', '-k', type=str, default='12345', help='关键词')
+@click.option('--cutoff', '-c', type=int, default=90)
+def main(num: int, keyword: str, cutoff: int) -> None:
+    with TemporaryDirectory() as td:
+        db_path = Path(td) / 'bench.db'
+        run(db_path, num, keyword, cutoff, fulltext=False)
+        run(db_path, num, keyword, cutoff, fulltext=True)
+        run(db_path, num, keyword, cutoff, fulltext=True, memory=True)
+
+
+if __name__ == '__main__':
+    main()
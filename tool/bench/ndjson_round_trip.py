@@ -0,0 +1,110 @@
+"""
+比较整体 JSON 、流式 NDJSON 和二进制快照导出再导入一个数据库的耗时、峰值内存（RSS）和文件大小
+每种方式在单独的子进程中运行，峰值内存减去子进程开始时的 RSS
+"""
+
+import dataclasses
+import json
+import multiprocessing
+import resource
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+from wahu_backend.illust_bookmarking import IllustBookmark, IllustBookmarkDatabase
+from wahu_backend.illust_bookmarking.ndjson import illust_from_dict, load_ndjson, write_ndjson
+from wahu_backend.illust_bookmarking.snapshot import load_snapshot, write_snapshot
+
+from . import fake_illust_detail
+
+
+def round_trip_json(source: IllustBookmarkDatabase, target: IllustBookmarkDatabase, td: Path) -> None:
+    """旧的方式：导出为一个字符串，整体解码后写入"""
+
+    illusts = ','.join(
+        json.dumps(dataclasses.asdict(ilst), ensure_ascii=False)
+        for ilst in source.iter_illusts())
+    bookmarks = ','.join(
+        json.dumps(dataclasses.asdict(bm), ensure_ascii=False)
+        for bm in source.iter_bookmarks())
+    json_str = f'{{"illusts": [{illusts}], "bookmarks": [{bookmarks}]}}'
+
+    d = json.loads(json_str)
+    target.illusts_te.insert([illust_from_dict(i) for i in d['illusts']])
+    target.bookmarks_te.insert([IllustBookmark(**bm) for bm in d['bookmarks']])
+    target.commit()
+
+
+def round_trip_ndjson(source: IllustBookmarkDatabase, target: IllustBookmarkDatabase, td: Path) -> None:
+    with open(td / 'export.ndjson', 'w', encoding='utf-8') as f:
+        write_ndjson(source, f)
+    with open(td / 'export.ndjson', 'r', encoding='utf-8') as f:
+        load_ndjson(target, f)
+
+
+def round_trip_snapshot(source: IllustBookmarkDatabase, target: IllustBookmarkDatabase, td: Path) -> None:
+    with open(td / 'export.snapshot', 'wb') as f:
+        write_snapshot(source, f)
+    load_snapshot(target, td / 'export.snapshot')
+
+
+ROUND_TRIPS = {
+    'json': round_trip_json,
+    'ndjson': round_trip_ndjson,
+    'snapshot': round_trip_snapshot
+}
+
+
+def run(name: str, td: Path, results: 'multiprocessing.Queue[tuple[str, float, float]]') -> None:
+    f = ROUND_TRIPS[name]
+
+    source = IllustBookmarkDatabase('source', td / 'source.db')
+    source.connect()
+    target = IllustBookmarkDatabase('target', td / f'{name}.db')
+    target.connect()
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    begin = perf_counter()
+    f(source, target, td)
+    elapsed = perf_counter() - begin
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+
+    assert target.illusts_te.count() == source.illusts_te.count()
+    source.close()
+    target.close()
+
+    # ru_maxrss 在 Linux 上以 KiB 为单位
+    results.put((name, elapsed, peak_rss / 1024))
+
+
+@click.command()
+@click.option('--num', '-n', type=int, default=20000, help='插画数')
+def main(num: int) -> None:
+    with TemporaryDirectory() as td_str:
+        td = Path(td_str)
+
+        source = IllustBookmarkDatabase('source', td / 'source.db')
+        source.connect()
+        source.illusts_te.insert(fake_illust_detail(iid) for iid in range(num))
+        source.bookmarks_te.insert(IllustBookmark(iid, [0], iid) for iid in range(num))
+        source.commit()
+        source.close()
+
+        results: 'multiprocessing.Queue[tuple[str, float, float]]' = multiprocessing.Queue()
+
+        for name in ROUND_TRIPS.keys():
+            p = multiprocessing.Process(target=run, args=(name, td, results))
+            p.start()
+            p.join()
+
+            name, elapsed, peak = results.get()
+            print(f'{name}: {elapsed:.2f}s, 峰值内存增加 {peak:.1f}MiB')
+
+        for file_name in ('export.ndjson', 'export.snapshot'):
+            print(f'{file_name}: {(td / file_name).stat().st_size / 2 ** 20:.1f}MiB')
+
+
+if __name__ == '__main__':
+    main()
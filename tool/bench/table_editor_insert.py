@@ -0,0 +1,75 @@
+"""比较 `SqliteTableEditor.insert` 与逐行 SELECT/DELETE/INSERT 的写入速度"""
+
+import itertools
+import sqlite3
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+from wahu_backend.sqlite_tools import SqliteTableEditor
+from wahu_backend.aiopixivpy import IllustDetail
+
+from . import fake_illust_detail
+
+
+def insert_rowwise(te: SqliteTableEditor[IllustDetail], rows: list[IllustDetail]) -> list[bool]:
+    """旧的逐行写入方式"""
+
+    result: list[bool] = []
+    for row in rows:
+        if te.has(getattr(row, te.index_name)):
+            te.delete([getattr(row, te.index_name)])
+            result.append(False)
+        else:
+            result.append(True)
+
+        insert_string = ','.join(itertools.repeat('?', len(te.heads)))
+        db_row = (te.row_obj_type.adapters[k].serialized(getattr(row, k))
+                  for k in te.heads)
+
+        te.cursor.execute(
+            f'INSERT INTO {te.name} VALUES ({insert_string})',
+            list(db_row))
+
+    return result
+
+
+def run(rows: list[IllustDetail], rowwise: bool) -> float:
+    with TemporaryDirectory() as td:
+        return _run(Path(td) / 'bench.db', rows, rowwise)
+
+
+def _run(db_path: Path, rows: list[IllustDetail], rowwise: bool) -> float:
+    con = sqlite3.connect(db_path)
+    te = SqliteTableEditor('illusts', IllustDetail)
+    te.bind(con.cursor())
+    te.create()
+
+    begin = perf_counter()
+    if rowwise:
+        insert_rowwise(te, rows)  # 全部新插入
+        insert_rowwise(te, rows)  # 全部覆盖
+    else:
+        te.insert(rows)
+        te.insert(rows)
+    con.commit()
+    elapsed = perf_counter() - begin
+
+    con.close()
+    return elapsed
+
+
+@click.command()
+@click.option('--num', '-n', type=int, default=50000, help='行数')
+def main(num: int) -> None:
+    rows = [fake_illust_detail(i) for i in range(num)]
+
+    for name, rowwise in (('逐行', True), ('批量', False)):
+        elapsed = run(rows, rowwise)
+        print(f'{name}: {2 * num / elapsed:.0f} rows/s ({elapsed:.3f}s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ from typing import (Any, Callable, Concatenate, Literal, Optional, ParamSpec,
 
 import aiohttp
 
+from ..async_util import SingleFlight
 from ..manual_dns.manual_dns_client import ManualDNSClient
 from .ap_exceptions import (AioPixivPyInvalidHTTPStatus,
                             AioPixivPyInvalidReturn, AioPixivPyNotLoggedIn)
@@ -87,6 +88,8 @@ class BasePixivAPI(ManualDNSClient):
 
         self.ilst_pool: OrderedDict[int, IllustDetail] = OrderedDict()
         self.ilst_pool_size = ilst_pool_size
+        # 进行中的插画详情请求
+        self.ilst_flights: SingleFlight[int, IllustDetail] = SingleFlight()
 
         self.connection_limit = connection_limit
 
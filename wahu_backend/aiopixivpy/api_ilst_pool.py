@@ -15,14 +15,12 @@ class IllustPoolAPI(BasePixivAPI):
             self.ilst_pool[ilst_detail.iid] = ilst_detail
 
     async def pool_illust_detail(self, iid: int) -> IllustDetail:
+        """优先从插画详情池获取；对同一 IID 的并发请求只请求一次"""
+
         if iid in self.ilst_pool.keys():
             return self.ilst_pool[iid]
 
-        ilst_detail = await self.illust_detail(iid)
-
-        self._pool_push_illust(ilst_detail)
-
-        return ilst_detail
+        return await self.ilst_flights.run(iid, lambda: self.illust_detail(iid))
 
     @check_login
     async def illust_detail(self, iid: int) -> IllustDetail:
@@ -1,4 +1,3 @@
-import dataclasses
 import json
 from dataclasses import dataclass
 from typing import Iterator, NamedTuple
@@ -42,7 +41,7 @@ class PixivUserSummeryAdapter(SqliteAdapter):
 
     @staticmethod
     def serialized(u: PixivUserSummery) -> str:
-        return json.dumps(dataclasses.astuple(u))
+        return json.dumps((u.account, u.uid, u.is_followed, u.name, u.profile_image))
 
     @staticmethod
     def deserialized(j: str) -> PixivUserSummery:
@@ -70,7 +69,7 @@ class IllustTagListAdapter(SqliteAdapter):
 
     @staticmethod
     def serialized(i: list[IllustTag]) -> str:
-        return json.dumps([dataclasses.astuple(it) for it in i])
+        return json.dumps([(it.name, it.translated) for it in i])
 
     @staticmethod
     def deserialized(j: str) -> list[IllustTag]:
@@ -1,4 +1,7 @@
-from typing import TypeVar, AsyncIterable, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import (AsyncIterable, AsyncIterator, Awaitable, Callable, Generic,
+                    Hashable, Optional, TypeVar)
 
 T = TypeVar('T')
 async def alist(g: AsyncIterable[T], count: Optional[int] = None) -> list[T]:
@@ -30,4 +33,77 @@ async def alist(g: AsyncIterable[T], count: Optional[int] = None) -> list[T]:
         except StopAsyncIteration:
             return ret
         finally:
-            return ret
\ No newline at end of file
+            return ret
+
+K = TypeVar('K', bound=Hashable)
+class SingleFlight(Generic[K, T]):
+    """
+    合并对同一个键的并发请求：同一时间每个键只运行一个协程，其他调用者等待它的结果
+    - 某个调用者被取消不会取消共享的协程，其他调用者仍能得到结果
+    - 协程结束后（包括抛出异常）键被移除，下一次调用会重新运行
+    """
+
+    def __init__(self):
+        self._inflight: dict[K, asyncio.Task[T]] = {}
+
+    async def run(self, key: K, f: Callable[[], Awaitable[T]]) -> T:
+        """如果 `key` 已经在进行中，等待其结果；否则运行 `f()`"""
+
+        task = self._inflight.get(key, None)
+
+        if task is None:
+            task = asyncio.ensure_future(f())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        return await asyncio.shield(task)
+
+    def pending(self, key: K) -> Optional['asyncio.Task[T]']:
+        """`key` 对应的进行中的任务"""
+
+        return self._inflight.get(key, None)
+
+    def _done(self, key: K, task: 'asyncio.Task[T]') -> None:
+        if self._inflight.get(key, None) is task:
+            del self._inflight[key]
+
+        # 所有调用者都被取消时，避免“异常从未被获取”的警告
+        if not task.cancelled():
+            task.exception()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class KeyedLock(Generic[K]):
+    """
+    每个键一把互斥锁，用 `async with lock(key):` 获取. 没有调用者持有或等待的锁会被移除
+    """
+
+    def __init__(self):
+        self._locks: dict[K, asyncio.Lock] = {}
+        # 持有或等待每把锁的调用者数
+        self._users: dict[K, int] = {}
+
+    @asynccontextmanager
+    async def __call__(self, key: K) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if self._users[key] == 0:
+                del self._users[key]
+                del self._locks[key]
+
+    def locked(self, key: K) -> bool:
+        return key in self._locks and self._locks[key].locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -8,7 +8,9 @@ from .aiopixivpy.pixivpy_typing import (PixivRecomMode, PixivSearchTarget,
                                         PixivSort)
 from .file_tracing import FileEntry, FileTracingConfig
 from .illust_bookmarking import IllustBookmark, IllustBookmarkingConfig
+from .illust_bookmarking.ib_datastructure import PagesPolicy
 from .pixiv_image import DownloadProgress
+from .wahu_core.job_scheduler import JobStatus
 from .wahu_methods.cli import CliScriptInfo
 from .wahu_methods.illust_repo import FileEntryWithURL, RepoSyncAddReport
 from .wahu_methods.lib_tag_utils import WeighedIllustTag, TagRegressionModel
@@ -22,9 +24,10 @@ exports = [PixivComment, PixivUserSummery, IllustTag, IllustDetail, PixivUserDet
            PixivUserPreview, IllustBookmark, FileEntry, TrendingTagIllusts,
            FileTracingConfig, RepoSyncAddReport, AccountSession,
            FileEntryWithURL, DownloadProgress, CliScriptInfo, WeighedIllustTag,
-           CountedIllustTag, TagRegressionModel, IllustBookmarkingConfig]
+           CountedIllustTag, TagRegressionModel, IllustBookmarkingConfig, JobStatus]
 
 exports_type = {
     'PixivRecomMode': PixivRecomMode,
     'PixivSearchTarget': PixivSearchTarget,
-    'PixivSort': PixivSort}
+    'PixivSort': PixivSort,
+    'PagesPolicy': PagesPolicy}
@@ -13,6 +13,9 @@ from .logger import logger
 # 默认要忽略的文件
 DEFAULT_IGNORE_LIST = [r'.+\.aria2', r'index.db', r'index.db-journal']
 
+# 索引数据库自身的文件，无论配置如何都被忽略
+INDEX_DB_FILES = [r'index\.db', r'index\.db-journal', r'index\.db-wal', r'index\.db-shm']
+
 
 class FileTracerBase(DependingDatabase):
     """
@@ -37,18 +40,13 @@ class FileTracerBase(DependingDatabase):
         return config
 
 
-    indexed_te :SqliteTableEditor[FileEntry] = SqliteTableEditor('indexed', FileEntry)
-    cached_te :SqliteTableEditor[FileEntry] = SqliteTableEditor('cached', FileEntry)
-
-    config_table_editor: ConfigStoredinSqlite[FileTracingConfig] = \
-        ConfigStoredinSqlite(
-            FileTracingConfig,
-            name='config'
-    )
+    indexed_te :SqliteTableEditor[FileEntry]
+    cached_te :SqliteTableEditor[FileEntry]
+    config_table_editor: ConfigStoredinSqlite[FileTracingConfig]
     
     __slots__ = (
         'log_adapter', 'name', 'root_path', 'index_path', 'config',
-        'index_con'
+        'index_con', 'indexed_te', 'cached_te', 'config_table_editor'
     )
 
     def __init__(self, name: str, root_path: Path):
@@ -65,6 +63,13 @@ class FileTracerBase(DependingDatabase):
 
         self.index_path = root_path / 'index.db'
 
+        # 每个实例持有自己的表编辑器，因为它们绑定在各自的连接上
+        self.indexed_te = SqliteTableEditor('indexed', FileEntry)
+        self.cached_te = SqliteTableEditor('cached', FileEntry)
+        self.config_table_editor = ConfigStoredinSqlite(
+            FileTracingConfig,
+            name='config'
+        )
 
         self.config = self.config_table_editor.v  # 这样就能使用简写 config.ignore
 
@@ -72,24 +77,37 @@ class FileTracerBase(DependingDatabase):
 
         self.index_con: sqlite3.Connection
 
-    def connect(self) -> None:
-        """连接数据库，并创建所有表"""
+    def connect(self, readonly: bool = False) -> None:
+        """
+        连接数据库，并创建所有表
+        - `:param readonly:` 只读连接不检查表结构，并拒绝一切写入
+        连接可能被 `DatabaseContextManager` 交给其他线程使用，由它保证同一时间只有一个线程访问
+        """
 
-        self.index_con = sqlite3.connect(self.index_path)
+        self.index_con = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.index_con.execute('PRAGMA journal_mode=WAL')
         index_cur = self.index_con.cursor()
 
         self.indexed_te.bind(index_cur)
-        self.indexed_te.create_if_not()
-
         self.cached_te.bind(index_cur)
-        self.cached_te.create_if_not()
-
         self.config_table_editor.bind(index_cur)
+
+        if readonly:
+            self.index_con.execute('PRAGMA query_only=ON')
+            return
+
+        self.indexed_te.create_if_not()
+        self.cached_te.create_if_not()
         self.config_table_editor.create_if_not()
 
         if self.config_table_editor.empty:
             self.config_table_editor.insert([self.get_default_config()])
 
+        self.index_con.commit()
+
+    def clone(self) -> 'FileTracer':
+        return type(self)(self.name, self.root_path)  # type: ignore
+
     def close(self, commit: bool = True) -> None:
         """关闭数据库连接"""
 
@@ -97,6 +115,12 @@ class FileTracerBase(DependingDatabase):
             self.index_con.commit()
         self.index_con.close()
 
+    def commit(self) -> None:
+        self.index_con.commit()
+
+    def rollback(self) -> None:
+        self.index_con.rollback()
+
 
 class FileTracerIndexingMixin(FileTracerBase):
 
@@ -180,7 +204,7 @@ class FileTracerValidationMixin(FileTracerBase):
         """扫描本地文件，除去 `ignore_list` 中的项后存入 `self.file_list`"""
         raw_file_list = list(self.root_path.iterdir())  # 相对路径
 
-        ignore_list = self.config.ignore
+        ignore_list = self.config.ignore + INDEX_DB_FILES
 
         self.log_adapter.debug('scan: 忽略 %s' % ignore_list)
 
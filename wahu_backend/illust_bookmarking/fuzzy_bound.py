@@ -0,0 +1,72 @@
+"""
+模糊查询的 q-gram 筛选条件. 全文索引和内存索引都只把可能达到分数线的插画交给 fuzzywuzzy 评分，
+这里给出“达到分数线的片段至少与关键词共有多少个 q-gram”的下界，保证筛选不会漏掉全表扫描能找到的结果.
+
+`match_keyword` 用 `fuzz.token_sort_ratio` 给关键词和内容的片段评分：两者都经过 `full_process`
+（去掉 Latin-1 中的非 ASCII 字符，非字母数字替换为空格，转为小写），再把空格分开的词排序后拼接，
+最后计算 `2M / (m + n)` ，其中 `m` 、 `n` 为处理后的长度， `M` 为若干个公共子串（匹配块）的总长.
+
+只对处理后只有一个词的关键词 `k` 进行筛选. 此时匹配块中没有空格，都落在片段的某个词内，
+而词在排序前后内容不变，所以每个长度 `s >= q` 的匹配块都提供 `s - q + 1` 个 `k` 的 q-gram ，
+它们也是 `normalize(内容)` 的子串. 记匹配块数为 `r` ，相邻两个匹配块之间至少隔着一个未匹配的字符，
+因此 `r <= 1 + (m - M) + (n - M)` ，保留下来的 q-gram 位置数
+    `P >= M - (q - 1) r >= (2q - 1) M - (q - 1)(1 + m + n)` .
+分数四舍五入后达到 `cutoff` 要求 `2M / (m + n) >= c = (cutoff - 0.5) / 100` ，
+又由 `M <= n` 得到 `m + n >= 2m / (2 - c)` ，代入即得 `P` 的下界.
+`str.lower` 只在希腊字母 Σ 上与上下文有关，因此含 σ 或 ς 的关键词不进行筛选
+"""
+
+import math
+from collections import Counter
+from fractions import Fraction
+from typing import Optional
+
+from fuzzywuzzy import utils
+
+
+def normalize(s: str) -> str:
+    """`token_sort_ratio` 对内容所做的处理，不包括排序"""
+
+    return utils.full_process(s, force_ascii=True)
+
+
+def normalize_keyword(keyword: str) -> Optional[str]:
+    """
+    `process.extractBests` 对关键词所做的处理；处理后不是恰好一个词时返回 `None`
+    """
+
+    k = normalize(utils.full_process(keyword))
+
+    if k == '' or len(k.split()) != 1 or 'σ' in k or 'ς' in k:
+        return None
+    return k
+
+
+def qgrams(s: str, q: int) -> list[str]:
+    return [s[i:i + q] for i in range(len(s) - q + 1)]
+
+
+def min_shared_qgrams(keyword: str, cutoff: int, q: int) -> Optional[int]:
+    """
+    与 `keyword` 的相似度达到 `cutoff` 的片段，至少与 `normalize_keyword(keyword)` 共有多少个不同的 q-gram .
+    无法给出至少为 1 的下界时返回 `None` ，此时应当对所有插画评分
+    """
+
+    k = normalize_keyword(keyword)
+    if k is None or len(k) < q:
+        return None
+
+    m = len(k)
+    c = Fraction(2 * cutoff - 1, 200)
+
+    slope = (2 * q - 1) * c / 2 - (q - 1)
+    if slope <= 0:
+        return None
+
+    positions = math.ceil(slope * 2 * m / (2 - c) - (q - 1))
+    if positions < 1:
+        return None
+
+    # 同一个 q-gram 可能在关键词中出现多次
+    most_common = Counter(qgrams(k, q)).most_common(1)[0][1]
+    return math.ceil(positions / most_common)
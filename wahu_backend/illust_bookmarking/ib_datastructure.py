@@ -23,15 +23,55 @@ class IllustBookmark(IllustBookmarkRaw, DatabaseRow):
 
     index = 'iid'
 
+    indexed = ['add_timestamp']
+
     def as_fids(self):
         return [f'{self.iid}-{p}' for p in self.pages]
 
+@dataclasses.dataclass(slots=True)
+class SubscriptionMarkRaw:
+    key: str  # `user:<uid>` 或 `bookmark:<uid>`
+    newest_iid: int  # 上次更新到的最新插画
+    recent_iids: list[int]  # 上次更新时最新的若干个插画，按新到旧排序
+    updated_at: int  # 单位为秒
+
+
+class SubscriptionMark(SubscriptionMarkRaw, DatabaseRow):
+    """
+    一条订阅上次更新到的位置. 用户作品按投稿时间排序， ID 不大于 `newest_iid` 的都已经拉取过；
+    用户收藏按收藏时间排序，与插画 ID 无关，因此遇到 `recent_iids` 中的任意一个即可停止
+    """
+    adapters = {
+        'key': StrAdapter,
+        'newest_iid': IntAdapter,
+        'recent_iids': JsonAdapter,
+        'updated_at': IntAdapter
+    }
+
+    keys = list(adapters.keys())
+
+    index = 'key'
+
+    def reached(self, iid: int) -> bool:
+        """是否已经到达上次更新的位置"""
+
+        if iid in self.recent_iids:
+            return True
+        return self.key.startswith('user:') and iid <= self.newest_iid
+
 # 覆写模式
-# intelligent: 当遇到一页插画，其中所有插画都存在于数据库中，则停止拉取下面几页
+# intelligent: 当遇到一页插画，其中所有插画都存在于数据库中，则停止拉取下面几页；
+#              记录了上次更新的位置时，在该位置停止
 # append     : 拉取指定页数的插画并追加到数据库
 # replace    : 删除原有数据，然后拉取指定页数的插画并追加到数据库
 OverwriteMode = Literal["intelligent", "append", "replace"]
 
+# 合并数据库时，两边都收藏了的插画的收藏页
+# source: 使用源数据库的
+# target: 保留目标数据库的
+# union : 取并集，添加时间取较早的
+PagesPolicy = Literal["source", "target", "union"]
+
 @dataclasses.dataclass
 class IllustBookmarkingConfigRaw:
     did: int  # Database ID
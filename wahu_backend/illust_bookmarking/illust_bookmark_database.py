@@ -3,8 +3,8 @@ import sqlite3
 from pathlib import Path
 from random import getrandbits
 from time import time
-from typing import (AsyncGenerator, AsyncIterable, Callable, Coroutine, Iterable, Optional,
-                    Tuple, Union, AsyncIterable)
+from typing import (AsyncGenerator, AsyncIterable, Awaitable, Callable, Coroutine, Iterable,
+                    Iterator, Optional, Sequence, Tuple, Union, AsyncIterable)
 
 from ..wahu_core.wahu_cli import AsyncGenPipe
 
@@ -12,53 +12,76 @@ from ..aiopixivpy import IllustDetail
 from ..sqlite_tools import ConfigStoredinSqlite, SqliteTableEditor
 from ..sqlite_tools.abc import DependingDatabase
 
-from .ib_datastructure import IllustBookmark, IllustBookmarkingConfig, OverwriteMode
+from .ib_datastructure import (IllustBookmark, IllustBookmarkingConfig, OverwriteMode,
+                               PagesPolicy, SubscriptionMark)
+from .illust_table import IllustTableEditor
+from .ngram_index import NgramIndex
+from .subscription import RateLimiter, Subscription, SubscriptionScheduler
 from .log_adapter import IllustBookmarkDatabaseLogAdapter
 from .logger import logger
 
 
-async def alist_illusts_piped(
-    g: AsyncIterable[list[IllustDetail]],
-    ibd: 'IllustBookmarkDatabase',
-    pipe: AsyncGenPipe,
-    count: int = -1,
-    intelligent: bool = False
-):
+async def fetch_details(
+    iids: Sequence[int],
+    get_detail: Callable[[int], Coroutine[None, None, IllustDetail]],
+    write: Callable[[list[IllustDetail]], Awaitable[None]],
+    concurrency: int = 8,
+    chunk_size: int = 100,
+    pipe: Optional[AsyncGenPipe] = None
+) -> list[int]:
     """
-    将一个 `AsyncIterable` 中元素提取到一个 `list` 中
-    - `:param count:` 提取的最大元素数量, -1 表示耗尽
+    同时至多发出 `concurrency` 个请求获取 `iids` 的详情，每获得 `chunk_size` 条交给 `write` 写入.
+    单个插画获取失败时记录下来并继续；`write` 抛出异常时取消所有请求
+    - `:param write:` 写入并提交一批详情
+    - `:param pipe:` 若提供，则向其输出进度和失败的插画，但不会关闭它
+    - `:return:` 获取失败的插画 ID
     """
-    def add_to(illusts: list[IllustDetail]):
-        ibd.illusts_te.insert(illusts)
-        ibd.bookmarks_te.insert(
-            [IllustBookmark(ilst.iid, list(range(ilst.page_count)), int(time()))
-            for ilst in illusts]
-        )
-        pipe.output('\n'.join([f"{ilst.title} - {ilst.iid}" for ilst in illusts]))
-
-    try:
-        if intelligent:
-            async for item in g:
-                if all((ibd.query_detail(ilst.iid) != None for ilst in item)):
-                    raise StopAsyncIteration
-                add_to(item)
 
-        elif count == -1:
-            async for item in g:
-                add_to(item)
+    pending = iter(iids)
+    buffer: list[IllustDetail] = []
+    failed: list[int] = []
+    written = 0
+
+    async def flush() -> None:
+        nonlocal written
+
+        chunk = buffer.copy()
+        buffer.clear()
+        await write(chunk)
+
+        written += len(chunk)
+        if pipe is not None:
+            pipe.output(f'已写入 {written}/{len(iids)} 条详情\n')
+
+    async def worker() -> None:
+        # 所有 worker 从同一个迭代器中取插画 ID ，因此同时至多有 `concurrency` 个请求
+        for iid in pending:
+            try:
+                buffer.append(await get_detail(iid))
+            except Exception as e:
+                failed.append(iid)
+                logger.warning('fetch_details: 获取 %s 的详情失败: %s' % (iid, e))
+                if pipe is not None:
+                    pipe.output(f'获取 {iid} 的详情失败: {e}\n')
+                continue
+
+            if len(buffer) >= chunk_size:
+                await flush()
+
+    workers = [
+        asyncio.create_task(worker())
+        for _ in range(min(max(concurrency, 1), len(iids)))
+    ]
 
-        else:
-            i = 0
-            async for item in g:
-                add_to(item)
-                i += 1
-                if i == count:
-                    raise StopAsyncIteration
-
-    except StopAsyncIteration:
-        pass
+    try:
+        await asyncio.gather(*workers)
+        if buffer != []:
+            await flush()
     finally:
-        pipe.close()
+        for w in workers:
+            w.cancel()
+
+    return failed
 
 
 class IllustBookmarkDatabase(DependingDatabase):
@@ -76,53 +99,87 @@ class IllustBookmarkDatabase(DependingDatabase):
         )
         return cfg
 
-    illusts_te: SqliteTableEditor[IllustDetail] = SqliteTableEditor('illusts', IllustDetail)
-    bookmarks_te: SqliteTableEditor[IllustBookmark] = SqliteTableEditor('bookmarks', IllustBookmark)
-
-
-    config_table_editor: ConfigStoredinSqlite[IllustBookmarkingConfig] = \
-        ConfigStoredinSqlite(
-            IllustBookmarkingConfig,
-            name='config'
-    )
+    illusts_te: IllustTableEditor
+    bookmarks_te: SqliteTableEditor[IllustBookmark]
+    marks_te: SqliteTableEditor[SubscriptionMark]
+    config_table_editor: ConfigStoredinSqlite[IllustBookmarkingConfig]
 
     def __init__(self, name: str, db_path: Union[str, Path]):
 
         self.name: str = name
         self.db_path: Union[Path, str] = db_path
 
+        # 每个实例持有自己的表编辑器，因为它们绑定在各自的连接上
+        self.illusts_te = IllustTableEditor('illusts')
+        self.bookmarks_te = SqliteTableEditor('bookmarks', IllustBookmark)
+        self.marks_te = SqliteTableEditor('subscription_marks', SubscriptionMark)
+        self.config_table_editor = ConfigStoredinSqlite(
+            IllustBookmarkingConfig,
+            name='config'
+        )
+
         self.config = self.config_table_editor.v
 
+        # 由 `clone` 得到的只读实例共用同一个索引
+        self.ngram_index = NgramIndex()
+
         self.db_con: sqlite3.Connection
 
         self.log_adapter = IllustBookmarkDatabaseLogAdapter(self.name, logger)
 
         self.log_adapter.info('inti: 名称=%s' % name)
 
-    def connect(self) -> None:
-        """连接数据库，并创建所有表，并确保配置被初始化了"""
+    def connect(self, readonly: bool = False) -> None:
+        """
+        连接数据库，并创建所有表，并确保配置被初始化了
+        - `:param readonly:` 只读连接不检查表结构，并拒绝一切写入
+        连接可能被 `DatabaseContextManager` 交给其他线程使用，由它保证同一时间只有一个线程访问
+        """
 
-        self.db_con = sqlite3.connect(self.db_path)
+        self.db_con = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db_con.execute('PRAGMA journal_mode=WAL')
         cur = self.db_con.cursor()
 
         self.illusts_te.bind(cur)
-        self.illusts_te.create_if_not()
-
         self.bookmarks_te.bind(cur)
-        self.bookmarks_te.create_if_not()
-
+        self.marks_te.bind(cur)
         self.config_table_editor.bind(cur)
+
+        if readonly:
+            self.db_con.execute('PRAGMA query_only=ON')
+            return
+
+        self.illusts_te.create_if_not()
+        self.bookmarks_te.create_if_not()
+        self.marks_te.create_if_not()
         self.config_table_editor.create_if_not()
 
         if self.config_table_editor.empty:
             self.config_table_editor.insert([self.get_default_config()])
 
+        self.db_con.commit()
+
+    def clone(self) -> 'IllustBookmarkDatabase':
+        cloned = type(self)(self.name, self.db_path)
+        cloned.ngram_index = self.ngram_index
+        return cloned
+
     def close(self, commit: bool=True) -> None:
 
         if commit:
-            self.db_con.commit()
+            self.commit()
+        else:
+            self.illusts_te.staged = []
         self.db_con.close()
 
+    def commit(self) -> None:
+        self.db_con.commit()
+        self.ngram_index.apply(self.illusts_te.take_staged())
+
+    def rollback(self) -> None:
+        self.db_con.rollback()
+        self.illusts_te.staged = []
+
     def _del(self, iid: int) -> Tuple[bool, bool]:
         """
         删除 `iid` 的详情和收藏信息
@@ -187,43 +244,65 @@ class IllustBookmarkDatabase(DependingDatabase):
 
         return flag1, flag2
 
+    def stale_detail_iids(self, max_age: Optional[float] = None) -> list[int]:
+        """
+        收藏了的插画中，详情缺失或过旧的插画 ID ，按 ID 排序.
+        用一条 `LEFT JOIN` 查询，而不是对每个收藏查询一次
+        - `:param max_age:` 写入超过 `max_age` 秒，或写入时间未知的详情视为过旧；
+                            `None` 表示只返回缺失详情的插画
+        """
+
+        sql = (f'SELECT b.iid FROM {self.bookmarks_te.name} b '
+               f'LEFT JOIN {self.illusts_te.name} i ON i.iid=b.iid '
+               'WHERE i.iid IS NULL')
+        params: tuple[float, ...] = ()
+
+        if max_age is not None:
+            sql += ' OR i.fetched_at IS NULL OR i.fetched_at <= ?'
+            params = (time() - max_age, )
+
+        return [iid for iid, in self.bookmarks_te.cursor.execute(
+            sql + ' ORDER BY b.iid', params).fetchall()]
+
     async def update_detail(
         self,
         get_detail: Callable[[int], Coroutine[None, None, IllustDetail]],
-        update_all: bool = False
-    ) -> None:
+        update_all: bool = False,
+        concurrency: int = 8,
+        chunk_size: int = 100,
+        pipe: Optional[AsyncGenPipe] = None
+    ) -> tuple[int, list[int]]:
         """
-        更新插画详情. 通过 `get_detail` 获得所有 `bookmarks` 表中出现的插画 ID 的详情
+        更新插画详情. 通过 `get_detail` 获得所有 `bookmarks` 表中出现的插画 ID 的详情，
+        每获得 `chunk_size` 条就写入并提交一次
         - `:param get_detail:` 获取插画详情的方法
-        - `:param update_all:` 若设置为假，仅 `illusts` 表中未出现的插画会被更新
+        - `:param update_all:` 若设置为假，仅 `illusts` 表中未出现的插画会被更新，
+                               因此中断后再次调用会从未完成的插画继续
+        - `:param concurrency:` `fetch_details` 的并发数
+        - `:param pipe:` 若提供，则向其输出进度
+        - `:return:` `(更新了的详情数, 获取失败的插画 ID)`
         """
 
-        to_update_iids: Iterable[int] = list(zip(
-            *self.bookmarks_te.select_cols(cols=['iid'])))[0]
+        to_update_iids = self.stale_detail_iids(0 if update_all else None)
+        self.log_adapter.info('update_detail: 尝试更新 %s 条详情' % len(to_update_iids))
 
-        if not update_all:
-            to_update_iids = filter(
-                lambda iid: not self.illusts_te.has(iid),
-                to_update_iids
-            )
+        async def write(details: list[IllustDetail]) -> None:
+            self.illusts_te.insert(details)
+            self.commit()
 
-        to_update_iids = list(to_update_iids)
-        self.log_adapter.info('update_detail: 尝试更新 ID %s 的详情' % to_update_iids)
+        failed = await fetch_details(
+            to_update_iids, get_detail, write, concurrency, chunk_size, pipe)
 
-        coro_list = [
-            get_detail(iid) for iid in to_update_iids
-        ]
-
-        detail_list = await asyncio.gather(*coro_list)
-
-        self.illusts_te.insert(detail_list)
+        return len(to_update_iids) - len(failed), failed
 
     async def update_subscrip(
         self,
         get_user_illusts: Callable[[int], AsyncGenerator[list[IllustDetail], None]],
         get_user_bookmarks: Callable[[int], AsyncGenerator[list[IllustDetail], None]],
         overwrite: Optional[OverwriteMode] = None,
-        page_num: Optional[int] = None
+        page_num: Optional[int] = None,
+        concurrency: int = 4,
+        rate: float = 0
     ) -> tuple[Coroutine[None, None, None], AsyncGenPipe]:
         """
         更新订阅的用户作品和用户收藏
@@ -231,7 +310,11 @@ class IllustBookmarkDatabase(DependingDatabase):
         - `:param get_user_bookmarks:` 获取用户收藏的方法
         - `:delete:` 是否清空以前的记录
         - `:page_num:` 对于每一条订阅，更新的页数. 若提供了，则 `delete` 无效
-        每个插画的所有的页都将被收藏
+        - `:param concurrency:` 同时请求的页数
+        - `:param rate:` 所有订阅加起来每秒至多请求的页数，不大于 0 时不限制
+        每个插画的所有的页都将被收藏. 订阅由 `SubscriptionScheduler` 轮流更新，
+        返回的协程结束时关闭管道.
+        `intelligent` 模式下不限制页数，每条订阅在上次更新到的位置停止；其他模式只记录位置
         """
 
         pipe = AsyncGenPipe()
@@ -250,28 +333,33 @@ class IllustBookmarkDatabase(DependingDatabase):
 
             self.illusts_te.delete()
             self.bookmarks_te.delete()
-        
+            self.marks_te.delete()
+
+        intelligent = overwrite == "intelligent"
+        scheduler = SubscriptionScheduler(
+            self, pipe, RateLimiter(rate), concurrency,
+            page_num=-1 if intelligent else page_num,
+            intelligent=intelligent,
+            marks=self.subscription_marks() if intelligent else None)
+
         async def coro():
-            assert page_num != None
-            coro_list = [
-                *(
-                    alist_illusts_piped(
-                        get_user_illusts(uid),
-                        self, pipe, page_num, intelligent=overwrite == "intelligent")
-                    for uid in cfg.subscribed_user_uid
-                ),
-                *(
-                    alist_illusts_piped(
-                        get_user_bookmarks(uid),
-                        self, pipe, page_num, intelligent=overwrite == "intelligent")
-                    for uid in cfg.subscribed_bookmark_uid
-                )
-            ]
-
-            await asyncio.gather(*coro_list)
+            try:
+                await scheduler.run([
+                    *(Subscription(f'用户 {uid} 的作品', get_user_illusts(uid), f'user:{uid}')
+                      for uid in cfg.subscribed_user_uid),
+                    *(Subscription(f'用户 {uid} 的收藏', get_user_bookmarks(uid), f'bookmark:{uid}')
+                      for uid in cfg.subscribed_bookmark_uid)
+                ])
+            finally:
+                pipe.close()
 
         return (coro(), pipe)
 
+    def subscription_marks(self) -> dict[str, SubscriptionMark]:
+        """每条订阅上次更新到的位置"""
+
+        return {m.key: m for m in self.marks_te.select()}
+
     def query_detail(self, iid: int) -> Optional[IllustDetail]:
         """在数据库中查询 `iid` 的详情，若无则返回 `None`"""
 
@@ -297,12 +385,123 @@ class IllustBookmarkDatabase(DependingDatabase):
 
         return self.illusts_te.select()
 
-    def all_bookmarks(self) -> list[IllustBookmark]:
-        """读出所有收藏，按添加时间排序"""
+    def all_bookmarks(
+        self, limit: Optional[int] = None, offset: Optional[int] = None
+    ) -> list[IllustBookmark]:
+        """
+        读出所有收藏，按添加时间由新到旧排序
+        - `:param limit:` 至多读出的条数
+        - `:param offset:` 跳过最新的若干条
+        """
+
+        return self.bookmarks_te.select(
+            order_by='add_timestamp', desc=True, limit=limit, offset=offset)
+
+    def illust_count(self) -> int:
+        """储存了的详情的数量"""
+
+        return self.illusts_te.count()
+
+    def bookmark_count(self) -> int:
+        """收藏的数量"""
+
+        return self.bookmarks_te.count()
+
+    def iter_illusts(self, batch_size: int = 500) -> Iterator[IllustDetail]:
+        """逐个读出插画详情，每次从 sqlite 取 `batch_size` 条"""
+
+        return self.illusts_te.select_iter(batch_size)
+
+    def iter_bookmarks(self, batch_size: int = 500) -> Iterator[IllustBookmark]:
+        """逐个读出收藏，不保证顺序"""
+
+        return self.bookmarks_te.select_iter(batch_size)
+
+    def insert_batches(
+        self, batches: Iterable[tuple[list[IllustDetail], list[IllustBookmark]]]
+    ) -> tuple[int, int]:
+        """
+        逐批写入 `(详情, 收藏)` ，每批提交一次；出错时回滚当前批次，已提交的批次保留
+        - `:return:` `(写入的详情数, 写入的收藏数)`
+        """
+
+        num_illusts = num_bookmarks = 0
+
+        for illusts, bookmarks in batches:
+            try:
+                self.illusts_te.insert(illusts)
+                self.bookmarks_te.insert(bookmarks)
+                self.commit()
+            except BaseException:
+                self.rollback()
+                raise
+
+            num_illusts += len(illusts)
+            num_bookmarks += len(bookmarks)
+
+        return num_illusts, num_bookmarks
+
+    def bookmarks_page(
+        self, after: Optional[Sequence[int]] = None, limit: int = 100
+    ) -> tuple[list[IllustBookmark], Optional[list[int]]]:
+        """
+        按添加时间由新到旧分页读出收藏
+        - `:param after:` 上一页返回的分页键， `None` 代表第一页
+        - `:return:` `(本页的收藏, 下一页的分页键)` ，已经是最后一页则分页键为 `None`
+        """
 
-        bms = self.bookmarks_te.select()
-        bms.sort(key=lambda ilst: ilst.add_timestamp, reverse=True)
-        return bms
+        bms = self.bookmarks_te.select_page(
+            after, limit, order_by='add_timestamp', desc=True)
+
+        if len(bms) < limit:
+            return bms, None
+
+        return bms, list(self.bookmarks_te.page_key(bms[-1], 'add_timestamp'))
+
+    def merge_from(
+        self,
+        db_path: Union[str, Path],
+        iids: Optional[list[int]] = None,
+        pages: PagesPolicy = 'source'
+    ) -> tuple[int, int]:
+        """
+        用 `ATTACH` 把 `db_path` 中的收藏和详情复制到本数据库并提交，行在 sqlite 内复制，不经过 Python
+        - `:param iids:` 只复制这些插画， `None` 表示合并整个数据库
+        - `:param pages:` 两边都收藏了的插画的处理，见 `PagesPolicy` ；详情总是使用源数据库的
+        - `:return:` `(复制的详情数, 复制的收藏数)`
+        """
+
+        bm_table = self.bookmarks_te.name
+
+        if pages == 'source':
+            conflict_action = None
+        elif pages == 'target':
+            conflict_action = 'DO NOTHING'
+        else:
+            conflict_action = (
+                f'DO UPDATE SET pages=(SELECT json_group_array(value) FROM ('
+                f'SELECT value FROM json_each({bm_table}.pages) '
+                f'UNION SELECT value FROM json_each(excluded.pages) ORDER BY value)), '
+                f'add_timestamp=min({bm_table}.add_timestamp, excluded.add_timestamp)')
+
+        # ATTACH 和 DETACH 不能在事务中进行
+        self.commit()
+        self.db_con.execute('ATTACH DATABASE ? AS merge_src', (str(db_path), ))
+
+        try:
+            num_illusts = self.illusts_te.copy_from('merge_src', iids)
+            num_bookmarks = self.bookmarks_te.copy_from('merge_src', iids, conflict_action)
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            self.db_con.execute('DETACH DATABASE merge_src')
+
+        self.log_adapter.info('merge_from: 从 %s 复制了 %s 条详情， %s 条收藏'
+                              % (db_path, num_illusts, num_bookmarks))
+
+        return num_illusts, num_bookmarks
 
     def filter_restricted(self) -> list[int]:
         """过滤出已被作者删除的插画"""
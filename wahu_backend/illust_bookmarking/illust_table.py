@@ -0,0 +1,377 @@
+"""
+插画详情表的编辑器
+详情中的标签和作者以 JSON 保存，无法直接在 SQL 中筛选或计数，因此额外维护
+- `illust_tags(iid, tag_name)` 每个插画的每个标签一行
+- `tags(name, translated)` 标签及其翻译
+- `illusts.user_uid` 由 `user` 列生成的虚拟列
+- `illusts.fetched_at` 详情写入的时间，用于找出需要刷新的详情
+- `illusts_fts2` 可选的 FTS5 trigram 全文索引，保存经过 `fuzzy_bound.normalize` 处理的内容，
+  用于为模糊查询预先筛选候选
+并为它们建立索引
+"""
+
+import itertools
+import sqlite3
+from time import time
+from typing import Any, Iterable, Literal, Optional, Union
+
+from ..aiopixivpy import IllustDetail
+from ..aiopixivpy.datastructure_illust import (IllustTag, PixivUserSummery,
+                                               PixivUserSummeryAdapter)
+from ..sqlite_tools import SqliteTableEditor
+from . import ngram_index
+from .fuzzy_bound import min_shared_qgrams, normalize, normalize_keyword, qgrams
+from .ngram_index import IndexChange
+
+ILLUST_TAGS_TABLE = 'illust_tags'
+TAGS_TABLE = 'tags'
+FTS_TABLE = 'illusts_fts2'
+# 旧版本中保存原始内容的全文索引，连接时删除
+LEGACY_FTS_TABLES = ('illusts_fts', )
+# 在 SQL 中使用的 `normalize`
+NORMALIZE_FUNCTION = 'wahu_fuzzy_normalize'
+
+# 全文索引中的字段，及其对应的 `illusts` 表的列
+FtsField = Literal['title', 'caption', 'username', 'tags']
+FTS_FIELD_COLUMNS: dict[str, str] = {
+    'title': 'title',
+    'caption': 'caption',
+    'username': 'user',
+    'tags': 'tags'
+}
+
+# 是否维护全文索引
+FULLTEXT_INDEX: bool = True
+
+
+def set_fulltext_index(enabled: bool) -> None:
+    """全局设置是否维护全文索引；关闭时，已有的全文索引会在下一次连接时删除"""
+
+    global FULLTEXT_INDEX
+    FULLTEXT_INDEX = enabled
+
+
+def fts_usable(keyword: str, cutoff: int) -> bool:
+    """
+    判断全文索引的筛选结果是否包含所有可能的匹配，即达到 `cutoff` 的片段一定含有关键词的某个 trigram ，
+    证明见 `fuzzy_bound` . 默认的分数线 80 下不成立，此时应当遍历全表
+    """
+
+    return min_shared_qgrams(keyword, cutoff, 3) is not None
+
+
+def _normalize_sql(s: Optional[str]) -> Optional[str]:
+    return None if s is None else normalize(s)
+
+
+def _fts_row(ilst: IllustDetail) -> tuple[int, str, str, str, str]:
+    return (
+        ilst.iid, normalize(ilst.title), normalize(ilst.caption), normalize(ilst.user.name),
+        ' '.join(map(normalize, itertools.chain(
+            (tag.name for tag in ilst.tags),
+            (tag.translated for tag in ilst.tags if tag.translated is not None))))
+    )
+
+
+class IllustTableEditor(SqliteTableEditor[IllustDetail]):
+    """
+    `illusts` 表的编辑器. 通过 `insert` 和 `delete` 写入时，同步更新标签表；
+    `user_uid` 列由 sqlite 根据 `user` 列计算， `fetched_at` 列记录写入的时间.
+    启用内存索引时，还会把写入记录在 `staged` 中，由数据库在提交时应用到索引上
+    """
+
+    __slots__ = ('staged', )
+
+    def __init__(self, name: str = 'illusts') -> None:
+        super().__init__(name, IllustDetail)
+
+        self.staged: list[IndexChange] = []
+
+    def take_staged(self) -> list[IndexChange]:
+        """取出并清空记录的写入"""
+
+        staged, self.staged = self.staged, []
+        return staged
+
+    def create(self) -> None:
+        super().create()
+        self._create_derived()
+
+    def create_if_not(self) -> None:
+        """
+        懒创建. 对于旧版本的数据库，补上标签表、全文索引和 `user_uid` 列，并从已有的详情填充；
+        补上的 `fetched_at` 列为空，这些详情被视为需要刷新
+        """
+        if not self.has_created():
+            self.create()
+            return
+
+        self.create_indexes()
+
+        had_tags = self._table_exists(ILLUST_TAGS_TABLE)
+        had_fts = self.has_fts()
+
+        self._create_derived()
+
+        if not had_tags:
+            self._sync_tags(self.select_cols(cols=['iid', 'tags']))
+
+        for legacy in LEGACY_FTS_TABLES:
+            self.cursor.execute(f'DROP TABLE IF EXISTS {legacy}')
+
+        if not FULLTEXT_INDEX:
+            self.cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif not had_fts and self.has_fts():
+            self._sync_fts(self.select_iter())
+
+    def _table_exists(self, name: str) -> bool:
+        return self.cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+            (name, )).fetchone() is not None
+
+    def _has_column(self, name: str) -> bool:
+        return any(r[1] == name for r in self.cursor.execute(
+            f'PRAGMA table_xinfo({self.name})'))
+
+    def _add_user_uid(self) -> None:
+        # `PixivUserSummeryAdapter` 将作者保存为 JSON 元组，第二项是 uid
+        self.cursor.execute(
+            f'ALTER TABLE {self.name} ADD COLUMN user_uid INTEGER '
+            "GENERATED ALWAYS AS (json_extract(user, '$[1]')) VIRTUAL")
+        self.cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.name}_user_uid '
+            f'ON {self.name} (user_uid)')
+
+    def _create_derived(self) -> None:
+
+        if not self._has_column('user_uid'):
+            self._add_user_uid()
+
+        if not self._has_column('fetched_at'):
+            self.cursor.execute(f'ALTER TABLE {self.name} ADD COLUMN fetched_at INTEGER')
+
+        self.cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {ILLUST_TAGS_TABLE} '
+            '(iid INTEGER, tag_name TEXT, PRIMARY KEY (iid, tag_name)) WITHOUT ROWID')
+        self.cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {ILLUST_TAGS_TABLE}_tag_name '
+            f'ON {ILLUST_TAGS_TABLE} (tag_name)')
+        self.cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {TAGS_TABLE} '
+            '(name TEXT PRIMARY KEY, translated TEXT)')
+
+        if FULLTEXT_INDEX:
+            self._create_fts()
+
+    def _create_fts(self) -> bool:
+        """创建全文索引，sqlite 不支持 FTS5 或 trigram 分词器时返回 `False`"""
+
+        try:
+            self.cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING '
+                f"fts5({','.join(FTS_FIELD_COLUMNS.keys())}, tokenize='trigram')")
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def has_fts(self) -> bool:
+        """是否存在全文索引"""
+
+        return self._table_exists(FTS_TABLE)
+
+    def _sync_fts(self, rows: Iterable[IllustDetail]) -> None:
+
+        fts_rows = list(map(_fts_row, rows))
+
+        self.cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid=?',
+            ((r[0], ) for r in fts_rows))
+        self.cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid,{",".join(FTS_FIELD_COLUMNS.keys())}) '
+            'VALUES (?,?,?,?,?)',
+            fts_rows)
+
+    def _sync_tags(self, iid_tags: Iterable[tuple[int, list[IllustTag]]]) -> None:
+        """用 `iid_tags` 覆盖这些插画在标签表中的记录"""
+
+        iid_tags = list(iid_tags)
+
+        self.cursor.executemany(
+            f'DELETE FROM {ILLUST_TAGS_TABLE} WHERE iid=?',
+            ((iid, ) for iid, _ in iid_tags))
+        self.cursor.executemany(
+            f'INSERT OR IGNORE INTO {ILLUST_TAGS_TABLE} VALUES (?,?)',
+            ((iid, tag.name) for iid, tags in iid_tags for tag in tags))
+        # 已有的翻译不会被空翻译覆盖
+        self.cursor.executemany(
+            f'INSERT INTO {TAGS_TABLE} VALUES (?,?) ON CONFLICT(name) '
+            f'DO UPDATE SET translated=coalesce(excluded.translated, {TAGS_TABLE}.translated)',
+            ((tag.name, tag.translated)
+             for tag in itertools.chain(*(tags for _, tags in iid_tags))))
+
+    def insert(self, rows: Iterable[IllustDetail]) -> list[bool]:
+        rows = list(rows)
+        result = super().insert(rows)
+        now = int(time())
+        self.cursor.executemany(
+            f'UPDATE {self.name} SET fetched_at=? WHERE iid=?',
+            ((now, ilst.iid) for ilst in rows))
+        self._sync_tags((ilst.iid, ilst.tags) for ilst in rows)
+        if self.has_fts():
+            self._sync_fts(rows)
+        if ngram_index.MEMORY_INDEX:
+            self.staged.append(IndexChange('add', illusts=tuple(rows)))
+        return result
+
+    def delete(self, index_val_iter: Optional[Iterable[Union[str, int]]] = None) -> None:
+        has_fts = self.has_fts()
+
+        if index_val_iter is None:
+            super().delete()
+            self.cursor.execute(f'DELETE FROM {ILLUST_TAGS_TABLE}')
+            if has_fts:
+                self.cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            if ngram_index.MEMORY_INDEX:
+                self.staged.append(IndexChange('clear'))
+        else:
+            index_vals = list(index_val_iter)
+            super().delete(index_vals)
+            self.cursor.executemany(
+                f'DELETE FROM {ILLUST_TAGS_TABLE} WHERE iid=?', zip(index_vals))
+            if has_fts:
+                self.cursor.executemany(
+                    f'DELETE FROM {FTS_TABLE} WHERE rowid=?', zip(index_vals))
+            if ngram_index.MEMORY_INDEX:
+                self.staged.append(IndexChange('remove', iids=tuple(index_vals)))
+
+    def copy_from(
+        self,
+        schema: str,
+        index_vals: Optional[Iterable[Union[str, int]]] = None,
+        conflict_action: Optional[str] = None
+    ) -> int:
+        """
+        从 `ATTACH` 的数据库 `schema` 复制详情，并用 sqlite 的 JSON 函数同步标签表和全文索引，
+        不在 Python 中解码. 只有启用内存索引时，才需要读出复制的详情交给索引
+        """
+
+        if index_vals is not None:
+            index_vals = list(index_vals)
+
+        num = super().copy_from(schema, index_vals, conflict_action)
+
+        where_string, params = self._index_in(index_vals, alias='s.')
+        src = f'{schema}.{self.name} s'
+
+        # 源数据库可能是没有 `fetched_at` 列的旧版本，此时这些详情被视为需要刷新
+        if any(r[1] == 'fetched_at' for r in self.cursor.execute(
+                f'PRAGMA {schema}.table_xinfo({self.name})')):
+            self.cursor.execute(
+                f'UPDATE {self.name} SET fetched_at=('
+                f'SELECT s.fetched_at FROM {src} WHERE s.iid={self.name}.iid) '
+                f'WHERE iid IN (SELECT s.iid FROM {src} WHERE {where_string})',
+                params)
+
+        self.cursor.execute(
+            f'DELETE FROM {ILLUST_TAGS_TABLE} '
+            f'WHERE iid IN (SELECT s.iid FROM {src} WHERE {where_string})',
+            params)
+        self.cursor.execute(
+            f'INSERT OR IGNORE INTO {ILLUST_TAGS_TABLE} '
+            f"SELECT s.iid, json_extract(t.value, '$[0]') FROM {src}, json_each(s.tags) t "
+            f'WHERE {where_string}',
+            params)
+        self.cursor.execute(
+            f'INSERT INTO {TAGS_TABLE} '
+            f"SELECT json_extract(t.value, '$[0]'), json_extract(t.value, '$[1]') "
+            f'FROM {src}, json_each(s.tags) t WHERE {where_string} '
+            f'ON CONFLICT(name) '
+            f'DO UPDATE SET translated=coalesce(excluded.translated, {TAGS_TABLE}.translated)',
+            params)
+
+        if self.has_fts():
+            self.cursor.connection.create_function(
+                NORMALIZE_FUNCTION, 1, _normalize_sql, deterministic=True)
+            self.cursor.execute(
+                f'DELETE FROM {FTS_TABLE} '
+                f'WHERE rowid IN (SELECT s.iid FROM {src} WHERE {where_string})',
+                params)
+            # 与 `_fts_row` 一致：标签名在前，翻译在后，以空格分隔
+            self.cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid,{",".join(FTS_FIELD_COLUMNS.keys())}) '
+                f"SELECT s.iid, {NORMALIZE_FUNCTION}(s.title), {NORMALIZE_FUNCTION}(s.caption), "
+                f"{NORMALIZE_FUNCTION}(json_extract(s.user, '$[3]')), "
+                f"(SELECT group_concat({NORMALIZE_FUNCTION}(v), ' ') FROM ("
+                "SELECT json_extract(value, '$[0]') AS v FROM json_each(s.tags) "
+                "UNION ALL SELECT json_extract(value, '$[1]') FROM json_each(s.tags))) "
+                f'FROM {src} WHERE {where_string}',
+                params)
+
+        if ngram_index.MEMORY_INDEX:
+            where_string, params = self._index_in(index_vals)
+            self.staged.append(IndexChange('add', illusts=tuple(map(
+                self.codec.decode, self.cursor.execute(
+                    f'SELECT {self._heads_string} FROM {self.name} WHERE {where_string}',
+                    params).fetchall()))))
+
+        return num
+
+    def fts_candidates(
+        self, field: FtsField, keyword: str, cutoff: int
+    ) -> Optional[list[tuple[int, Any]]]:
+        """
+        用全文索引筛选出 `field` 中含有 `normalize_keyword(keyword)` 的任意一个 trigram 的插画
+        - `:return:` `(iid, 对应列的值)` 的列表；
+                     未启用全文索引，或者 `fts_usable` 为假时返回 `None` ，此时应当遍历全表
+        """
+
+        if not fts_usable(keyword, cutoff) or not self.has_fts():
+            return None
+
+        trigrams = set(qgrams(normalize_keyword(keyword), 3))  # type: ignore
+        match_string = ' OR '.join('"' + t.replace('"', '""') + '"' for t in trigrams)
+        col = FTS_FIELD_COLUMNS[field]
+
+        db_ret = self.cursor.execute(
+            f'SELECT i.iid, i.{col} FROM {FTS_TABLE} f '
+            f'JOIN {self.name} i ON i.iid=f.rowid '
+            f'WHERE f.{field} MATCH ?',
+            (match_string, )).fetchall()
+
+        return list(map(self.codec.cols_decoder(['iid', col]), db_ret))
+
+    def iids_of_user(self, uid: int) -> list[int]:
+        """作者为 `uid` 的插画"""
+
+        return [r[0] for r in self.cursor.execute(
+            f'SELECT iid FROM {self.name} WHERE user_uid=?', (uid, ))]
+
+    def tag_count(self, num: Optional[int] = None) -> list[tuple[IllustTag, int]]:
+        """
+        统计每个标签出现的插画数，由多到少排序
+        - `:param num:` 至多返回的标签数
+        """
+
+        return [
+            (IllustTag(name, translated), cnt)
+            for name, translated, cnt in self.cursor.execute(
+                f'SELECT it.tag_name, t.translated, COUNT(*) AS cnt '
+                f'FROM {ILLUST_TAGS_TABLE} it '
+                f'LEFT JOIN {TAGS_TABLE} t ON it.tag_name=t.name '
+                'GROUP BY it.tag_name ORDER BY cnt DESC LIMIT ?',
+                (-1 if num is None else num, ))
+        ]
+
+    def user_count(self, num: Optional[int] = None) -> list[tuple[PixivUserSummery, int]]:
+        """
+        统计每个作者的插画数，由多到少排序
+        - `:param num:` 至多返回的作者数
+        """
+
+        return [
+            (PixivUserSummeryAdapter.deserialized(user), cnt)
+            for user, cnt in self.cursor.execute(
+                f'SELECT user, COUNT(*) AS cnt FROM {self.name} '
+                'GROUP BY user_uid ORDER BY cnt DESC LIMIT ?',
+                (-1 if num is None else num, ))
+        ]
@@ -5,6 +5,8 @@ from fuzzywuzzy import process as fwp
 
 from ..aiopixivpy.datastructure_illust import IllustTag
 from .illust_bookmark_database import IllustBookmarkDatabase
+from . import ngram_index
+from .illust_table import FTS_FIELD_COLUMNS, FtsField
 
 
 class ItemToMatch(NamedTuple):
@@ -51,55 +53,56 @@ def match_keyword(items: list[ItemToMatch], keyword: str, cutoff: int
 
 class IllustBookmarkDatabaseQueryMixin(IllustBookmarkDatabase):
 
-    def query_title(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
-        items = [
-            ItemToMatch(iid, title)
-            for iid, title in self.illusts_te.select_cols(
-                cols=['iid', 'title']
+    def _items(
+        self, field: FtsField, keyword: str, cutoff: int
+    ) -> list[ItemToMatch]:
+        """
+        读出需要进行模糊匹配的内容.
+        启用内存索引时从中筛选；否则能用全文索引筛选时只读出候选，不能时读出全表
+        """
+
+        if ngram_index.MEMORY_INDEX:
+            self.ngram_index.build(self.illusts_te.select_iter)
+            return [
+                ItemToMatch(iid, content)
+                for iid, content in self.ngram_index.candidates(field, keyword, cutoff)
+            ]
+
+        ret = self.illusts_te.fts_candidates(field, keyword, cutoff)
+
+        if ret is None:
+            ret = self.illusts_te.select_cols(
+                cols=['iid', FTS_FIELD_COLUMNS[field]]
             )
-        ]
 
-        return match_keyword(items, keyword, cutoff=cutoff)
+        if field == 'username':
+            return [ItemToMatch(iid, user.name) for iid, user in ret]
 
-    def query_caption(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
-        items = [
-            ItemToMatch(iid, caption)
-            for iid, caption in self.illusts_te.select_cols(
-                cols=['iid', 'caption']
-            )
-        ]
+        elif field == 'tags':
+            return [
+                ItemToMatch(
+                    iid,
+                    [tag.name for tag in tags] + \
+                        [tag.translated
+                        for tag in tags if tag.translated is not None]
+                )
+                for iid, tags in ret
+            ]
 
-        return match_keyword(items, keyword, cutoff=cutoff)
+        return [ItemToMatch(iid, content) for iid, content in ret]
 
-    def query_username(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
-        items = [
-            ItemToMatch(iid, user.name)
-            for iid, user in self.illusts_te.select_cols(
-                cols=['iid', 'user']
-            )
-        ]
+    def query_title(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
+        return match_keyword(self._items('title', keyword, cutoff), keyword, cutoff=cutoff)
+
+    def query_caption(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
+        return match_keyword(self._items('caption', keyword, cutoff), keyword, cutoff=cutoff)
 
-        return match_keyword(items, keyword, cutoff=cutoff)
+    def query_username(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
+        return match_keyword(self._items('username', keyword, cutoff), keyword, cutoff=cutoff)
 
     def query_tag(self, keyword: str, cutoff: int=80) -> list[MatchResult]:
-        items = [
-            ItemToMatch(
-                iid,
-                [tag.name for tag in tags] + \
-                    [tag.translated
-                    for tag in tags if tag.translated is not None]
-            )
-            for iid, tags in self.illusts_te.select_cols(
-                cols=['iid', 'tags']
-            )
-        ]
-
-        return match_keyword(items, keyword, cutoff=cutoff)
+        return match_keyword(self._items('tags', keyword, cutoff), keyword, cutoff=cutoff)
 
     def query_uid(self, uid: int) -> list[int]:
-        items = self.illusts_te.select_cols(
-            cols=['iid', 'user']
-        )
-
-        return [iid for iid, user in items if user.uid == uid]
+        return self.illusts_te.iids_of_user(uid)
 
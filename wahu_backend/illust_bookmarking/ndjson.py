@@ -0,0 +1,190 @@
+"""
+以 NDJSON 格式导出与导入插画数据库，任何时候内存中只有一行或一批
+- 每行是一个对象： `{"illust": <IllustDetail>}` 或 `{"bookmark": <IllustBookmark>}`
+- 先输出所有详情，再输出所有收藏
+"""
+
+import dataclasses
+import json
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Literal, Optional, TextIO, Union
+
+from ..aiopixivpy import IllustDetail, IllustTag, PixivUserSummery
+from .ib_datastructure import IllustBookmark
+
+if TYPE_CHECKING:
+    from .illust_bookmark_database import IllustBookmarkDatabase
+
+Row = Union[IllustDetail, IllustBookmark]
+
+
+class NdjsonError(ValueError):
+    """不合法的行"""
+
+
+def dump_line(row: Row) -> str:
+    """将一个详情或收藏编码为一行，包括末尾的换行符"""
+
+    key = 'illust' if isinstance(row, IllustDetail) else 'bookmark'
+    return json.dumps({key: dataclasses.asdict(row)}, ensure_ascii=False) + '\n'
+
+
+def illust_from_dict(d: dict[str, Any]) -> IllustDetail:
+    """
+    由 `dataclasses.asdict` 得到的字典还原详情，不修改 `d`.
+    `tags` 中的标签可以是对象或 `[name, translated]`
+    - `:raise:` 字典不合法时抛出 `TypeError` 、 `KeyError` 或 `ValueError`
+    """
+
+    return IllustDetail(**{
+        **d,
+        'user': PixivUserSummery(**d['user']),
+        'tags': [
+            IllustTag(**t) if isinstance(t, dict) else IllustTag(*t)
+            for t in d['tags']
+        ]
+    })
+
+
+def parse_line(line: str) -> Row:
+    """解码一行，不合法时抛出 `NdjsonError`"""
+
+    try:
+        d = json.loads(line)
+
+        if 'illust' in d:
+            return illust_from_dict(d['illust'])
+
+        return IllustBookmark(**d['bookmark'])
+
+    except (TypeError, KeyError, ValueError) as e:
+        raise NdjsonError(f'不合法的行: {line[:100]}') from e
+
+
+def dump_ndjson(ibd: 'IllustBookmarkDatabase', batch_size: int = 500) -> Iterator[str]:
+    """逐行导出数据库"""
+
+    for ilst in ibd.iter_illusts(batch_size):
+        yield dump_line(ilst)
+    for bm in ibd.iter_bookmarks(batch_size):
+        yield dump_line(bm)
+
+
+def dump_chunks(
+    ibd: 'IllustBookmarkDatabase', chunk_lines: int = 500
+) -> Iterator[str]:
+    """逐块导出数据库，每块 `chunk_lines` 行"""
+
+    chunk: list[str] = []
+
+    for line in dump_ndjson(ibd, chunk_lines):
+        chunk.append(line)
+        if len(chunk) >= chunk_lines:
+            yield ''.join(chunk)
+            chunk = []
+
+    if chunk != []:
+        yield ''.join(chunk)
+
+
+class NdjsonDecoder:
+    """
+    把任意切分的文本块拼成行并解码，成批取出
+    - `:param batch_size:` `feed` 取出的每批行数
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+        self._partial = ''
+        self._illusts: list[IllustDetail] = []
+        self._bookmarks: list[IllustBookmark] = []
+
+    def _push(self, line: str) -> None:
+        if line.strip() == '':
+            return
+
+        row = parse_line(line)
+        if isinstance(row, IllustDetail):
+            self._illusts.append(row)
+        else:
+            self._bookmarks.append(row)
+
+    def _take(self) -> tuple[list[IllustDetail], list[IllustBookmark]]:
+        batch = self._illusts, self._bookmarks
+        self._illusts, self._bookmarks = [], []
+        return batch
+
+    def feed(self, text: str) -> Iterator[tuple[list[IllustDetail], list[IllustBookmark]]]:
+        """输入一块文本，返回攒满了的批次 `(详情, 收藏)`"""
+
+        lines = (self._partial + text).split('\n')
+        # 最后一段可能是不完整的行
+        self._partial = lines.pop()
+
+        for line in lines:
+            self._push(line)
+            if len(self._illusts) + len(self._bookmarks) >= self.batch_size:
+                yield self._take()
+
+    def finish(self) -> tuple[list[IllustDetail], list[IllustBookmark]]:
+        """输入结束，返回剩下的批次"""
+
+        self._push(self._partial)
+        self._partial = ''
+        return self._take()
+
+
+def write_ndjson(ibd: 'IllustBookmarkDatabase', f: TextIO, chunk_lines: int = 500) -> None:
+    """将数据库导出到文件 `f`"""
+
+    for chunk in dump_chunks(ibd, chunk_lines):
+        f.write(chunk)
+
+
+def load_ndjson(
+    ibd: 'IllustBookmarkDatabase',
+    chunks: Iterable[str],
+    batch_size: int = 1000
+) -> tuple[int, int]:
+    """
+    将文本块 `chunks` 导入数据库，每批 `batch_size` 行提交一次；出错时回滚当前批次，已提交的批次保留
+    - `:param chunks:` 可以直接传入打开的文件，逐行读出
+    - `:return:` `(导入的详情数, 导入的收藏数)`
+    """
+
+    decoder = NdjsonDecoder(batch_size)
+
+    def batches() -> Iterator[tuple[list[IllustDetail], list[IllustBookmark]]]:
+        for chunk in chunks:
+            yield from decoder.feed(chunk)
+        yield decoder.finish()
+
+    return ibd.insert_batches(batches())
+
+
+# `dump_page` 的导出位置： `(正在导出的表, 上一块最后一行的 iid)`
+ExportCursor = tuple[Literal['illust', 'bookmark'], Optional[int]]
+
+
+def dump_page(
+    ibd: 'IllustBookmarkDatabase',
+    cursor: Optional[ExportCursor] = None,
+    limit: int = 500
+) -> tuple[str, Optional[ExportCursor]]:
+    """
+    按 iid 分页导出一块，每次调用可以使用不同的连接
+    - `:param cursor:` 上一块返回的位置， `None` 代表从头开始
+    - `:return:` `(本块的文本, 下一块的位置)` ，导出完毕则位置为 `None`
+    """
+
+    kind, after = cursor or ('illust', None)
+    te = ibd.illusts_te if kind == 'illust' else ibd.bookmarks_te
+
+    rows: list[Any] = te.select_page(None if after is None else (after, ), limit)
+    chunk = ''.join(map(dump_line, rows))
+
+    if len(rows) == limit:
+        return chunk, (kind, rows[-1].iid)
+    if kind == 'illust':
+        return chunk, ('bookmark', None)
+    return chunk, None
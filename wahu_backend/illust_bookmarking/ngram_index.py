@@ -0,0 +1,234 @@
+"""
+插画数据库的内存 n-gram 倒排索引，作为全文索引之外的另一种模糊查询加速方式
+- 在第一次查询时从数据库读出所有详情建立
+- 写连接的 `IllustTableEditor` 记录每次写入，提交时应用到索引上；回滚时丢弃
+- n-gram 取自经过 `fuzzy_bound.normalize` 处理的内容，即 fuzzywuzzy 实际评分的文本
+- 查询时用倒排表统计关键词与每个插画共有的 n-gram 数，只有达到阈值的插画交给 fuzzywuzzy 评分
+"""
+
+import sys
+import threading
+from collections import Counter
+from typing import Callable, Iterable, Literal, NamedTuple, Optional, Union
+
+from ..aiopixivpy import IllustDetail
+from .fuzzy_bound import min_shared_qgrams, normalize, normalize_keyword, qgrams
+
+# 是否启用内存索引
+MEMORY_INDEX: bool = False
+
+# n-gram 的长度. 中文标题中的关键词往往很短，因此使用 bigram
+N = 2
+
+IndexField = Literal['title', 'caption', 'username', 'tags']
+FIELDS: tuple[IndexField, ...] = ('title', 'caption', 'username', 'tags')
+
+Content = Union[str, list[str]]
+
+
+def set_memory_index(enabled: bool) -> None:
+    """全局设置是否使用内存索引进行模糊查询"""
+
+    global MEMORY_INDEX
+    MEMORY_INDEX = enabled
+
+
+def ngrams(s: str) -> set[str]:
+    return set(qgrams(normalize(s), N))
+
+
+def field_contents(ilst: IllustDetail) -> dict[IndexField, Content]:
+    """插画中参与模糊查询的内容，与 `IllustBookmarkDatabaseQueryMixin` 中匹配的内容一致"""
+
+    return {
+        'title': ilst.title,
+        'caption': ilst.caption,
+        'username': ilst.user.name,
+        'tags': [tag.name for tag in ilst.tags] +
+                [tag.translated for tag in ilst.tags if tag.translated is not None]
+    }
+
+
+def min_shared_ngrams(keyword: str, cutoff: int) -> Optional[int]:
+    """
+    与 `keyword` 的相似度达到 `cutoff` 的片段至少与之共有多少个不同的 n-gram ，证明见 `fuzzy_bound` .
+    无法给出有意义的下界时返回 `None` ，此时应当对所有插画评分
+    """
+
+    return min_shared_qgrams(keyword, cutoff, N)
+
+
+class IndexChange(NamedTuple):
+    """一次写入对索引的修改"""
+    kind: Literal['add', 'remove', 'clear']
+    illusts: tuple[IllustDetail, ...] = ()
+    iids: tuple[int, ...] = ()
+
+
+class NgramIndex:
+    """
+    一个插画数据库的内存 n-gram 索引
+    同一数据库的写实例和只读实例共用一个索引，所有访问都在 `lock` 中进行
+    """
+
+    __slots__ = ('lock', 'built', '_building', '_log', '_docs', '_postings')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = False
+
+        # 建立索引期间提交的修改，建立完成后重放
+        self._building = False
+        self._log: list[IndexChange] = []
+
+        self._docs: dict[IndexField, dict[int, Content]] = {f: {} for f in FIELDS}
+        self._postings: dict[IndexField, dict[str, set[int]]] = {f: {} for f in FIELDS}
+
+    def _add(self, ilst: IllustDetail) -> None:
+
+        self._remove(ilst.iid)
+
+        for field, content in field_contents(ilst).items():
+            self._docs[field][ilst.iid] = content
+
+            if isinstance(content, str):
+                grams = ngrams(content)
+            else:
+                grams = set().union(*(ngrams(c) for c in content))
+
+            postings = self._postings[field]
+            for g in grams:
+                postings.setdefault(g, set()).add(ilst.iid)
+
+    def _remove(self, iid: int) -> None:
+
+        for field in FIELDS:
+            content = self._docs[field].pop(iid, None)
+            if content is None:
+                continue
+
+            if isinstance(content, str):
+                content = [content]
+
+            postings = self._postings[field]
+            for g in set().union(*(ngrams(c) for c in content)):
+                posting = postings.get(g)
+                if posting is not None:
+                    posting.discard(iid)
+                    if len(posting) == 0:
+                        postings.pop(g)
+
+    def _clear(self) -> None:
+
+        for field in FIELDS:
+            self._docs[field].clear()
+            self._postings[field].clear()
+
+    def _apply(self, change: IndexChange) -> None:
+
+        if change.kind == 'add':
+            for ilst in change.illusts:
+                self._add(ilst)
+        elif change.kind == 'remove':
+            for iid in change.iids:
+                self._remove(iid)
+        else:
+            self._clear()
+
+    def apply(self, changes: list[IndexChange]) -> None:
+        """应用已经提交的修改. 索引尚未建立时丢弃，正在建立时暂存"""
+
+        with self.lock:
+            if self.built:
+                for change in changes:
+                    self._apply(change)
+            elif self._building:
+                self._log += changes
+
+    def build(self, read_all: Callable[[], Iterable[IllustDetail]]) -> None:
+        """
+        从 `read_all` 读出的详情建立索引，已经建立则什么也不做
+        读取期间提交的修改会被记录，读取完成后重放；重复应用修改不影响结果
+        """
+
+        with self.lock:
+            if self.built or self._building:
+                return
+            self._building = True
+            self._log = []
+
+        try:
+            illusts = list(read_all())
+        except BaseException:
+            with self.lock:
+                self._building = False
+                self._log = []
+            raise
+
+        with self.lock:
+            self._clear()
+            for ilst in illusts:
+                self._add(ilst)
+            for change in self._log:
+                self._apply(change)
+
+            self._log = []
+            self._building = False
+            self.built = True
+
+    def invalidate(self) -> None:
+        """丢弃索引，下一次查询时重新建立"""
+
+        with self.lock:
+            self._clear()
+            self.built = False
+
+    def candidates(
+        self, field: IndexField, keyword: str, cutoff: int
+    ) -> list[tuple[int, Content]]:
+        """
+        返回可能与 `keyword` 相似度达到 `cutoff` 的 `(iid, 内容)` .
+        与遍历数据库时一样按 `iid` 排序，使得分数相同的结果顺序不变
+        """
+
+        threshold = min_shared_ngrams(keyword, cutoff)
+
+        with self.lock:
+            docs = self._docs[field]
+
+            if threshold is None:
+                return sorted(docs.items())
+
+            postings = self._postings[field]
+            cntr: Counter[int] = Counter()
+            for g in set(qgrams(normalize_keyword(keyword), N)):  # type: ignore
+                cntr.update(postings.get(g, ()))
+
+            return [(iid, docs[iid]) for iid in sorted(cntr) if cntr[iid] >= threshold]
+
+    @property
+    def size(self) -> int:
+        """索引中的插画数"""
+
+        return len(self._docs['title'])
+
+    def memory_usage(self) -> int:
+        """估计索引占用的字节数，包括保存的内容"""
+
+        total = 0
+
+        with self.lock:
+            for field in FIELDS:
+                docs = self._docs[field]
+                postings = self._postings[field]
+
+                total += sys.getsizeof(docs) + sys.getsizeof(postings)
+                for content in docs.values():
+                    if isinstance(content, str):
+                        total += sys.getsizeof(content)
+                    else:
+                        total += sys.getsizeof(content) + sum(map(sys.getsizeof, content))
+                for g, posting in postings.items():
+                    total += sys.getsizeof(g) + sys.getsizeof(posting)
+
+        return total
@@ -0,0 +1,383 @@
+"""
+插画数据库的列式二进制快照，用于快速备份、在机器之间传输，以及不经过 sqlite 直接读取
+- 文件头 `_HEADER` 之后是 `_SECTION` 组成的列表，每项描述一列：列名、 `array` 类型码、
+  数据在文件中的偏移（按 8 字节对齐）和元素个数；整数均为小端序
+- 所有字符串（标题、标签、用户名、图片 URL 的目录和文件名等）去重后放进字符串池 `str_*` ，
+  其他列中保存它们的序号， `NULL_ID` 代表 `None`
+- 用户和标签同样去重为 `us_*` `tg_*` 两张表，插画中保存序号
+- 变长的列表（标签、图片 URL 、收藏页）用 `*_off` 列保存每行在值列中的起止位置
+- 插画和收藏都按 iid 升序排列
+- 读取时用 `mmap` 映射整个文件，每列是直接指向映射的 `memoryview` ，只在访问某一行时解码
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import (TYPE_CHECKING, Any, BinaryIO, Hashable, Iterator, Optional,
+                    Sequence, Union)
+
+from ..aiopixivpy import IllustDetail, IllustTag, PixivUserSummery
+from ..sqlite_tools import SqliteTableEditor
+from .ib_datastructure import IllustBookmark
+
+if TYPE_CHECKING:
+    from .illust_bookmark_database import IllustBookmarkDatabase
+
+MAGIC = b'WAHUSNP\x00'
+VERSION = 1
+
+# 魔数、版本、列数
+_HEADER = struct.Struct('<8sII')
+# 列名、类型码、偏移、元素个数
+_SECTION = struct.Struct('<16sc7xQQ')
+
+NULL_ID = 0xFFFFFFFF
+
+_IMAGE_KINDS = ('origin', 'large', 'medium', 'sqmedium')
+
+# 列名及其类型码，顺序即文件中的顺序
+COLUMNS: dict[str, str] = {
+    'str_off': 'Q', 'str_data': 'B',
+
+    'il_iid': 'q', 'il_title': 'I', 'il_caption': 'I', 'il_type': 'I',
+    'il_height': 'i', 'il_width': 'i', 'il_page_count': 'i', 'il_restrict': 'i',
+    'il_sanity': 'i', 'il_x_restrict': 'i', 'il_bookmarks': 'q', 'il_views': 'q',
+    'il_flags': 'B', 'il_user': 'I', 'il_tag_off': 'I', 'il_tags': 'I',
+
+    'us_account': 'I', 'us_uid': 'q', 'us_followed': 'B', 'us_name': 'I', 'us_image': 'I',
+
+    'tg_name': 'I', 'tg_translated': 'I',
+
+    **{f'im_{k}_{c}': 'I' for k in _IMAGE_KINDS for c in ('off', 'dir', 'file')},
+
+    'bm_iid': 'q', 'bm_timestamp': 'q', 'bm_page_off': 'I', 'bm_pages': 'i',
+}
+
+# `il_flags` 的各位
+_FLAG_BOOKMARKED = 1
+_FLAG_MUTED = 2
+_FLAG_VISIBLE = 4
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+class SnapshotError(ValueError):
+    """不合法的快照文件"""
+
+
+class _Pool:
+    """字典编码：相同的值只保存一次，返回其序号"""
+
+    __slots__ = ('ids', )
+
+    def __init__(self):
+        self.ids: dict[Hashable, int] = {}
+
+    def id(self, v: Hashable) -> int:
+        return self.ids.setdefault(v, len(self.ids))
+
+
+def _iter_by_iid(te: SqliteTableEditor[Any], batch_size: int = 500) -> Iterator[Any]:
+    """按 iid 升序逐个读出"""
+
+    after: Optional[tuple[int]] = None
+    while True:
+        rows = te.select_page(after, batch_size)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].iid, )
+
+
+def write_snapshot(ibd: 'IllustBookmarkDatabase', f: BinaryIO) -> tuple[int, int]:
+    """
+    将数据库写为快照
+    - `:return:` `(详情数, 收藏数)`
+    """
+
+    cols = {name: array(tc) for name, tc in COLUMNS.items()}
+    strings, users, tags = _Pool(), _Pool(), _Pool()
+
+    def sid(s: Optional[str]) -> int:
+        return NULL_ID if s is None else strings.id(s)
+
+    for name in ('il_tag_off', 'bm_page_off', *(f'im_{k}_off' for k in _IMAGE_KINDS)):
+        cols[name].append(0)
+
+    for ilst in _iter_by_iid(ibd.illusts_te):
+        cols['il_iid'].append(ilst.iid)
+        cols['il_title'].append(sid(ilst.title))
+        cols['il_caption'].append(sid(ilst.caption))
+        cols['il_type'].append(sid(ilst.type))
+        cols['il_height'].append(ilst.height)
+        cols['il_width'].append(ilst.width)
+        cols['il_page_count'].append(ilst.page_count)
+        cols['il_restrict'].append(ilst.restrict)
+        cols['il_sanity'].append(ilst.sanity_level)
+        cols['il_x_restrict'].append(ilst.x_restrict)
+        cols['il_bookmarks'].append(ilst.total_bookmarks)
+        cols['il_views'].append(ilst.total_view)
+        cols['il_flags'].append(
+            _FLAG_BOOKMARKED * ilst.is_bookmarked
+            | _FLAG_MUTED * ilst.is_muted
+            | _FLAG_VISIBLE * ilst.visible)
+
+        u = ilst.user
+        uid = users.id((sid(u.account), u.uid, u.is_followed, sid(u.name), sid(u.profile_image)))
+        cols['il_user'].append(uid)
+
+        cols['il_tags'].extend(tags.id((sid(t.name), sid(t.translated))) for t in ilst.tags)
+        cols['il_tag_off'].append(len(cols['il_tags']))
+
+        for kind in _IMAGE_KINDS:
+            for url in getattr(ilst, f'image_{kind}'):
+                d, _, file_name = url.rpartition('/')
+                cols[f'im_{kind}_dir'].append(sid(d))
+                cols[f'im_{kind}_file'].append(sid(file_name))
+            cols[f'im_{kind}_off'].append(len(cols[f'im_{kind}_dir']))
+
+    for bm in _iter_by_iid(ibd.bookmarks_te):
+        cols['bm_iid'].append(bm.iid)
+        cols['bm_timestamp'].append(bm.add_timestamp)
+        cols['bm_pages'].extend(bm.pages)
+        cols['bm_page_off'].append(len(cols['bm_pages']))
+
+    for account, uid, followed, name, image in users.ids.keys():  # type: ignore
+        cols['us_account'].append(account)
+        cols['us_uid'].append(uid)
+        cols['us_followed'].append(followed)
+        cols['us_name'].append(name)
+        cols['us_image'].append(image)
+
+    for name, translated in tags.ids.keys():  # type: ignore
+        cols['tg_name'].append(name)
+        cols['tg_translated'].append(translated)
+
+    cols['str_off'].append(0)
+    for s in strings.ids.keys():
+        cols['str_data'].frombytes(s.encode('utf-8'))  # type: ignore
+        cols['str_off'].append(len(cols['str_data']))
+
+    # 先写出列表，再依次写出各列
+    offset = _HEADER.size + _SECTION.size * len(cols)
+    sections: list[bytes] = []
+    for name, a in cols.items():
+        offset = (offset + 7) // 8 * 8
+        sections.append(_SECTION.pack(
+            name.encode('ascii'), a.typecode.encode('ascii'), offset, len(a)))
+        offset += len(a) * a.itemsize
+
+    f.write(_HEADER.pack(MAGIC, VERSION, len(cols)))
+    f.write(b''.join(sections))
+    written = _HEADER.size + _SECTION.size * len(cols)
+
+    for a in cols.values():
+        padding = -written % 8
+        f.write(b'\x00' * padding)
+        if not _LITTLE_ENDIAN:
+            a.byteswap()
+        a.tofile(f)  # type: ignore
+        written += padding + len(a) * a.itemsize
+
+    return len(cols['il_iid']), len(cols['bm_iid'])
+
+
+def is_snapshot(path: Union[str, Path]) -> bool:
+    """文件是否以快照的魔数开头"""
+
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class Snapshot:
+    """
+    用 `mmap` 打开快照进行只读访问，按需解码行
+    - `:param path:` 快照文件路径
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = path
+
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: list[memoryview] = []
+
+        try:
+            self.cols = self._read_columns()
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_columns(self) -> dict[str, Sequence[int]]:
+        buf = memoryview(self._mmap)
+        self._views.append(buf)
+
+        try:
+            magic, version, num_cols = _HEADER.unpack_from(buf)
+        except struct.error as e:
+            raise SnapshotError(f'快照文件 {self.path} 过短') from e
+        if magic != MAGIC:
+            raise SnapshotError(f'{self.path} 不是快照文件')
+        if version != VERSION:
+            raise SnapshotError(f'不支持的快照版本 {version}')
+
+        cols: dict[str, Sequence[int]] = {}
+        for i in range(num_cols):
+            raw_name, raw_tc, offset, length = _SECTION.unpack_from(
+                buf, _HEADER.size + i * _SECTION.size)
+            name = raw_name.rstrip(b'\x00').decode('ascii')
+            tc = raw_tc.decode('ascii')
+
+            end = offset + length * array(tc).itemsize
+            if end > len(buf):
+                raise SnapshotError(f'快照文件 {self.path} 不完整')
+
+            if _LITTLE_ENDIAN:
+                view = buf[offset:end].cast(tc)
+                self._views.append(view)
+                cols[name] = view  # type: ignore
+            else:
+                a = array(tc, buf[offset:end].tobytes())
+                a.byteswap()
+                cols[name] = a
+
+        missing = COLUMNS.keys() - cols.keys()
+        if missing:
+            raise SnapshotError(f'快照文件 {self.path} 缺少列 {missing}')
+
+        return cols
+
+    def close(self) -> None:
+        # 映射上还有 memoryview 时不能关闭
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self.cols = {}
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def num_illusts(self) -> int:
+        return len(self.cols['il_iid'])
+
+    @property
+    def num_bookmarks(self) -> int:
+        return len(self.cols['bm_iid'])
+
+    def string(self, sid: int) -> Optional[str]:
+        if sid == NULL_ID:
+            return None
+
+        off = self.cols['str_off']
+        return bytes(self.cols['str_data'][off[sid]:off[sid + 1]]).decode('utf-8')
+
+    def _str(self, col: str, i: int) -> str:
+        return self.string(self.cols[col][i])  # type: ignore
+
+    def _urls(self, kind: str, i: int) -> list[str]:
+        off = self.cols[f'im_{kind}_off']
+        dirs = self.cols[f'im_{kind}_dir']
+        files = self.cols[f'im_{kind}_file']
+        return [
+            f'{self.string(dirs[j])}/{self.string(files[j])}'
+            for j in range(off[i], off[i + 1])
+        ]
+
+    def illust(self, i: int) -> IllustDetail:
+        """第 `i` 个插画详情"""
+
+        c = self.cols
+        u = c['il_user'][i]
+        flags = c['il_flags'][i]
+        tag_off = c['il_tag_off']
+
+        return IllustDetail(
+            c['il_iid'][i],
+            self._str('il_title', i),
+            self._str('il_caption', i),
+            c['il_height'][i],
+            c['il_width'][i],
+            bool(flags & _FLAG_BOOKMARKED),
+            bool(flags & _FLAG_MUTED),
+            c['il_page_count'][i],
+            c['il_restrict'][i],
+            c['il_sanity'][i],
+            [
+                IllustTag(self._str('tg_name', t), self.string(c['tg_translated'][t]))  # type: ignore
+                for t in c['il_tags'][tag_off[i]:tag_off[i + 1]]
+            ],
+            c['il_bookmarks'][i],
+            self._str('il_type', i),
+            c['il_views'][i],
+            PixivUserSummery(
+                self._str('us_account', u),
+                c['us_uid'][u],
+                bool(c['us_followed'][u]),
+                self._str('us_name', u),
+                self._str('us_image', u)
+            ),
+            bool(flags & _FLAG_VISIBLE),
+            c['il_x_restrict'][i],
+            *(self._urls(kind, i) for kind in _IMAGE_KINDS)
+        )
+
+    def bookmark(self, i: int) -> IllustBookmark:
+        """第 `i` 个收藏"""
+
+        off = self.cols['bm_page_off']
+        return IllustBookmark(
+            self.cols['bm_iid'][i],
+            list(self.cols['bm_pages'][off[i]:off[i + 1]]),
+            self.cols['bm_timestamp'][i]
+        )
+
+    def _find(self, col: str, iid: int) -> Optional[int]:
+        iids = self.cols[col]
+        i = bisect_left(iids, iid)
+        return i if i < len(iids) and iids[i] == iid else None
+
+    def find_illust(self, iid: int) -> Optional[IllustDetail]:
+        """二分查找插画详情，没有则返回 `None`"""
+
+        i = self._find('il_iid', iid)
+        return None if i is None else self.illust(i)
+
+    def find_bookmark(self, iid: int) -> Optional[IllustBookmark]:
+        i = self._find('bm_iid', iid)
+        return None if i is None else self.bookmark(i)
+
+    def iter_illusts(self) -> Iterator[IllustDetail]:
+        return map(self.illust, range(self.num_illusts))
+
+    def iter_bookmarks(self) -> Iterator[IllustBookmark]:
+        return map(self.bookmark, range(self.num_bookmarks))
+
+
+def load_snapshot(
+    ibd: 'IllustBookmarkDatabase', path: Union[str, Path], batch_size: int = 1000
+) -> tuple[int, int]:
+    """
+    将快照导入数据库，每批 `batch_size` 行提交一次
+    - `:return:` `(导入的详情数, 导入的收藏数)`
+    """
+
+    with Snapshot(path) as snap:
+
+        def batches() -> Iterator[tuple[list[IllustDetail], list[IllustBookmark]]]:
+            for begin in range(0, snap.num_illusts, batch_size):
+                end = min(begin + batch_size, snap.num_illusts)
+                yield list(map(snap.illust, range(begin, end))), []
+            for begin in range(0, snap.num_bookmarks, batch_size):
+                end = min(begin + batch_size, snap.num_bookmarks)
+                yield [], list(map(snap.bookmark, range(begin, end)))
+
+        return ibd.insert_batches(batches())
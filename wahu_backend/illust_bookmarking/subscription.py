@@ -0,0 +1,240 @@
+"""
+订阅更新的调度
+- 所有订阅共用一个 `RateLimiter` ，限制每秒请求的页数
+- 至多 `concurrency` 个请求同时进行；订阅排成一个队列，每次只取一页，取完排回队尾，因此每个订阅轮流前进
+- 取到的页放进另一个队列，由唯一的写入任务成批写入并提交
+- 每条订阅正常结束后，记录本次更新到的位置 `SubscriptionMark` ，下次更新到此为止
+"""
+
+import asyncio
+from time import monotonic, time
+from typing import TYPE_CHECKING, AsyncGenerator, Iterable, NamedTuple, Optional
+
+from ..aiopixivpy import IllustDetail
+from ..wahu_core.wahu_cli import AsyncGenPipe
+from .ib_datastructure import IllustBookmark, SubscriptionMark
+from .logger import logger
+
+if TYPE_CHECKING:
+    from .illust_bookmark_database import IllustBookmarkDatabase
+
+# `SubscriptionMark.recent_iids` 的长度
+MARK_SIZE = 10
+
+
+class RateLimiter:
+    """
+    令牌桶限流. 平均每秒放行 `rate` 次，空闲时至多积攒 `burst` 次
+    - `:param rate:` 不大于 0 时不限流
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._last = monotonic()
+        # 等待的请求按先后顺序放行
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+
+        async with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 1
+                self._last = monotonic()
+
+            self._tokens -= 1
+
+
+class Subscription(NamedTuple):
+    """
+    一条订阅
+    - `:member key:` 用于记录更新位置，见 `SubscriptionMark.key` ；为 `None` 则不记录
+    """
+    name: str
+    pages: AsyncGenerator[list[IllustDetail], None]
+    key: Optional[str] = None
+
+
+def page_known(ibd: 'IllustBookmarkDatabase', page: list[IllustDetail]) -> bool:
+    """一页中的插画是否都已经在数据库中. 只用一条 `IN` 查询，不读出详情"""
+
+    iids = {ilst.iid for ilst in page}
+    return len(ibd.illusts_te.existing(iids)) == len(iids)
+
+
+class SubscriptionScheduler:
+    """
+    轮流从各个订阅取页，并写入数据库
+    - `:param ibd:` 写入的数据库，写入后会提交
+    - `:param pipe:` 输出写入的插画和失败的订阅，不会被关闭
+    - `:param limiter:` 所有订阅共用的限流器
+    - `:param concurrency:` 同时进行的请求数
+    - `:param page_num:` 每个订阅至多取的页数， -1 表示取完
+    - `:param intelligent:` 订阅遇到插画都已在数据库中的一页时停止
+    - `:param marks:` 上次更新到的位置，订阅到达这些位置时停止
+    """
+
+    def __init__(
+        self,
+        ibd: 'IllustBookmarkDatabase',
+        pipe: AsyncGenPipe,
+        limiter: RateLimiter,
+        concurrency: int = 4,
+        page_num: int = -1,
+        intelligent: bool = False,
+        marks: Optional[dict[str, SubscriptionMark]] = None
+    ):
+        self.ibd = ibd
+        self.pipe = pipe
+        self.limiter = limiter
+        self.concurrency = max(concurrency, 1)
+        self.page_num = page_num
+        self.intelligent = intelligent
+        self.marks = marks if marks is not None else {}
+
+        # 本次更新到的位置，订阅正常结束后才移入 `_finished_marks`
+        self._new_marks: dict[str, SubscriptionMark] = {}
+        self._finished_marks: list[SubscriptionMark] = []
+
+        # (订阅, 已经取了的页数)
+        self._subs: asyncio.Queue[tuple[Subscription, int]] = asyncio.Queue()
+        # `None` 通知写入任务结束
+        self._pages: asyncio.Queue[Optional[list[IllustDetail]]] = asyncio.Queue()
+
+    async def run(self, subs: Iterable[Subscription]) -> None:
+        """更新所有订阅，返回时取到的页和正常结束的订阅的位置都已写入"""
+
+        for sub in subs:
+            self._subs.put_nowait((sub, 0))
+
+        writer = asyncio.create_task(self._writer())
+        fetchers = [asyncio.create_task(self._fetcher()) for _ in range(self.concurrency)]
+        all_fetched = asyncio.create_task(self._subs.join())
+
+        try:
+            # 写入失败时不再继续请求
+            await asyncio.wait([all_fetched, writer], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            all_fetched.cancel()
+            for f in fetchers:
+                f.cancel()
+            await asyncio.gather(*fetchers, return_exceptions=True)
+
+            self._pages.put_nowait(None)
+            await writer
+
+        if self._finished_marks != []:
+            self.ibd.marks_te.insert(self._finished_marks)
+            self.ibd.commit()
+
+    async def _fetcher(self) -> None:
+        while True:
+            sub, fetched = await self._subs.get()
+            try:
+                await self._fetch_page(sub, fetched)
+            finally:
+                self._subs.task_done()
+
+    async def _fetch_page(self, sub: Subscription, fetched: int) -> None:
+        """
+        取订阅的下一页，订阅没有结束则排回队尾.
+        出错的订阅不再继续，错误输出到 `pipe` ，不会影响其它订阅
+        """
+
+        try:
+            await self._next_page(sub, fetched)
+        except Exception as e:
+            await self._fail(sub, e)
+
+    async def _next_page(self, sub: Subscription, fetched: int) -> None:
+        await self.limiter.acquire()
+
+        try:
+            page = await sub.pages.__anext__()
+        except StopAsyncIteration:
+            await self._finish(sub)
+            return
+
+        if fetched == 0 and sub.key is not None and page != []:
+            self._new_marks[sub.key] = SubscriptionMark(
+                sub.key, max(ilst.iid for ilst in page),
+                [ilst.iid for ilst in page[:MARK_SIZE]], int(time()))
+
+        mark = self.marks.get(sub.key) if sub.key is not None else None
+        if mark is not None:
+            for i, ilst in enumerate(page):
+                if mark.reached(ilst.iid):
+                    if i > 0:
+                        self._pages.put_nowait(page[:i])
+                    await self._finish(sub)
+                    return
+
+        if self.intelligent and page_known(self.ibd, page):
+            await self._finish(sub)
+            return
+
+        self._pages.put_nowait(page)
+
+        fetched += 1
+        if fetched == self.page_num:
+            await self._finish(sub)
+            return
+
+        self._subs.put_nowait((sub, fetched))
+
+    async def _finish(self, sub: Subscription) -> None:
+        """订阅正常结束"""
+
+        await sub.pages.aclose()
+
+        if sub.key is not None and sub.key in self._new_marks:
+            self._finished_marks.append(self._new_marks.pop(sub.key))
+
+    async def _fail(self, sub: Subscription, e: Exception) -> None:
+        """订阅出错"""
+
+        logger.warning('SubscriptionScheduler: %s 更新失败: %s' % (sub.name, e))
+        self.pipe.output(f'{sub.name} 更新失败: {e}\n')
+
+        # 没有拉取完的订阅不能更新位置，否则中间的插画会被跳过
+        if sub.key is not None:
+            self._new_marks.pop(sub.key, None)
+
+        try:
+            await sub.pages.aclose()
+        except Exception as close_error:
+            logger.warning('SubscriptionScheduler: 关闭 %s 失败: %s' % (sub.name, close_error))
+
+    async def _writer(self) -> None:
+        """把积攒下的页一次写入"""
+
+        while True:
+            pages = [await self._pages.get()]
+            while not self._pages.empty():
+                pages.append(self._pages.get_nowait())
+
+            illusts = [ilst for page in pages if page is not None for ilst in page]
+
+            if illusts != []:
+                now = int(time())
+                self.ibd.illusts_te.insert(illusts)
+                self.ibd.bookmarks_te.insert(
+                    [IllustBookmark(ilst.iid, list(range(ilst.page_count)), now)
+                     for ilst in illusts]
+                )
+                self.ibd.commit()
+
+                self.pipe.output(
+                    ''.join(f'{ilst.title} - {ilst.iid}\n' for ilst in illusts))
+
+            if None in pages:
+                return
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+
+class ByteLRU:
+    """
+    按总字节数限制大小的 LRU 缓存
+    - 命中的图片移到队尾，超出预算时从队首（最久未使用）开始淘汰
+    - 单个超过预算的值不缓存
+    - `:param budget:` 字节数预算
+    """
+
+    __slots__ = ('budget', 'used', 'hits', 'misses', 'evictions', '_data')
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        v = self._data.get(key, None)
+
+        if v is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._data.move_to_end(key)
+
+        return v
+
+    def put(self, key: str, value: bytes) -> None:
+        self.pop(key)
+
+        if len(value) > self.budget:
+            return
+
+        while self.used + len(value) > self.budget:
+            _, evicted = self._data.popitem(last=False)
+            self.used -= len(evicted)
+            self.evictions += 1
+
+        self._data[key] = value
+        self.used += len(value)
+
+    def pop(self, key: str) -> Optional[bytes]:
+        v = self._data.pop(key, None)
+        if v is not None:
+            self.used -= len(v)
+        return v
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.used = 0
+
+    def __contains__(self, key: str) -> bool:
+        """不计入命中，也不改变顺序"""
+
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self) -> Iterator[str]:
+        """从最久未使用到最近使用"""
+
+        return iter(self._data.keys())
@@ -0,0 +1,194 @@
+"""
+磁盘上的图片缓存，重启后仍然有效
+- 图片按 i.pximg.net 上路径的 SHA-1 保存在 `<root>/<前两位>/<SHA-1><扩展名>`
+- `<root>/index.db` 记录每张图片的大小和最近访问时间；启动时读入内存，按访问时间排成 LRU 队列
+- 总大小超过预算时删除最久未访问的图片
+- 文件先写入 `.part` 再重命名，中断不会留下不完整的图片；启动时删除残留的 `.part` 和索引中没有的文件
+- 命中时只在内存中更新访问顺序，访问时间积攒起来，定期或在写入、关闭时一并写入索引
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from time import monotonic, time
+from typing import Iterator, Optional
+
+from .logger import logger
+
+INDEX_FILE = 'index.db'
+
+# 积攒的访问时间达到这么多条，或距上次写入超过这么多秒时写入索引
+ATIME_FLUSH_SIZE = 256
+ATIME_FLUSH_INTERVAL = 60
+
+
+class DiskImageCache:
+    """
+    - `:param root:` 缓存目录
+    - `:param budget:` 图片总字节数的上限
+    所有方法都是同步的，可以在任意线程调用
+    """
+
+    def __init__(self, root: Path, budget: int):
+        self.root = root
+        self.budget = budget
+        self.used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # 尚未写入索引的访问时间
+        self._atimes: dict[str, float] = {}
+        self._last_flush = monotonic()
+
+        root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(root / INDEX_FILE, check_same_thread=False)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL)')
+        self._con.commit()
+
+        # 键到大小，从最久未访问到最近访问
+        self._entries: OrderedDict[str, int] = OrderedDict(
+            self._con.execute('SELECT key, size FROM entries ORDER BY atime').fetchall())
+        self.used = sum(self._entries.values())
+
+        self._clean()
+        self._evict(0)
+
+    def path_of(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.root / digest[:2] / (digest + os.path.splitext(key)[1])
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries.keys():
+                self.misses += 1
+                return None
+
+            try:
+                data = self.path_of(key).read_bytes()
+            except OSError:
+                logger.warning('DiskImageCache: 缓存的文件 %s 无法读取' % self.path_of(key))
+                self._remove(key)
+                self._con.commit()
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._atimes[key] = time()
+            self.hits += 1
+
+            if len(self._atimes) >= ATIME_FLUSH_SIZE or \
+                    monotonic() - self._last_flush >= ATIME_FLUSH_INTERVAL:
+                self._flush_atimes()
+                self._con.commit()
+
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.budget:
+            return
+
+        with self._lock:
+            if key in self._entries.keys():
+                self._remove(key)
+            self._evict(len(data))
+
+            path = self.path_of(key)
+            path.parent.mkdir(exist_ok=True)
+            part_path = path.with_name(path.name + '.part')
+            part_path.write_bytes(data)
+            os.replace(part_path, path)
+
+            self._entries[key] = len(data)
+            self.used += len(data)
+            self._con.execute(
+                'INSERT OR REPLACE INTO entries (key, size, atime) VALUES (?, ?, ?)',
+                (key, len(data), time()))
+            self._flush_atimes()
+            self._con.commit()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries.keys()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> Iterator[str]:
+        """从最久未访问到最近访问"""
+
+        return iter(list(self._entries.keys()))
+
+    def _remove(self, key: str) -> None:
+        """删除文件和索引，不提交"""
+
+        self.used -= self._entries.pop(key)
+        self._atimes.pop(key, None)
+        self.path_of(key).unlink(missing_ok=True)
+        self._con.execute('DELETE FROM entries WHERE key=?', (key, ))
+
+    def _evict(self, incoming: int) -> None:
+        """淘汰到能再放下 `incoming` 字节为止"""
+
+        while self._entries and self.used + incoming > self.budget:
+            key = next(iter(self._entries.keys()))
+            self._remove(key)
+            self.evictions += 1
+        self._flush_atimes()
+        self._con.commit()
+
+    def _flush_atimes(self) -> None:
+        """把积攒的访问时间写入索引，不提交"""
+
+        if self._atimes:
+            self._con.executemany(
+                'UPDATE entries SET atime=? WHERE key=?',
+                [(atime, key) for key, atime in self._atimes.items()])
+            self._atimes.clear()
+        self._last_flush = monotonic()
+
+    def _clean(self) -> None:
+        """删除残留的 `.part` 和索引中没有的文件，并从索引中删除文件已经不存在的图片"""
+
+        expected = {self.path_of(key): key for key in self._entries.keys()}
+        found: set[Path] = set()
+
+        for shard in self.root.iterdir():
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+
+            for path in shard.iterdir():
+                if path in expected.keys():
+                    found.add(path)
+                    continue
+
+                logger.info('DiskImageCache: 删除残留的文件 %s' % path)
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning('DiskImageCache: 无法删除 %s: %s' % (path, e))
+
+        for path, key in expected.items():
+            if path not in found:
+                self._remove(key)
+        self._con.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._remove(key)
+            self._con.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_atimes()
+            self._con.commit()
+            self._con.close()
@@ -11,6 +11,8 @@ class DownloadProgressRaw:
     gid: str
     total_size: Optional[int]
     downloaded_size: int
+    resumed_size: int
+    retries: int
     descript: Optional[str]
     status: Literal['inprogress', 'finished', 'error', 'pending']
 
@@ -30,15 +32,28 @@ class DownloadProgress(DownloadProgressRaw):
         self.descript = descript
         self.total_size = None
         self.downloaded_size = 0
+        self.resumed_size = 0
+        self.retries = 0
 
-    def start(self, total_size: Optional[int | str]) -> None:
+    def start(self, total_size: Optional[int | str], offset: int = 0) -> None:
+        """
+        收到响应时调用，重试时会再次调用
+        - `:param offset:` 从第几个字节开始下载；第一次调用时记为之前已经下载的 `resumed_size`
+        """
 
         if total_size is not None:
             total_size = int(total_size)
 
+        if self.status == 'pending':
+            self.resumed_size = offset
+
         self.total_size = total_size
+        self.downloaded_size = offset
         self.status = 'inprogress'
 
+    def retry(self) -> None:
+        self.retries += 1
+
     def update(self, delta: int) -> None:
         self.downloaded_size += delta
 
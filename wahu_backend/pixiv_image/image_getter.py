@@ -1,12 +1,18 @@
+import asyncio
 import logging
+import os
 from asyncio import Semaphore
-from typing import Any, MutableMapping, Optional
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import (Any, AsyncContextManager, AsyncIterator, Awaitable, BinaryIO,
+                    Callable, MutableMapping, Optional, TypeVar)
 
 import aiohttp
 
+from ..async_util import KeyedLock
 from ..http_typing import HTTPHeaders
 from ..manual_dns import ManualDNSClient
-from .download_status import DownloadProgressTracker
+from .download_status import DownloadProgress, DownloadProgressTracker
 from .logger import logger
 
 HOSTS = [
@@ -18,11 +24,99 @@ HOSTS = [
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0'
 
 
+def part_path_of(target: Path) -> Path:
+    """下载到 `target` 时使用的临时文件"""
+
+    return target.with_name(target.name + '.part')
+
+
+T = TypeVar('T')
+
+
 class PixivImageGetError(ConnectionError):
+    """
+    - `:attr status:` 服务器返回的错误状态码；连接错误、超时等为 `None`
+    """
 
-    def __init__(self, image_address: str, host: Optional[str]):
+    def __init__(self, image_address: str, host: Optional[str], status: Optional[int] = None):
         self.image_address = image_address
         self.host = host
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        """除了 408 和 429 ，4xx 的错误重试也不会成功"""
+
+        return self.status is None or not 400 <= self.status < 500 or self.status in (408, 429)
+
+
+def total_size_of(resp: aiohttp.ClientResponse, start: int) -> Optional[int]:
+    """从 `Content-Range` 或者 `Content-Length` 得到图片的总大小；`start` 为请求的起始字节"""
+
+    if resp.status == 206:
+        content_range = resp.headers.get('Content-Range', '')
+        total = content_range.rpartition('/')[2]
+        if total.isdigit():
+            return int(total)
+        start_in_resp = start
+    else:
+        start_in_resp = 0
+
+    if resp.content_length is None:
+        return None
+    return start_in_resp + resp.content_length
+
+
+class _MemorySink:
+    """写入内存；知道大小时预先分配，避免反复扩容"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.size = 0
+        self.segmented = False
+
+    def reserve(self, total: int) -> None:
+        if len(self.buf) < total:
+            self.buf.extend(bytes(total - len(self.buf)))
+
+    def write_at(self, pos: int, data: bytes) -> None:
+        self.buf[pos:pos + len(data)] = data
+        self.size = max(self.size, pos + len(data))
+
+    def truncate(self, size: int) -> None:
+        self.size = size
+
+    def getvalue(self) -> bytes:
+        return bytes(memoryview(self.buf)[:self.size])
+
+
+class _FileSink:
+    """写入文件；文件已经存在时从其末尾继续"""
+
+    def __init__(self, path: Path):
+        self.f: BinaryIO = open(path, 'r+b' if path.exists() else 'w+b')
+        self.size = self.f.seek(0, os.SEEK_END)
+        self.segmented = False
+
+    def reserve(self, total: int) -> None:
+        pass
+
+    def write_at(self, pos: int, data: bytes) -> None:
+        if self.f.tell() != pos:
+            self.f.seek(pos)
+        self.f.write(data)
+        self.size = max(self.size, pos + len(data))
+
+    def truncate(self, size: int) -> None:
+        self.f.truncate(size)
+        self.f.seek(size)
+        self.size = size
+
+    def close(self) -> None:
+        self.f.close()
+
+
+Sink = _MemorySink | _FileSink
 
 
 class PixivImageGetterLogAdapter(logging.LoggerAdapter):
@@ -41,6 +135,7 @@ class PixivImageGetterLogAdapter(logging.LoggerAdapter):
 class PixivImageGetter(ManualDNSClient):
 
     host_name = 'i.pximg.net'
+    scheme = 'https'
 
     def __init__(
         self,
@@ -49,13 +144,20 @@ class PixivImageGetter(ManualDNSClient):
         chunk: int = 2048,
         connection_limit: int = 7,
         num_parallel: int = 3,
-        record_size: int = 100
+        record_size: int = 100,
+        retries: int = 3,
+        backoff: float = 1.0,
+        segment_threshold: Optional[int] = None,
+        segments: int = 4
     ) -> None:
         """
-        - `:param timeout:` 全局的超时
+        - `:param timeout:` 连接和两次读取之间的超时
         - `:param host:` IP 地址；如果提供了，就不会再通过 DNS 查询
+        - `:param retries:` 下载中断后的重试次数，重试时用 `Range` 从中断处继续
+        - `:param backoff:` 第 n 次重试前等待 `backoff * 2 ** (n - 1)` 秒
+        - `:param segment_threshold:` 不小于这么多字节的图片分成 `segments` 段并行下载；
+          为 `None` 则不分段
         """
-        self.timeout: float = timeout
 
         self.base_headers: HTTPHeaders = {
             'Host': self.host_name,
@@ -64,9 +166,6 @@ class PixivImageGetter(ManualDNSClient):
             'Referer': 'https://www.pixiv.net'
         }
 
-        if host is not None:
-            self.host = host
-
         self.session: aiohttp.ClientSession
 
         self.dl_stats: DownloadProgressTracker = DownloadProgressTracker(
@@ -78,17 +177,30 @@ class PixivImageGetter(ManualDNSClient):
 
         self.sem = Semaphore(num_parallel)
 
+        self.retries = retries
+        self.backoff = backoff
+        self.segment_threshold = segment_threshold
+        self.segments = segments
+
+        # 同一个临时文件同时只被一个下载使用
+        self.part_locks: KeyedLock[Path] = KeyedLock()
+
         super().__init__()
 
-    async def get_image(self, file_path: str, descript: Optional[str]=None) -> bytes:
-        """
-        从 i.pximg.net 获取图片
-        - `:param file_path` 形如 `img-original/img/2011/07/23/00/01/42/20514048_p0.jpg`
-        """
+        # `ManualDNSClient.__init__` 会把 `host` 设为 `None` ，`timeout` 设为默认值
+        self.timeout: float = timeout
+        if host is not None:
+            self.host = host
+
+    @asynccontextmanager
+    async def _track(
+        self, file_path: str, descript: Optional[str]
+    ) -> AsyncIterator[DownloadProgress]:
+        """记录下载进度，并占用一个并行下载的位置"""
 
         await self._check_env()
 
-        url = f'https://{self.host}/{file_path}'
+        url = f'{self.scheme}://{self.host}/{file_path}'
 
         with self.dl_stats.new(
             url,
@@ -99,21 +211,189 @@ class PixivImageGetter(ManualDNSClient):
 
                 logger.info('PixivImageGetter: get_image: 尝试获取 %s' % file_path)
 
-                try:
-                    async with self.session.get(url, ssl=True) as resp:
+                yield st
+
+    @asynccontextmanager
+    async def _request(
+        self, file_path: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        请求 `file_path` 从 `start` 到 `end` （不含）的字节，不支持 `Range` 的服务器会返回整个图片；
+        请求和读取过程中的 `aiohttp.ClientError` 和超时转换为 `PixivImageGetError`
+        """
+
+        url = f'{self.scheme}://{self.host}/{file_path}'
+        headers = {'Range': f'bytes={start}-{"" if end is None else end - 1}'}
+        timeout = aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout)
+
+        try:
+            async with self.session.get(url, ssl=True, headers=headers, timeout=timeout) as resp:
+                resp.raise_for_status()
+                yield resp
+
+        except aiohttp.ClientResponseError as resp_error:
+            raise PixivImageGetError(file_path, self.host, resp_error.status) from resp_error
+        except (aiohttp.ClientError, asyncio.TimeoutError) as client_error:
+            raise PixivImageGetError(file_path, self.host) from client_error
+
+    async def _retry(
+        self, file_path: str, st: DownloadProgress, f: Callable[[], Awaitable[T]]
+    ) -> T:
+        """运行 `f()` ，遇到可以重试的 `PixivImageGetError` 时等待后重试"""
+
+        for attempt in range(self.retries + 1):
+            try:
+                return await f()
+            except PixivImageGetError as pige:
+                if attempt == self.retries or not pige.retryable:
+                    raise
+
+                delay = self.backoff * 2 ** attempt
+                self.log_adapter.warning(
+                    '%s 下载中断，%.1f 秒后重试：%r' % (file_path, delay, pige.__cause__))
+                st.retry()
+                await asyncio.sleep(delay)
+
+        raise AssertionError('unreachable')
+
+    async def _stream(
+        self, file_path: str, sink: Sink, st: DownloadProgress
+    ) -> Optional[tuple[int, int]]:
+        """
+        从 `sink` 已有的字节处继续下载
+        - `:return:` 需要分段下载时，不读取响应，返回剩下的字节范围
+        """
+
+        offset = sink.size
+
+        try:
+            async with self._request(file_path, offset) as resp:
+
+                if resp.status != 206 and offset > 0:
+                    self.log_adapter.warning('%s 服务器不支持续传，从头下载' % file_path)
+                    sink.truncate(0)
+                    offset = 0
+
+                total = total_size_of(resp, offset)
+                st.start(total, offset)
+
+                if total is not None:
+                    if (resp.status == 206 and self.segment_threshold is not None
+                        and total - offset >= max(self.segment_threshold, 1)):
+                        return offset, total
+                    sink.reserve(total)
+
+                pos = offset
+                async for chk in resp.content.iter_chunked(self.chunk_size):
+                    sink.write_at(pos, chk)
+                    pos += len(chk)
+                    st.update(len(chk))
+
+                return None
+
+        except PixivImageGetError as pige:
+            if pige.status != 416 or offset == 0:
+                raise
+
+        # 已有的字节不比图片少，多半是之前下载完成后没来得及重命名，从头下载
+        sink.truncate(0)
+        return await self._stream(file_path, sink, st)
+
+    async def _fetch_segment(
+        self, file_path: str, sink: Sink, st: DownloadProgress, start: int, end: int
+    ) -> None:
+        """下载 `[start, end)` ，中断后从已下载的位置重试"""
+
+        pos = start
+
+        async def fetch():
+            nonlocal pos
+
+            async with self._request(file_path, pos, end) as resp:
+                if resp.status != 206:
+                    raise PixivImageGetError(file_path, self.host, resp.status)
+
+                async for chk in resp.content.iter_chunked(self.chunk_size):
+                    chk = chk[:end - pos]
+                    sink.write_at(pos, chk)
+                    pos += len(chk)
+                    st.update(len(chk))
+
+            if pos < end:
+                raise PixivImageGetError(file_path, self.host)
+
+        await self._retry(file_path, st, fetch)
+
+    async def _download(self, file_path: str, sink: Sink, st: DownloadProgress) -> None:
+        """下载到 `sink` ；分段下载时设置 `sink.segmented`"""
+
+        segments = await self._retry(file_path, st, lambda: self._stream(file_path, sink, st))
+        if segments is None:
+            return
+
+        start, total = segments
+        sink.segmented = True
+        sink.reserve(total)
+
+        step = -(-(total - start) // self.segments)
+        tasks = [
+            asyncio.ensure_future(
+                self._fetch_segment(file_path, sink, st, a, min(a + step, total)))
+            for a in range(start, total, step)
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_image(self, file_path: str, descript: Optional[str]=None) -> bytes:
+        """
+        从 i.pximg.net 获取图片
+        - `:param file_path` 形如 `img-original/img/2011/07/23/00/01/42/20514048_p0.jpg`
+        """
+
+        sink = _MemorySink()
+
+        async with self._track(file_path, descript) as st:
+            await self._download(file_path, sink, st)
+
+        return sink.getvalue()
+
+    async def download_to(
+        self, file_path: str, target: Path, descript: Optional[str] = None
+    ) -> None:
+        """
+        从 i.pximg.net 获取图片，边下载边写入 `target` 旁边的临时文件 `<target>.part` ，
+        完成后重命名为 `target`
+        - 失败时保留临时文件，下次下载到同一个 `target` 时从中断处继续；
+          分段下载的临时文件中间可能有空洞，以及服务器返回 4xx 时，删除临时文件
+        - 下载到同一个 `target` 的调用依次进行，不会同时读写临时文件
+        - `:param file_path` 同 `get_image`
+        """
+
+        part_path = part_path_of(target)
+
+        async with self.part_lock(target):
+            sink = _FileSink(part_path)
+
+            try:
+                async with self._track(file_path, descript) as st:
+                    await self._download(file_path, sink, st)
 
-                        total_size = resp.headers.get('Content-Length', None)
-                        if total_size is None:
-                            total_size = resp.headers.get('content-length')
-                        st.start(total_size)
+            except BaseException as e:
+                sink.close()
 
-                        image = bytes()
+                gone = isinstance(e, PixivImageGetError) and not e.retryable
+                if sink.segmented or gone or sink.size == 0:
+                    part_path.unlink(missing_ok=True)
+                raise
 
-                        async for chk in resp.content.iter_chunked(self.chunk_size):
-                            image += chk
-                            st.update(self.chunk_size)
+            sink.close()
+            os.replace(part_path, target)
 
-                        return image
+    def part_lock(self, target: Path) -> AsyncContextManager[None]:
+        """独占下载到 `target` 时使用的临时文件"""
 
-                except aiohttp.ClientError as client_error:
-                    raise PixivImageGetError(file_path, self.host) from client_error
+        return self.part_locks(part_path_of(target).absolute())
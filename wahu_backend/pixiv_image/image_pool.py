@@ -1,42 +1,148 @@
-from typing import Optional, OrderedDict
-from .image_getter import PixivImageGetter
+import asyncio
+import os
+from pathlib import Path
+from typing import Optional
+from ..async_util import SingleFlight
+from .byte_lru import ByteLRU
+from .disk_cache import DiskImageCache
+from .image_getter import PixivImageGetter, part_path_of
+
+
+def is_original(file_path: str) -> bool:
+    """原图的路径形如 `img-original/img/...` ，其他尺寸在 `c/<尺寸>/img-master/img/...`"""
+
+    return 'img-original/' in file_path
 
 
 class PixivImagePool(PixivImageGetter):
-    """获取图片后缓存图片"""
+    """
+    获取图片后缓存图片. 缩略图（ `img-master` 下的各尺寸）和原图分别缓存，各有字节数预算
+    依次查找内存缓存、磁盘缓存，都没有才从服务器获取
+    对同一路径的并发请求只下载一次，图片也只放入缓存一次；下载到同一文件的并发请求也只下载一次
+    - `:param thumbnail_budget:` 缩略图缓存的字节数
+    - `:param original_budget:` 原图缓存的字节数
+    - `:param disk_cache:` 磁盘缓存；为 `None` 则只缓存在内存中
+    其余参数见 `PixivImageGetter`
+    """
 
     def __init__(
         self,
         host: Optional[str] = None,
-        size: int = 100,
+        thumbnail_budget: int = 64 * 2 ** 20,
+        original_budget: int = 256 * 2 ** 20,
+        disk_cache: Optional[DiskImageCache] = None,
         timeout: float = 5.0,
         chunk: int = 2048,
         connection_limit: int = 7,
         num_parallel: int = 2,
-        record_size: int = 100
+        record_size: int = 100,
+        retries: int = 3,
+        backoff: float = 1.0,
+        segment_threshold: Optional[int] = None,
+        segments: int = 4
     ) -> None:
 
-        self.size = size
-        self.pool: OrderedDict[str, bytes] = OrderedDict()
+        self.thumbnails = ByteLRU(thumbnail_budget)
+        self.originals = ByteLRU(original_budget)
+        self.disk_cache = disk_cache
+        self.flights: SingleFlight[str, bytes] = SingleFlight()
+        # 键为 `(file_path, target 的绝对路径)`
+        self.download_flights: SingleFlight[tuple[str, Path], None] = SingleFlight()
         super().__init__(
             host, timeout, chunk,
             connection_limit=connection_limit,
             num_parallel=num_parallel,
-            record_size=record_size
+            record_size=record_size,
+            retries=retries,
+            backoff=backoff,
+            segment_threshold=segment_threshold,
+            segments=segments
         )
 
+    def tier(self, file_path: str) -> ByteLRU:
+        """`file_path` 所在的缓存"""
+
+        return self.originals if is_original(file_path) else self.thumbnails
+
+    def clear(self) -> None:
+        """只清空内存缓存"""
+
+        self.thumbnails.clear()
+        self.originals.clear()
+
+    async def get_cached(self, file_path: str) -> Optional[bytes]:
+        """从内存或磁盘缓存中获取；磁盘中的图片会被放入内存缓存"""
+
+        img = self.tier(file_path).get(file_path)
+        if img is not None:
+            return img
+
+        return await self._get_disk(file_path)
+
+    async def _get_disk(self, file_path: str) -> Optional[bytes]:
+        if self.disk_cache is None:
+            return None
+
+        img = await asyncio.to_thread(self.disk_cache.get, file_path)
+        if img is not None:
+            self.tier(file_path).put(file_path, img)
+
+        return img
+
     async def get_image(self, file_path: str
                        , descript: Optional[str] = None) -> bytes:
 
-        if file_path in self.pool.keys():
-            return self.pool[file_path]
+        img = self.tier(file_path).get(file_path)
+        if img is not None:
+            return img
 
-        img = await super().get_image(file_path, descript=descript)
+        return await self.flights.run(
+            file_path, lambda: self._load(file_path, descript))
+
+    async def _load(self, file_path: str, descript: Optional[str]) -> bytes:
+        """内存缓存未命中时，由同一路径的第一个请求运行"""
 
-        if len(self.pool) >= self.size:
-            self.pool.popitem(last=False)
+        img = await self._get_disk(file_path)
+        if img is not None:
+            return img
 
-        self.pool[file_path] = img
+        img = await super().get_image(file_path, descript=descript)
+        self.tier(file_path).put(file_path, img)
+
+        if self.disk_cache is not None:
+            await asyncio.to_thread(self.disk_cache.put, file_path, img)
 
         return img
 
+    async def download_to(
+        self, file_path: str, target: Path, descript: Optional[str] = None
+    ) -> None:
+        """
+        已缓存或者正在通过 `get_image` 获取的图片直接写入，否则流式下载；下载的图片不放入缓存.
+        同时下载同一图片到同一 `target` 的调用共用一次下载
+        """
+
+        await self.download_flights.run(
+            (file_path, target.absolute()),
+            lambda: self._download_to(file_path, target, descript))
+
+    async def _download_to(
+        self, file_path: str, target: Path, descript: Optional[str]
+    ) -> None:
+
+        img = await self.get_cached(file_path)
+        if img is None and file_path in self.flights:
+            img = await self.flights.run(file_path, lambda: self._load(file_path, descript))
+        if img is None:
+            return await super().download_to(file_path, target, descript=descript)
+
+        part_path = part_path_of(target)
+        async with self.part_lock(target):
+            with open(part_path, 'wb') as wf:
+                wf.write(img)
+            os.replace(part_path, target)
+
+    async def close_session(self) -> None:
+        await super().close_session()
+        if self.disk_cache is not None:
+            self.disk_cache.close()
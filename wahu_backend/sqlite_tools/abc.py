@@ -8,10 +8,12 @@ class DatabaseRow:
     - :member keys: 这行的所有表头
     - :member adapters: `keys` 作为键值的字典，用于转换类型以存入/读出数据库
     - :member index: 在数据库中作为索引的键值
+    - :member indexed: 需要额外建立 sqlite 索引的列，用于排序或查询
     """
     keys: list[str]
     adapters: dict[str, Type[SqliteAdapter[Any, Any]]]
     index: str
+    indexed: list[str] = []
 
     __slots__ = ()
 
@@ -19,11 +21,25 @@ class DatabaseRow:
         raise NotImplementedError
 
 class DependingDatabase:
-    """需要数据库连接的抽象基类"""
+    """
+    需要数据库连接的抽象基类
+    - `connect` 打开连接并检查表结构， `close` 关闭连接
+    - `commit` `rollback` 在连接保持打开时结束一次事务
+    - `clone` 返回指向同一数据库的新实例，用于打开另一条只读连接
+    """
     __slots__ = ()
 
-    def connect(self) -> None:
+    def connect(self, readonly: bool = False) -> None:
+        raise NotImplementedError
+
+    def clone(self) -> 'DependingDatabase':
         raise NotImplementedError
 
     def close(self, commit: bool) -> None:
         raise NotImplementedError
+
+    def commit(self) -> None:
+        raise NotImplementedError
+
+    def rollback(self) -> None:
+        raise NotImplementedError
@@ -0,0 +1,108 @@
+"""
+为每种 `DatabaseRow` 生成专用的编码/解码函数
+第一次使用某种行类型时，按照其 `keys` 和 `adapters` 生成源码并编译，之后从缓存中取用；
+不进行转换的适配器（如 `IntAdapter` ）会被直接跳过
+"""
+
+from typing import Any, Callable, Generic, Sequence, Type, TypeVar
+
+from .abc import DatabaseRow
+from .adapters import NoneAdapterMethods
+
+RT = TypeVar('RT', bound=DatabaseRow)
+
+
+def _is_identity(adapter: type) -> bool:
+    return adapter.serialized is NoneAdapterMethods.serialized \
+        and adapter.deserialized is NoneAdapterMethods.deserialized
+
+
+def _compile(name: str, source: str, namespace: dict[str, Any]) -> Callable:
+    exec(compile(source, f'<sqlite_tools.codec {name}>', 'exec'), namespace)
+    return namespace[name]
+
+
+class RowCodec(Generic[RT]):
+    """
+    - `:member encode:` 行对象 -> 可以写入 sqlite 的元组，顺序同 `keys`
+    - `:member decode:` sqlite 返回的元组 -> 行对象
+    """
+
+    __slots__ = ('encode', 'decode', '_cols_decoders', 'row_obj_type')
+
+    def __init__(self, row_obj_type: Type[RT]):
+        self.row_obj_type = row_obj_type
+        self._cols_decoders: dict[tuple[str, ...], Callable[[Sequence[Any]], tuple[Any, ...]]] = {}
+
+        namespace: dict[str, Any] = {'row_obj_type': row_obj_type}
+        enc_items: list[str] = []
+        dec_items: list[str] = []
+
+        for i, k in enumerate(row_obj_type.keys):
+            adapter = row_obj_type.adapters[k]
+
+            if _is_identity(adapter):
+                enc_items.append(f'obj.{k}')
+                dec_items.append(f'row[{i}]')
+            else:
+                namespace[f'ser_{i}'] = adapter.serialized
+                namespace[f'des_{i}'] = adapter.deserialized
+                enc_items.append(f'ser_{i}(obj.{k})')
+                dec_items.append(f'des_{i}(row[{i}])')
+
+        self.encode: Callable[[RT], tuple[Any, ...]] = _compile(
+            'encode',
+            'def encode(obj):\n'
+            f'    return ({", ".join(enc_items)},)\n',
+            namespace
+        )
+        self.decode: Callable[[Sequence[Any]], RT] = _compile(
+            'decode',
+            'def decode(row):\n'
+            f'    return row_obj_type({", ".join(dec_items)})\n',
+            namespace
+        )
+
+    def cols_decoder(self, cols: Sequence[str]) -> Callable[[Sequence[Any]], tuple[Any, ...]]:
+        """返回将 `SELECT cols` 的结果转换为元组的函数"""
+
+        key = tuple(cols)
+        decoder = self._cols_decoders.get(key, None)
+
+        if decoder is None:
+            namespace: dict[str, Any] = {}
+            items: list[str] = []
+
+            for i, k in enumerate(cols):
+                adapter = self.row_obj_type.adapters[k]
+
+                if _is_identity(adapter):
+                    items.append(f'row[{i}]')
+                else:
+                    namespace[f'des_{i}'] = adapter.deserialized
+                    items.append(f'des_{i}(row[{i}])')
+
+            decoder = _compile(
+                'decode_cols',
+                'def decode_cols(row):\n'
+                f'    return ({", ".join(items)},)\n',
+                namespace
+            )
+            self._cols_decoders[key] = decoder
+
+        return decoder
+
+
+_codecs: dict[type, RowCodec] = {}
+
+
+def get_codec(row_obj_type: Type[RT]) -> RowCodec[RT]:
+    """获取 `row_obj_type` 的编码器，第一次调用时生成"""
+
+    codec = _codecs.get(row_obj_type, None)
+
+    if codec is None:
+        codec = RowCodec(row_obj_type)
+        _codecs[row_obj_type] = codec
+
+    return codec
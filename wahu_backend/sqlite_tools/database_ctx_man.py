@@ -1,26 +1,63 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from inspect import Traceback
-from typing import Generic, Optional, TypeVar
+from typing import Callable, Generic, Optional, TypeVar, cast
 from asyncio import Lock
 
 from .abc import DependingDatabase
 
 
 T = TypeVar('T', bound=DependingDatabase)
+R = TypeVar('R')
+
+# 数据库连接空闲多少秒后被关闭
+DEFAULT_IDLE_TIMEOUT: float = 60
+
+# 所有数据库共用的只读线程池大小
+DEFAULT_READER_THREADS: int = 4
+
+_reader_executor: Optional[ThreadPoolExecutor] = None
+
+
+def set_idle_timeout(timeout: float) -> None:
+    """全局修改数据库连接的空闲超时"""
+
+    global DEFAULT_IDLE_TIMEOUT
+    DEFAULT_IDLE_TIMEOUT = timeout
+
+
+def set_reader_threads(num: int) -> None:
+    """全局修改只读线程池大小，须在第一次使用 `DatabaseContextManager.run` 之前调用"""
+
+    global DEFAULT_READER_THREADS
+    DEFAULT_READER_THREADS = num
+
+
+def _get_reader_executor() -> ThreadPoolExecutor:
+
+    global _reader_executor
+    if _reader_executor is None:
+        _reader_executor = ThreadPoolExecutor(
+            max_workers=DEFAULT_READER_THREADS,
+            thread_name_prefix='wahu-db-reader'
+        )
+    return _reader_executor
 
 
 class CtxInstance(Generic[T]):
 
-    __slots__ = ('dd', 'lock', 'readonly')
+    __slots__ = ('dcm', 'readonly')
 
-    def __init__(self, dd: T, lock: Lock, readonly: bool=False):
-        self.dd = dd
-        self.lock = lock
+    def __init__(self, dcm: 'DatabaseContextManager[T]', readonly: bool=False):
+        self.dcm = dcm
         self.readonly = readonly
 
     def __enter__(self) -> T:
 
-        self.dd.connect()
-        return self.dd
+        if self.readonly:
+            return self.dcm.reader_dd
+        return self.dcm.dd
 
     def __exit__(self,
                  excpt_type: Optional[type] = None,
@@ -28,19 +65,195 @@ class CtxInstance(Generic[T]):
                  excpt_tcbk: Optional[Traceback] = None):
         """异常照常抛出"""
 
-        self.dd.close(commit=(not self.readonly))
-        self.lock.release()
+        try:
+            if not self.readonly:
+                self.dcm.dd.commit()
+        finally:
+            self.dcm.release(self.readonly)
 
 class DatabaseContextManager(Generic[T]):
-    """对 DependingDatabase 类对象进行上下文管理"""
+    """
+    对 DependingDatabase 类对象进行上下文管理
+    - 写入者之间互斥，使用 `dd` 上的连接
+    - 只读者不需要等待，每个线程使用自己的只读连接 `reader_dd` ；
+      数据库处于 WAL 模式，只读者读到的是最近一次提交的内容
+    - 连接在第一次使用时打开，之后一直保持，空闲 `idle_timeout` 秒后关闭
+    - `run` 将数据库操作放到线程中执行：写入在此数据库独占的写线程上，
+      只读在所有数据库共用的线程池上
+    """
 
-    __slots__ = ('dd', 'lock')
+    __slots__ = ('dd', 'lock', 'readers', 'idle_timeout', 'connected',
+                 '_no_readers', '_idle_handle', '_connect_lock',
+                 '_reader_local', '_reader_dds', '_writer_executor')
 
-    def __init__(self, dd: T):
+    def __init__(self, dd: T, idle_timeout: Optional[float] = None):
         self.dd = dd
         self.lock = Lock()
+        self.readers = 0
+        self.idle_timeout = DEFAULT_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.connected = False
+        self._no_readers = asyncio.Event()
+        self._no_readers.set()
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+
+        self._connect_lock = threading.Lock()
+        self._reader_local = threading.local()
+        self._reader_dds: list[DependingDatabase] = []
+        self._writer_executor: Optional[ThreadPoolExecutor] = None
 
     async def __call__(self, readonly: bool=False) -> CtxInstance[T]:
 
+        if readonly:
+            self._acquire_reader()
+            return CtxInstance(self, readonly)
+
         await self.lock.acquire()
-        return CtxInstance(self.dd, self.lock, readonly)
+        self._cancel_idle()
+
+        try:
+            self._ensure_connected()
+        except BaseException:
+            self.release()
+            raise
+
+        return CtxInstance(self, readonly)
+
+    async def run(self, f: Callable[[T], R], readonly: bool = False) -> R:
+        """
+        在线程中执行 `f(dd)` 并等待其返回
+        - `:param f:` 对数据库进行的同步操作
+        - `:param readonly:` 为假时，结束后提交
+        """
+
+        loop = asyncio.get_running_loop()
+
+        if readonly:
+            self._acquire_reader()
+            fut = loop.run_in_executor(_get_reader_executor(), self._run_reader, f)
+        else:
+            await self.lock.acquire()
+            self._cancel_idle()
+            fut = loop.run_in_executor(self._get_writer_executor(), self._run_writer, f)
+
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            # 被取消时，线程中的操作仍在进行，等其结束再释放
+            if fut.done():
+                self.release(readonly)
+            else:
+                fut.add_done_callback(lambda _: self.release(readonly))
+
+    def _run_writer(self, f: Callable[[T], R]) -> R:
+
+        self._ensure_connected()
+        try:
+            return f(self.dd)
+        finally:
+            self.dd.commit()
+
+    def _run_reader(self, f: Callable[[T], R]) -> R:
+
+        return f(self.reader_dd)
+
+    def _get_writer_executor(self) -> ThreadPoolExecutor:
+
+        if self._writer_executor is None:
+            self._writer_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='wahu-db-writer'
+            )
+        return self._writer_executor
+
+    @property
+    def in_use(self) -> bool:
+        return self.lock.locked() or self.readers > 0
+
+    @property
+    def reader_dd(self) -> T:
+        """当前线程的只读实例"""
+
+        reader_dd = getattr(self._reader_local, 'dd', None)
+
+        if reader_dd is None:
+            self._ensure_connected()
+
+            reader_dd = self.dd.clone()
+            reader_dd.connect(readonly=True)
+
+            self._reader_local.dd = reader_dd
+            with self._connect_lock:
+                self._reader_dds.append(reader_dd)
+
+        return cast(T, reader_dd)
+
+    def _acquire_reader(self) -> None:
+
+        self._cancel_idle()
+        self.readers += 1
+        self._no_readers.clear()
+
+    def _cancel_idle(self) -> None:
+
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _ensure_connected(self) -> None:
+
+        # 写连接负责建表，所以总是先于只读连接打开
+        with self._connect_lock:
+            if not self.connected:
+                self.dd.connect()
+                self.connected = True
+
+    def release(self, readonly: bool = False) -> None:
+        """释放锁，并开始空闲计时"""
+
+        if readonly:
+            self.readers -= 1
+            if self.readers == 0:
+                self._no_readers.set()
+        else:
+            self.lock.release()
+
+        if self.in_use:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._close_connection()
+            return
+
+        self._idle_handle = loop.call_later(self.idle_timeout, self._close_idle)
+
+    def _close_idle(self) -> None:
+
+        self._idle_handle = None
+        if not self.in_use:
+            self._close_connection()
+
+    def _close_connection(self) -> None:
+
+        with self._connect_lock:
+            for reader_dd in self._reader_dds:
+                reader_dd.close(commit=False)
+            self._reader_dds = []
+            self._reader_local = threading.local()
+
+            if self.connected:
+                self.dd.close(commit=False)
+                self.connected = False
+
+    async def close(self) -> None:
+        """等待其他 task 使用完毕后关闭连接"""
+
+        async with self.lock:
+            await self._no_readers.wait()
+
+            self._cancel_idle()
+            self._close_connection()
+
+            if self._writer_executor is not None:
+                self._writer_executor.shutdown()
+                self._writer_executor = None
@@ -38,7 +38,7 @@ class ConfigStoredinSqlite(SqliteTableEditor[RT]):
 
     @property
     def empty(self) -> bool:
-        return len(self.select()) == 0
+        return self.count() == 0
 
     def insert(self, rows: Iterable[RT]) -> list[bool]:
         if not self.empty:
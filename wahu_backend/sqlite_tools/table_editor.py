@@ -1,16 +1,22 @@
 import itertools
+import json
 import sqlite3
-from typing import Any, Generic, Iterable, Optional, Type, TypeVar, Union
+from typing import (Any, Generic, Iterable, Iterator, Optional, Sequence, Type,
+                    TypeVar, Union)
 
 from .abc import DatabaseRow
+from .codec import RowCodec, get_codec
 from .st_exceptions import (SqliteTableEditingKeyError,
                             SqliteTableEditingMutateIndex)
 
 RT = TypeVar('RT', bound=DatabaseRow)  # row_obj_type for type static checking
 
+# 单条语句中 `?` 占位符数量的上限，旧版 sqlite 为 999
+SQLITE_MAX_VARIABLES = 999
+
 class SqliteTableEditor(Generic[RT]):
 
-    __slots__ = ('name', 'heads', 'index_name', 'row_obj_type', 'cursor')
+    __slots__ = ('name', 'heads', 'index_name', 'row_obj_type', 'cursor', 'codec')
 
     def __init__(self, name: str, row_obj_type: Type[RT]) -> None:
         """
@@ -24,6 +30,7 @@ class SqliteTableEditor(Generic[RT]):
 
         self.index_name = row_obj_type.index
         self.row_obj_type = row_obj_type
+        self.codec: RowCodec[RT] = get_codec(row_obj_type)
 
         self.cursor: sqlite3.Cursor
 
@@ -44,6 +51,16 @@ class SqliteTableEditor(Generic[RT]):
             for k in self.heads))
         self.cursor.execute(f'CREATE TABLE {self.name} '
                             f'({column_heads})')
+        self.create_indexes()
+
+    def create_indexes(self) -> None:
+        """
+        为 `row_obj_type.indexed` 中的列创建索引，已经存在的会被跳过
+        """
+        for k in self.row_obj_type.indexed:
+            self.cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.name}_{k} '
+                f'ON {self.name} ({k})')
 
     def has_created(self):
         """
@@ -55,45 +72,182 @@ class SqliteTableEditor(Generic[RT]):
 
     def create_if_not(self):
         """
-        懒创建
+        懒创建；表已经存在时，补上缺少的索引
         """
         if not self.has_created():
             self.create()
+        else:
+            self.create_indexes()
 
-    def select(self, index_val: Optional[Union[str, int]] = None, **kwds) -> list[RT]:
+    def _where(self, index_val: Optional[Union[str, int]],
+               kwds: dict[str, Any]) -> tuple[str, tuple[Any, ...]]:
         """
-        使用 SELECT 语句
-        - `:param index_val:` 选中的行的 `self.index_name` 列的值
-        - `:param kwds:` 如果提供了 ，则使用 `kwds` 作为 `WHERE ` 子句的参数
+        生成 `WHERE` 子句及其参数，规则同 `select`
         """
 
         if kwds != {}:
             if not set(kwds.keys()).issubset(self.heads):
                 raise SqliteTableEditingKeyError(list(kwds.keys()), self.heads)
 
-            query_string = f'SELECT * FROM {self.name} WHERE ' \
-                           + ",".join([f"{k}=?" for k in kwds.keys()])
-            db_ret = self.cursor.execute(
-                query_string,
-                tuple((kwds[k] for k in kwds.keys()))
-            )
+            return ' WHERE ' + ' AND '.join(f'{k}=?' for k in kwds.keys()), \
+                tuple(kwds.values())
+
+        if index_val is None:
+            return '', ()
+
+        return f' WHERE {self.index_name}=?', (index_val, )
+
+    def _order_limit(
+        self,
+        order_by: Optional[str],
+        desc: bool,
+        limit: Optional[int],
+        offset: Optional[int]
+    ) -> tuple[str, tuple[Any, ...]]:
+        """
+        生成 `ORDER BY` 和 `LIMIT` 子句及其参数，规则同 `select`
+        """
+
+        clause = ''
+        params: tuple[Any, ...] = ()
+
+        if order_by is not None:
+            if order_by not in self.heads:
+                raise SqliteTableEditingKeyError([order_by], self.heads)
+
+            direction = 'DESC' if desc else 'ASC'
+            clause += f' ORDER BY {order_by} {direction}'
+            if order_by != self.index_name:
+                clause += f',{self.index_name} {direction}'
+
+        if limit is not None or offset is not None:
+            # sqlite 中 LIMIT -1 代表无限制
+            clause += ' LIMIT ? OFFSET ?'
+            params = (-1 if limit is None else limit,
+                      0 if offset is None else offset)
+
+        return clause, params
+
+    def select(
+        self,
+        index_val: Optional[Union[str, int]] = None,
+        *,
+        order_by: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        **kwds
+    ) -> list[RT]:
+        """
+        使用 SELECT 语句
+        - `:param index_val:` 选中的行的 `self.index_name` 列的值
+        - `:param order_by:` 排序所依据的列，值相同时再按索引排序；默认不排序
+        - `:param desc:` 是否降序
+        - `:param limit:` 至多返回的行数
+        - `:param offset:` 跳过的行数
+        - `:param kwds:` 如果提供了 ，则使用 `kwds` 作为 `WHERE ` 子句的参数
+        """
+
+        where_string, params = self._where(index_val, kwds)
+        order_string, order_params = self._order_limit(order_by, desc, limit, offset)
+        db_ret = self.cursor.execute(
+            f'SELECT {self._heads_string} FROM {self.name}{where_string}{order_string}',
+            params + order_params).fetchall()
+
+        return list(map(self.codec.decode, db_ret))
+
+    def count(self, index_val: Optional[Union[str, int]] = None, **kwds) -> int:
+        """
+        使用 `SELECT COUNT(*)` 计数，参数同 `select`
+        """
+
+        where_string, params = self._where(index_val, kwds)
+        return self.cursor.execute(
+            f'SELECT COUNT(*) FROM {self.name}{where_string}', params).fetchone()[0]
+
+    def select_iter(self, batch_size: int = 500, **kwds) -> Iterator[RT]:
+        """
+        与 `select` 相同，但是每次只从 sqlite 取出 `batch_size` 行并逐个产出，
+        不会把整张表读入内存.
+        使用独立的 cursor ，迭代过程中可以继续使用此 editor 的其他方法
+        - `:param batch_size:` 每次 `fetchmany` 的行数
+        - `:param kwds:` 同 `select`
+        """
+
+        where_string, params = self._where(None, kwds)
+        cursor = self.cursor.connection.cursor()
+        decode = self.codec.decode
+
+        try:
+            cursor.execute(f'SELECT {self._heads_string} FROM {self.name}{where_string}', params)
 
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if batch == []:
+                    break
+                yield from map(decode, batch)
+
+        finally:
+            cursor.close()
+
+    def page_key(self, row: RT, order_by: Optional[str] = None) -> tuple[Any, ...]:
+        """
+        计算 `row` 在按 `order_by` 排序时的分页键，作为 `select_page` 的 `after` 参数
+        """
+
+        if order_by is None or order_by == self.index_name:
+            return (getattr(row, self.index_name), )
+
+        return (self.row_obj_type.adapters[order_by].serialized(getattr(row, order_by)),
+                getattr(row, self.index_name))
+
+    def select_page(
+        self,
+        after: Optional[Sequence[Any]] = None,
+        limit: int = 100,
+        order_by: Optional[str] = None,
+        desc: bool = False
+    ) -> list[RT]:
+        """
+        按键集分页读取：返回排在 `after` 之后的至多 `limit` 行.
+        不使用 OFFSET ，因此翻到靠后的页也不需要扫描前面的行
+        - `:param after:` 上一页最后一行的 `page_key` ， `None` 代表第一页
+        - `:param limit:` 每页行数
+        - `:param order_by:` 排序所依据的列，默认为索引列；相同时再按索引排序
+        - `:param desc:` 是否降序
+        """
+
+        if order_by is None:
+            order_by = self.index_name
+        elif order_by not in self.heads:
+            raise SqliteTableEditingKeyError([order_by], self.heads)
+
+        if order_by == self.index_name:
+            order_cols = [self.index_name]
         else:
+            order_cols = [order_by, self.index_name]
+
+        direction = 'DESC' if desc else 'ASC'
+        order_string = ','.join(f'{c} {direction}' for c in order_cols)
+
+        if after is None:
+            where_string, params = '', ()
+        else:
+            params = tuple(after)
+            if len(params) != len(order_cols):
+                raise ValueError(f'after 应为 {len(order_cols)} 元组，而非 {after}')
+
+            # sqlite 的行值比较 (a, b) > (?, ?) 即字典序比较
+            cols_string = ','.join(order_cols)
+            placeholders = ','.join(itertools.repeat('?', len(params)))
+            where_string = f' WHERE ({cols_string}) {"<" if desc else ">"} ({placeholders})'
 
-            if index_val is None:
-                query_string = f'SELECT * FROM {self.name}'
-                db_ret = self.cursor.execute(query_string).fetchall()
-            else:
-                query_string = f'SELECT * FROM {self.name} ' \
-                    f'WHERE {self.index_name}=?'
-                db_ret = self.cursor.execute(query_string,
-                                             (index_val, )).fetchall()
-
-        return [
-            self.row_obj_type(
-                *(self.row_obj_type.adapters[k].deserialized(row[i])
-                  for i, k in enumerate(self.heads))) for row in db_ret
-        ]
+        db_ret = self.cursor.execute(
+            f'SELECT {self._heads_string} FROM {self.name}{where_string} '
+            f'ORDER BY {order_string} LIMIT ?',
+            (*params, limit)).fetchall()
+
+        return list(map(self.codec.decode, db_ret))
 
     def select_cols(self,
                     index_val: Optional[Union[str, int]] = None,
@@ -120,10 +274,7 @@ class SqliteTableEditor(Generic[RT]):
             db_ret = self.cursor.execute(query_string,
                                          (index_val, )).fetchall()
 
-        return [
-            tuple((self.row_obj_type.adapters[k].deserialized(row[i])
-                   for i, k in enumerate(cols))) for row in db_ret
-        ]
+        return list(map(self.codec.cols_decoder(cols), db_ret))
 
     def has(self, index_val: Union[str, int]) -> bool:
         return self.cursor.execute(
@@ -132,32 +283,107 @@ class SqliteTableEditor(Generic[RT]):
             (index_val,)
         ).fetchone() != None
 
+    def existing(self, index_vals: Iterable[Union[str, int]]) -> set[Union[str, int]]:
+        """
+        批量查询 `index_vals` 中已经存在于表中的索引值
+        - `:return:` 存在的索引值的集合
+        """
+        index_vals = list(index_vals)
+        result: set[Union[str, int]] = set()
+
+        for begin in range(0, len(index_vals), SQLITE_MAX_VARIABLES):
+            chunk = index_vals[begin:begin + SQLITE_MAX_VARIABLES]
+            placeholders = ','.join(itertools.repeat('?', len(chunk)))
+            result.update(r[0] for r in self.cursor.execute(
+                f'SELECT {self.index_name} FROM {self.name} '
+                f'WHERE {self.index_name} IN ({placeholders})',
+                chunk
+            ))
+
+        return result
+
     def insert(self, rows: Iterable[RT]) -> list[bool]:
         """
-        插入新值
+        插入新值. 所有行先经适配器转换，然后使用 `executemany` 和
+        `INSERT ... ON CONFLICT DO UPDATE` 一次写入
         - `:param rows:` 要插入的行
         - `:return result:` `Iterable[bool]` ，如果对应行在数据库中，
                             则值为 `False` ，否则 `True`
         """
+        db_rows = list(map(self.codec.encode, rows))
+
+        index_pos = self.heads.index(self.index_name)
+        index_vals = [r[index_pos] for r in db_rows]
+
+        # 同一批中重复出现的索引，第二次及以后视为已存在
+        seen = self.existing(index_vals)
         result: list[bool] = []
-        for row in rows:
-            # 清理旧值
-            if self.has(getattr(row, self.index_name)):
-                self.delete([getattr(row, self.index_name)])
-                result.append(False)
-            else:
-                result.append(True)
-
-            insert_string = ','.join(itertools.repeat('?', len(self.heads)))
-            db_row = (self.row_obj_type.adapters[k].serialized(getattr(row, k))
-                      for k in self.heads)
+        for iv in index_vals:
+            result.append(iv not in seen)
+            seen.add(iv)
 
-            self.cursor.execute(
-                f'INSERT INTO {self.name} VALUES ({insert_string})',
-                list(db_row))
+        if db_rows != []:
+            self.cursor.executemany(self._upsert_string, db_rows)
 
         return result
 
+    @property
+    def _heads_string(self) -> str:
+        # 显式列出表头，表中额外的列（如生成列）不会被读出
+        return ','.join(self.heads)
+
+    @property
+    def _conflict_action(self) -> str:
+        update_string = ','.join(
+            f'{k}=excluded.{k}' for k in self.heads if k != self.index_name)
+
+        if update_string == '':
+            return 'DO NOTHING'
+        return f'DO UPDATE SET {update_string}'
+
+    @property
+    def _upsert_string(self) -> str:
+        insert_string = ','.join(itertools.repeat('?', len(self.heads)))
+
+        return f'INSERT INTO {self.name} ({self._heads_string}) VALUES ({insert_string}) ' \
+               f'ON CONFLICT({self.index_name}) {self._conflict_action}'
+
+    def _index_in(
+        self, index_vals: Optional[Iterable[Union[str, int]]], alias: str = ''
+    ) -> tuple[str, tuple[Any, ...]]:
+        """`index_vals` 为 `None` 时匹配所有行. 用 `json_each` 传入，不受变量个数的限制"""
+
+        if index_vals is None:
+            return 'true', ()
+        return (f'{alias}{self.index_name} IN (SELECT value FROM json_each(?))',
+                (json.dumps(list(index_vals)), ))
+
+    def copy_from(
+        self,
+        schema: str,
+        index_vals: Optional[Iterable[Union[str, int]]] = None,
+        conflict_action: Optional[str] = None
+    ) -> int:
+        """
+        从 `ATTACH` 到同一连接上的数据库 `schema` 的同名表复制行，使用 `INSERT ... SELECT` ，
+        不在 Python 中解码
+        - `:param index_vals:` 只复制这些行， `None` 表示全部
+        - `:param conflict_action:` 已存在的行的处理，如 `DO NOTHING` ；默认用源数据库的行覆盖
+        - `:return:` 复制的行数
+        """
+
+        where_string, params = self._index_in(index_vals)
+        if conflict_action is None:
+            conflict_action = self._conflict_action
+
+        self.cursor.execute(
+            f'INSERT INTO {self.name} ({self._heads_string}) '
+            f'SELECT {self._heads_string} FROM {schema}.{self.name} WHERE {where_string} '
+            f'ON CONFLICT({self.index_name}) {conflict_action}',
+            params)
+
+        return self.cursor.rowcount
+
     def delete(
             self,
             index_val_iter: Optional[Iterable[Union[str,
@@ -17,6 +17,7 @@ class WahuConfig:
     temp_download_dir: Path
     cli_script_dir: Path
     tag_model_dir: Path
+    image_cache_dir: Optional[Path]
     # network
     doh_urls: Optional[list[str]]
     doh_ssl: bool
@@ -36,12 +37,34 @@ class WahuConfig:
     image_connection_limit: int
     image_num_parallel: int
     image_download_record_size: int
+    image_retries: int
+    image_retry_backoff: float
+    image_segment_threshold_mb: Optional[float]
+    image_segments: int
     # app
     server_host: str
     server_port: int
     agenerator_pool_size: int
-    image_pool_size: int
+    image_pool_thumbnail_mb: float
+    image_pool_original_mb: float
+    image_disk_cache_mb: float
     default_fuzzy_cutoff: int
+    database_idle_timeout: float
+    database_reader_threads: int
+    ibd_fulltext_index: bool
+    ibd_memory_index: bool
+    ibd_update_concurrency: int
+    ibd_update_chunk_size: int
+    ibd_refresh_days: float
+    ibd_subscribe_concurrency: int
+    ibd_subscribe_rate: float
+    # jobs
+    job_concurrency: int
+    job_jitter: float
+    job_startup_delay: float
+    job_update_subs_interval: float
+    job_update_detail_interval: float
+    job_sync_repo_interval: float
     # log
     log_rpc_ret_length: int
     # pylogging
@@ -9,6 +9,7 @@ from .config_object import WahuConfig
 from logging import config as log_cfg
 
 from ..manual_dns.dns_resolve import set_doh_ssl, set_doh_url
+from ..sqlite_tools.database_ctx_man import set_idle_timeout, set_reader_threads
 
 
 class WPath:
@@ -55,6 +56,9 @@ def load_config(config_file: Path) -> WahuConfig:
         temp_download_dir = wpath(d['local']['temp_download_dir'])
         cli_script_dir = wpath(d['local']['cli_script_dir'])
         tag_model_dir = wpath(d['local']['tag_model_dir'])
+        image_cache_dir = d['local'].get('image_cache_dir', None)
+        if image_cache_dir is not None:
+            image_cache_dir = wpath(image_cache_dir)
 
         # pixiv
         login_on_startup = d['pixiv'].get('login_on_startup', False)
@@ -87,18 +91,42 @@ def load_config(config_file: Path) -> WahuConfig:
         image_connection_limit = d['image'].get('connection_limit', 7)
         image_num_parallel = d['image'].get('num_parallel', 2)
         image_download_record_size = d['image'].get('download_record_size', 100)
+        image_retries = d['image'].get('retries', 3)
+        image_retry_backoff = d['image'].get('retry_backoff', 1.0)
+        image_segment_threshold_mb = d['image'].get('segment_threshold_mb', None)
+        image_segments = d['image'].get('segments', 4)
 
         # app
         server_host = d['app']['server_host']
         server_port = d['app']['server_port']
         agenerator_pool_size = d['app'].get('agenerator_pool_size', 200)
-        image_pool_size = d['app'].get('image_pool_size', 100)
+        image_pool_thumbnail_mb = d['app'].get('image_pool_thumbnail_mb', 64.0)
+        image_pool_original_mb = d['app'].get('image_pool_original_mb', 256.0)
+        image_disk_cache_mb = d['app'].get('image_disk_cache_mb', 1024.0)
         default_fuzzy_cutoff = d['app'].get('default_fuzzy_cutoff', 80)
+        database_idle_timeout = d['app'].get('database_idle_timeout', 60.0)
+        database_reader_threads = d['app'].get('database_reader_threads', 4)
+        ibd_fulltext_index = d['app'].get('ibd_fulltext_index', True)
+        ibd_memory_index = d['app'].get('ibd_memory_index', False)
+        ibd_update_concurrency = d['app'].get('ibd_update_concurrency', 8)
+        ibd_update_chunk_size = d['app'].get('ibd_update_chunk_size', 100)
+        ibd_refresh_days = d['app'].get('ibd_refresh_days', 0)
+        ibd_subscribe_concurrency = d['app'].get('ibd_subscribe_concurrency', 4)
+        ibd_subscribe_rate = d['app'].get('ibd_subscribe_rate', 2.0)
 
         # network
         doh_urls = d['app'].get('dns_over_https_urls', None)
         doh_ssl = d['app'].get('dns_over_https_ssl', True)
 
+        # jobs
+        jobs = d.get('jobs', {})
+        job_concurrency = jobs.get('concurrency', 2)
+        job_jitter = jobs.get('jitter', 0.1)
+        job_startup_delay = jobs.get('startup_delay', 30)
+        job_update_subs_interval = jobs.get('update_subs_interval', 0)
+        job_update_detail_interval = jobs.get('update_detail_interval', 0)
+        job_sync_repo_interval = jobs.get('sync_repo_interval', 0)
+
         # logging
         log_rpc_ret_length = d['logging'].get('rpc_return_length', 1000)
 
@@ -122,6 +150,7 @@ def load_config(config_file: Path) -> WahuConfig:
         temp_download_dir=temp_download_dir,
         cli_script_dir=cli_script_dir,
         tag_model_dir=tag_model_dir,
+        image_cache_dir=image_cache_dir,
         doh_urls=doh_urls,
         doh_ssl=doh_ssl,
         login_on_startup=login_on_startup,
@@ -137,11 +166,32 @@ def load_config(config_file: Path) -> WahuConfig:
         image_connection_limit=image_connection_limit,
         image_num_parallel=image_num_parallel,
         image_download_record_size=image_download_record_size,
+        image_retries=image_retries,
+        image_retry_backoff=image_retry_backoff,
+        image_segment_threshold_mb=image_segment_threshold_mb,
+        image_segments=image_segments,
         server_host=server_host,
         server_port=server_port,
         agenerator_pool_size=agenerator_pool_size,
-        image_pool_size=image_pool_size,
+        image_pool_thumbnail_mb=image_pool_thumbnail_mb,
+        image_pool_original_mb=image_pool_original_mb,
+        image_disk_cache_mb=image_disk_cache_mb,
         default_fuzzy_cutoff=default_fuzzy_cutoff,
+        database_idle_timeout=database_idle_timeout,
+        database_reader_threads=database_reader_threads,
+        ibd_fulltext_index=ibd_fulltext_index,
+        ibd_memory_index=ibd_memory_index,
+        ibd_update_concurrency=ibd_update_concurrency,
+        ibd_update_chunk_size=ibd_update_chunk_size,
+        ibd_refresh_days=ibd_refresh_days,
+        ibd_subscribe_concurrency=ibd_subscribe_concurrency,
+        ibd_subscribe_rate=ibd_subscribe_rate,
+        job_concurrency=job_concurrency,
+        job_jitter=job_jitter,
+        job_startup_delay=job_startup_delay,
+        job_update_subs_interval=job_update_subs_interval,
+        job_update_detail_interval=job_update_detail_interval,
+        job_sync_repo_interval=job_sync_repo_interval,
         log_rpc_ret_length=log_rpc_ret_length,
         pylogging_cfg_dict=pylogging_cfg_dict,
         original_dict=d
@@ -159,3 +209,11 @@ def conf_side_effects(conf: WahuConfig):
         set_doh_url(conf.doh_urls)
         set_doh_ssl(conf.doh_ssl)
 
+    set_idle_timeout(conf.database_idle_timeout)
+    set_reader_threads(conf.database_reader_threads)
+    # illust_bookmarking 依赖 wahu_core ，后者又依赖本模块，因此在此处导入
+    from ..illust_bookmarking.illust_table import set_fulltext_index
+    from ..illust_bookmarking.ngram_index import set_memory_index
+    set_fulltext_index(conf.ibd_fulltext_index)
+    set_memory_index(conf.ibd_memory_index)
+
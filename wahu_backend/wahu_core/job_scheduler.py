@@ -0,0 +1,188 @@
+"""
+后台定时任务
+- 每个任务按固定间隔运行，每次的间隔加上随机偏移，避免所有任务同时启动
+- 同时运行的任务数有上限
+- 任务声明它使用的资源（如 `ibd:<数据库名>` ），使用同一资源的任务不会同时运行
+"""
+
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from random import uniform
+from time import monotonic, time
+from typing import Any, Callable, Coroutine, Iterable, Optional, Union
+
+from .core_exceptions import WahuRuntimeError
+
+logger = logging.getLogger('wahu_core.job_scheduler')
+
+JobFunc = Callable[[], Coroutine[None, None, Any]]
+# 固定的资源，或每次运行前求得资源的函数
+JobResources = Union[Iterable[str], Callable[[], Iterable[str]]]
+
+
+@dataclass(slots=True)
+class JobStatus:
+    name: str
+    interval: float  # 单位为秒
+    running: bool
+    run_count: int
+    next_run: Optional[float]  # UNIX 时间戳
+    last_start: Optional[float]  # UNIX 时间戳
+    last_latency: Optional[float]  # 上次运行耗费的秒数
+    last_error: Optional[str]
+
+
+class Job:
+    """一个定时任务"""
+
+    __slots__ = ('name', 'interval', 'resources', 'func', 'status', 'trigger')
+
+    def __init__(
+        self, name: str, interval: float, func: JobFunc, resources: JobResources
+    ):
+        self.name = name
+        self.interval = interval
+        self.func = func
+
+        self.resources: Callable[[], Iterable[str]]
+        if callable(resources):
+            self.resources = resources
+        else:
+            fixed = list(resources)
+            self.resources = lambda: fixed
+
+        self.status = JobStatus(name, interval, False, 0, None, None, None, None)
+        # 设置后立即运行
+        self.trigger = asyncio.Event()
+
+
+class JobScheduler:
+    """
+    后台任务调度器
+    - `:param concurrency:` 同时运行的任务数
+    - `:param jitter:` 每次间隔随机偏移的比例
+    - `:param startup_delay:` 启动后第一次运行前等待的秒数
+    """
+
+    def __init__(self, concurrency: int = 2, jitter: float = 0.1, startup_delay: float = 30):
+        self.jobs: dict[str, Job] = {}
+        self.jitter = jitter
+        self.startup_delay = startup_delay
+
+        self._sem = asyncio.Semaphore(max(concurrency, 1))
+        self._resource_locks: dict[str, asyncio.Lock] = {}
+        # 任务名到其循环
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+        self._started = False
+
+    def add(
+        self, name: str, interval: float, func: JobFunc, resources: JobResources = ()
+    ) -> None:
+        """
+        添加任务. 在 `start` 之后添加的任务在一个间隔后第一次运行
+        - `:param interval:` 运行间隔的秒数
+        - `:param resources:` 任务使用的资源；为函数时在每次运行前调用
+        """
+
+        if name in self.jobs.keys():
+            raise WahuRuntimeError(f'JobScheduler: 任务 {name} 已存在')
+
+        job = Job(name, interval, func, resources)
+        self.jobs[name] = job
+
+        if self._started:
+            self._tasks[name] = asyncio.create_task(self._loop(job, interval))
+
+    async def remove(self, name: str) -> None:
+        """删除任务，正在运行则取消. 没有这个任务时什么也不做"""
+
+        self.jobs.pop(name, None)
+
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def start(self) -> None:
+        """为每个任务启动一个循环，已经启动则什么也不做"""
+
+        if self._started:
+            return
+
+        self._started = True
+        self._tasks = {
+            name: asyncio.create_task(self._loop(job, self.startup_delay))
+            for name, job in self.jobs.items()
+        }
+
+    async def stop(self) -> None:
+        """取消所有任务，包括正在运行的"""
+
+        self._started = False
+
+        tasks = list(self._tasks.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+
+    def status(self) -> list[JobStatus]:
+        return [job.status for job in self.jobs.values()]
+
+    def run_now(self, name: str) -> None:
+        """让任务立即运行一次；任务正在运行时，在这次结束后立即再运行"""
+
+        if name not in self.jobs.keys():
+            raise WahuRuntimeError(f'JobScheduler: 没有任务 {name}')
+
+        self.jobs[name].trigger.set()
+
+    def _delay(self, base: float) -> float:
+        return max(base + uniform(-self.jitter, self.jitter) * base, 0)
+
+    async def _loop(self, job: Job, first_delay: float) -> None:
+
+        delay = self._delay(first_delay)
+
+        while True:
+            job.status.next_run = time() + delay
+
+            try:
+                await asyncio.wait_for(job.trigger.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            job.trigger.clear()
+
+            await self._run(job)
+
+            delay = self._delay(job.interval)
+
+    async def _run(self, job: Job) -> None:
+
+        async with self._sem, AsyncExitStack() as held:
+            # 排序后依次加锁，避免死锁；等待时被取消，已经获得的锁也会被释放
+            for r in sorted(set(job.resources())):
+                await held.enter_async_context(
+                    self._resource_locks.setdefault(r, asyncio.Lock()))
+
+            job.status.running = True
+            job.status.next_run = None
+            job.status.last_start = time()
+            begin = monotonic()
+
+            try:
+                await job.func()
+                job.status.last_error = None
+            except Exception as e:
+                logger.exception('JobScheduler: 任务 %s 失败' % job.name)
+                job.status.last_error = repr(e)
+            finally:
+                job.status.last_latency = monotonic() - begin
+                job.status.run_count += 1
+                job.status.running = False
@@ -12,8 +12,10 @@ from ..aiopixivpy import MaintainedSessionPixivAPI
 from ..file_tracing import FileTracer
 from ..illust_bookmarking import IllustBookmarkDatabase
 from ..pixiv_image import PixivImagePool
+from ..pixiv_image.disk_cache import DiskImageCache
 from ..sqlite_tools.database_ctx_man import DatabaseContextManager
 from ..wahu_config.config_object import WahuConfig
+from .job_scheduler import JobScheduler
 from .repo_db_link import RepoDatabaseLink, RepoEntry
 from .wahu_cli import WahuCliScript, load_cli_scripts
 from .wahu_generator_pool import WahuAsyncGeneratorPool
@@ -91,16 +93,31 @@ class WahuContext:
         # 图片服务
         self.image_pool = PixivImagePool(
             host=self.config.image_host_ip,
-            size=self.config.image_pool_size,
+            thumbnail_budget=int(self.config.image_pool_thumbnail_mb * 2 ** 20),
+            original_budget=int(self.config.image_pool_original_mb * 2 ** 20),
+            disk_cache=None if self.config.image_cache_dir is None else DiskImageCache(
+                self.config.image_cache_dir, int(self.config.image_disk_cache_mb * 2 ** 20)),
             timeout=self.config.image_timeout,
             connection_limit=self.config.image_connection_limit,
             num_parallel=self.config.image_num_parallel,
-            record_size=self.config.image_download_record_size
+            record_size=self.config.image_download_record_size,
+            retries=self.config.image_retries,
+            backoff=self.config.image_retry_backoff,
+            segment_threshold=None if self.config.image_segment_threshold_mb is None
+                else int(self.config.image_segment_threshold_mb * 2 ** 20),
+            segments=self.config.image_segments
         )
 
         # 异步生成器池
         self.agenerator_pool = WahuAsyncGeneratorPool(self.config.agenerator_pool_size)
 
+        # 后台任务，由服务器注册并启动
+        self.jobs = JobScheduler(
+            concurrency=self.config.job_concurrency,
+            jitter=self.config.job_jitter,
+            startup_delay=self.config.job_startup_delay
+        )
+
         # 命令行脚本
         self.load_cli_scripts()
 
@@ -116,9 +133,13 @@ class WahuContext:
         self.cli_complete = ShellComplete(self.wexe, {}, '', '')
 
     async def cleanup(self):
+        await self.jobs.stop()
         await self.papi.close_session()
         await self.image_pool.close_session()
 
+        for dcm in (*self.ilst_bmdbs.values(), *self.ilst_repos.values()):
+            await dcm.close()
+
         for cs in self.cli_scripts:
             if cs.cleanup_hook is not None:
                 cs.cleanup_hook(self)
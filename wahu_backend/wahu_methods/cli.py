@@ -17,6 +17,7 @@ from .wahu_generator import WahuGeneratorMethods
 from .get_token import WahuGetTokenMethods
 from .tag_statistic import WahuTagStatisticMethods
 from .log import WahuLoggingMethods
+from .jobs import WahuJobMethods
 
 
 @dataclass(slots=True)
@@ -53,7 +54,7 @@ def _wahu_exec_with_pipe(
 class WahuMetdodsWithCli(
     WahuIllustDatabaseMethods, WahuPixivMethods, WahuGeneratorMethods,
     IllustRepoMethods, WahuMiscMethods, WahuGetTokenMethods,
-    WahuTagStatisticMethods, WahuLoggingMethods
+    WahuTagStatisticMethods, WahuLoggingMethods, WahuJobMethods
 ):
 
     @classmethod
@@ -1,5 +1,6 @@
 import argparse
 import dataclasses
+import heapq
 import json
 from pathlib import Path
 import asyncio
@@ -7,13 +8,20 @@ from typing import TYPE_CHECKING, Literal, Optional, Type, TypeVar, AsyncGenerat
 
 import click
 
-from ..aiopixivpy import IllustDetail, PixivUserSummery, IllustTag
+from ..aiopixivpy import IllustDetail
 from ..illust_bookmarking import IllustBookmark, IllustBookmarkDatabase, IllustBookmarkingConfig
+from ..illust_bookmarking.illust_bookmark_database import fetch_details
+from ..illust_bookmarking.ib_datastructure import PagesPolicy
+from ..illust_bookmarking.ndjson import (ExportCursor, NdjsonDecoder, NdjsonError,
+                                         dump_page, illust_from_dict, load_ndjson,
+                                         write_ndjson)
+from ..illust_bookmarking.snapshot import SnapshotError, load_snapshot, write_snapshot
 from ..sqlite_tools.database_ctx_man import DatabaseContextManager
 from ..wahu_core.wahu_cli import AsyncGenPipe
 from ..wahu_core import (GenericWahuMethod, WahuArguments, WahuContext,
                          wahu_methodize)
 from ..wahu_core.core_exceptions import WahuRuntimeError
+from .jobs import add_ibd_jobs, remove_ibd_jobs
 from .lib_logger import logger
 from .lib_modded_argparser import ArgumentParser
 
@@ -22,6 +30,11 @@ if TYPE_CHECKING:
 
 RT = TypeVar('RT')  # Return Type
 
+# NDJSON 导出时每块的行数
+NDJSON_CHUNK_LINES = 500
+# NDJSON 和快照导入时每次提交的行数
+NDJSON_BATCH_SIZE = 1000
+
 
 async def _check_db_name(
     m: GenericWahuMethod[RT],
@@ -70,6 +83,24 @@ def create_ibd_query_parser() -> argparse.ArgumentParser:
 ibd_query_parser = create_ibd_query_parser()
 
 
+async def _aiter_bookmarks(
+    ctx: WahuContext, name: str, page_size: int = 500
+) -> AsyncGenerator[IllustBookmark, None]:
+    """按添加时间由新到旧逐页读出数据库 `name` 中的收藏，每页单独一次读取"""
+
+    after: Optional[list[int]] = None
+
+    while True:
+        bms, after = await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.bookmarks_page(after, page_size), readonly=True)
+
+        for bm in bms:
+            yield bm
+
+        if after is None:
+            break
+
+
 class WahuIllustDatabaseMethods:
 
     @classmethod
@@ -84,18 +115,26 @@ class WahuIllustDatabaseMethods:
     async def ibd_list_bm(cls, ctx: WahuContext, name: str) -> list[IllustBookmark]:
         """列出所有收藏"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            return ibd.all_bookmarks()
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.all_bookmarks(), readonly=True)
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_page_bm(
+        cls, ctx: WahuContext, name: str, after: Optional[list[int]], limit: int
+    ) -> tuple[list[IllustBookmark], Optional[list[int]]]:
+        """按添加时间由新到旧分页列出收藏，返回本页和下一页的分页键"""
+
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.bookmarks_page(after, limit), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
     async def ibd_ilst_count(cls, ctx: WahuContext, name: str) -> int:
         """返回所有储存了的详情的数量"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            lst = ibd.all_illusts()
-
-        return len(lst)
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.illust_count(), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -123,8 +162,8 @@ class WahuIllustDatabaseMethods:
     ) -> Optional[IllustDetail]:
         """在数据库中查询插画详情"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            return ibd.query_detail(iid)
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.query_detail(iid), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -133,8 +172,8 @@ class WahuIllustDatabaseMethods:
     ) -> Optional[IllustBookmark]:
         """在数据库中查询收藏情况"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            return ibd.query_bookmark(iid)
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.query_bookmark(iid), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -154,22 +193,20 @@ class WahuIllustDatabaseMethods:
         if cutoff is None:
             cutoff = ctx.config.default_fuzzy_cutoff
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            match target:
-                case 'title':
-                    ret = ibd.query_title(keyword, cutoff=cutoff)
-
-                case 'caption':
-                    ret = ibd.query_caption(keyword, cutoff=cutoff)
-
-                case 'tag':
-                    ret = ibd.query_tag(keyword, cutoff=cutoff)
-
-                case 'username':
-                    ret = ibd.query_username(keyword, cutoff=cutoff)
-
-                case _:
-                    raise WahuRuntimeError(f'不合法的 target {target}')
+        match target:
+            case 'title':
+                query = IllustBookmarkDatabase.query_title
+            case 'caption':
+                query = IllustBookmarkDatabase.query_caption
+            case 'tag':
+                query = IllustBookmarkDatabase.query_tag
+            case 'username':
+                query = IllustBookmarkDatabase.query_username
+            case _:
+                raise WahuRuntimeError(f'不合法的 target {target}')
+
+        ret = await ctx.ilst_bmdbs[name].run(
+            lambda ibd: query(ibd, keyword, cutoff=cutoff), readonly=True)
 
         return [(iid, score) for iid, score in ret]
 
@@ -180,16 +217,16 @@ class WahuIllustDatabaseMethods:
     ) -> list[int]:
         """数据库中查询 `uid`"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            return ibd.query_uid(uid)
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.query_uid(uid), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
     async def ibd_filter_restricted(cls, ctx: WahuContext, name: str) -> list[int]:
         """数据库中被作者删除的插画"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            return ibd.filter_restricted()
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.filter_restricted(), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -204,11 +241,12 @@ class WahuIllustDatabaseMethods:
         if ns.iid:
             iids = list(map(int, ns.keyword.split(',')))
 
-            iids_exist = []
-            with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-                for iid in iids:
-                    if ibd.query_bookmark(iid) is not None:
-                        iids_exist.append(iid)
+            iids_exist = await ctx.ilst_bmdbs[name].run(
+                lambda ibd: [
+                    iid for iid in iids if ibd.query_bookmark(iid) is not None
+                ],
+                readonly=True
+            )
 
             return [(iid, -1) for iid in iids_exist]
 
@@ -227,12 +265,62 @@ class WahuIllustDatabaseMethods:
             iids = await cls.ibd_filter_restricted(ctx, name)
             return [(iid, -1) for iid in iids]
         elif ns.all:
-            with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-                return [(bm.iid, -1) for bm in ibd.all_bookmarks()]
+            return [(bm.iid, -1) async for bm in _aiter_bookmarks(ctx, name)]
 
         else:  # else if ns.title
             return await cls.ibd_fuzzy_query(ctx, name, 'title', ns.keyword, ns.cutoff)
 
+    @classmethod
+    @wahu_methodize()
+    async def ibd_query_multi(
+        cls, ctx: WahuContext, names: list[str], qs: str, limit: Optional[int]
+    ) -> AsyncGenerator[list[tuple[str, int, int]], None]:
+        """
+        在多个数据库中同时使用命令行查询，语法同 `ibd_query`.
+        返回异步生成器，每有一个数据库查询完成，产出目前得分最高的 `limit` 个结果
+        `(数据库名, iid, 得分)` ，按得分从高到低排列；每次产出的结果替代上一次的.
+        得分相同时，先完成查询的数据库排在前面
+        - `:param limit:` `None` 表示不限
+        """
+
+        for name in names:
+            if name not in ctx.ilst_bmdbs.keys():
+                raise WahuRuntimeError(f'ibd_query_multi: 数据库名 {name} 不在上下文中')
+
+        # 查询语法错误时立刻抛出，而不是在生成器中
+        ibd_query_parser.parse_args(click.parser.split_arg_string(qs))
+
+        async def query(name: str) -> tuple[str, list[tuple[int, int]]]:
+            return name, await cls.ibd_query(ctx, name, qs)
+
+        async def gen() -> AsyncGenerator[list[tuple[str, int, int]], None]:
+            tasks = [asyncio.create_task(query(name)) for name in dict.fromkeys(names)]
+
+            # 最小堆，元素为 (得分, -到达顺序, 数据库名, iid)，堆顶是目前最差的结果
+            heap: list[tuple[int, int, str, int]] = []
+            arrived = 0
+
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    name, ret = await fut
+
+                    for iid, score in ret:
+                        item = (score, -arrived, name, iid)
+                        arrived += 1
+
+                        if limit is None or len(heap) < limit:
+                            heapq.heappush(heap, item)
+                        elif item > heap[0]:
+                            heapq.heapreplace(heap, item)
+
+                    yield [(name, iid, score) for score, _, name, iid in sorted(heap, reverse=True)]
+
+            finally:
+                for t in tasks:
+                    t.cancel()
+
+        return gen()
+
     @classmethod
     @wahu_methodize()
     async def ibd_query_help(cls, ctx: WahuContext) -> str:
@@ -255,6 +343,7 @@ class WahuIllustDatabaseMethods:
                 name, ctx.config.database_dir / f'{name}.db'
             ))
         ctx.ilst_bmdbs[name] = new_ibd_ctx_wrapped
+        add_ibd_jobs(cls, ctx, name)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -263,10 +352,13 @@ class WahuIllustDatabaseMethods:
     ) -> None:
         """删除数据库"""
 
+        await remove_ibd_jobs(ctx, name)
+
         # 确保没有其他 task 在使用数据库
         with await ctx.ilst_bmdbs[name](readonly=False) as ibd:
             ibd_path = ibd.db_path
 
+        await ctx.ilst_bmdbs[name].close()
         ctx.ilst_bmdbs.pop(name)
 
         if isinstance(ibd_path, str):
@@ -283,78 +375,272 @@ class WahuIllustDatabaseMethods:
         if target not in ctx.ilst_bmdbs.keys():
             raise WahuRuntimeError(f'目标数据库 {target} 不存在')
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
+        source = ctx.ilst_bmdbs[name]
+
+        existing = await source.run(
+            lambda ibd: ibd.bookmarks_te.existing(iids), readonly=True)
+        for iid in iids:
+            if iid not in existing:
+                raise WahuRuntimeError(f'源数据库中不存在收藏 iid={iid}')
 
-            details = [ibd.query_detail(iid) for iid in iids]
-            bms: list[IllustBookmark] = []
-            for iid in iids:
-                bm = ibd.query_bookmark(iid)
-                if bm is None:
-                    raise WahuRuntimeError(f'源数据库中不存在收藏 iid={iid}')
-                else:
-                    bms.append(bm)
+        await ctx.ilst_bmdbs[target].run(
+            lambda target_ibd: target_ibd.merge_from(source.dd.db_path, iids))
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_merge(
+        cls, ctx: WahuContext, name: str, target: str, pages: PagesPolicy
+    ) -> tuple[int, int]:
+        """
+        把数据库 `name` 中的所有收藏和详情合并到 `target`
+        - `:param pages:` 两边都收藏了的插画的收藏页：
+                          `source` 使用 `name` 的， `target` 保留 `target` 的， `union` 取并集
+        - `:return:` `(复制的详情数, 复制的收藏数)`
+        """
 
-        details = [dtl for dtl in details if dtl is not None]
+        if target not in ctx.ilst_bmdbs.keys():
+            raise WahuRuntimeError(f'目标数据库 {target} 不存在')
+        if target == name:
+            raise WahuRuntimeError('不能将数据库合并到自身')
 
-        with await ctx.ilst_bmdbs[target](readonly=False) as target_ibd:
+        db_path = ctx.ilst_bmdbs[name].dd.db_path
 
-            [target_ibd.illusts_te.insert(details)]
-            [target_ibd.bookmarks_te.insert(bms)]
+        return await ctx.ilst_bmdbs[target].run(
+            lambda target_ibd: target_ibd.merge_from(db_path, pages=pages))
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_export_ndjson(
+        cls, ctx: WahuContext, name: str
+    ) -> AsyncGenerator[str, None]:
+        """
+        将数据库导出为 NDJSON ，返回逐块产出文本的异步生成器，格式见 `illust_bookmarking.ndjson`.
+        每块单独读取，导出期间写入的插画可能不在导出结果中
+        """
+
+        dcm = ctx.ilst_bmdbs[name]
+
+        async def gen() -> AsyncGenerator[str, None]:
+            cursor: Optional[ExportCursor] = None
+
+            while True:
+                chunk, cursor = await dcm.run(
+                    lambda ibd: dump_page(ibd, cursor, NDJSON_CHUNK_LINES), readonly=True)
+
+                if chunk != '':
+                    yield chunk
+                if cursor is None:
+                    return
+
+        return gen()
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
     async def ibd_export_json(
         cls, ctx: WahuContext, name: str
     ) -> str:
-        """将数据库导出为 json"""
+        """
+        已弃用，请使用 `ibd_export_ndjson` . 将数据库导出为旧版本的 JSON ，
+        整个数据库编码为一个字符串，可由 `ibd_import_json` 导入
+        """
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            illusts = ibd.all_illusts()
-            bookmarks = ibd.all_bookmarks()
+        logger.warning('ibd_export_json: 已弃用，请使用 ibd_export_ndjson')
 
-        d = {'illusts': [dataclasses.asdict(ilst) for ilst in illusts],
-             'bookmarks': [dataclasses.asdict(bm) for bm in bookmarks]}
+        def dump(ibd: IllustBookmarkDatabase) -> str:
+            # 逐条编码，不同时在内存中保留全部对象和字典
+            illusts = ','.join(
+                json.dumps(dataclasses.asdict(ilst), ensure_ascii=False)
+                for ilst in ibd.iter_illusts())
+            bookmarks = ','.join(
+                json.dumps(dataclasses.asdict(bm), ensure_ascii=False)
+                for bm in ibd.iter_bookmarks())
 
-        return json.dumps(d, ensure_ascii=False)
+            return f'{{"illusts": [{illusts}], "bookmarks": [{bookmarks}]}}'
+
+        return await ctx.ilst_bmdbs[name].run(dump, readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
-    async def ibd_import_json(
-        cls, ctx: WahuContext, name: str, json_str: str
+    async def ibd_export_ndjson_file(
+        cls, ctx: WahuContext, name: str, path: str
     ) -> None:
-        """将 JSON 文件导入数据库"""
+        """将数据库导出为服务器上的 NDJSON 文件 `path`"""
+
+        def dump(ibd: IllustBookmarkDatabase) -> None:
+            with open(path, 'w', encoding='utf-8') as f:
+                write_ndjson(ibd, f, NDJSON_CHUNK_LINES)
+
+        await ctx.ilst_bmdbs[name].run(dump, readonly=True)
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_export_snapshot(
+        cls, ctx: WahuContext, name: str, path: str
+    ) -> tuple[int, int]:
+        """
+        将数据库导出为服务器上的快照文件 `path` ，格式见 `illust_bookmarking.snapshot`
+        - `:return:` `(导出的详情数, 导出的收藏数)`
+        """
+
+        def dump(ibd: IllustBookmarkDatabase) -> tuple[int, int]:
+            with open(path, 'wb') as f:
+                return write_snapshot(ibd, f)
+
+        return await ctx.ilst_bmdbs[name].run(dump, readonly=True)
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_import_ndjson(
+        cls, ctx: WahuContext, name: str
+    ) -> AsyncGenerator[str, Optional[str]]:
+        """
+        将 NDJSON 导入数据库，返回异步生成器.
+        第一次调用后，每次调用向其发送一块文本（不必在行尾切分），发送 `None` 表示结束；
+        每 `NDJSON_BATCH_SIZE` 行写入并提交一次，产出进度
+        """
+
+        dcm = ctx.ilst_bmdbs[name]
+        decoder = NdjsonDecoder(NDJSON_BATCH_SIZE)
+
+        async def write(batch: tuple[list[IllustDetail], list[IllustBookmark]]) -> None:
+            def f(ibd: IllustBookmarkDatabase) -> None:
+                ibd.illusts_te.insert(batch[0])
+                ibd.bookmarks_te.insert(batch[1])
+
+            await dcm.run(f)
+
+        async def gen() -> AsyncGenerator[str, Optional[str]]:
+            num_illusts = num_bookmarks = 0
+
+            chunk = yield '开始导入\n'
+
+            while chunk is not None:
+                try:
+                    batches = list(decoder.feed(chunk))
+                except NdjsonError as e:
+                    raise WahuRuntimeError(str(e)) from e
+
+                for batch in batches:
+                    await write(batch)
+                    num_illusts += len(batch[0])
+                    num_bookmarks += len(batch[1])
+
+                chunk = yield f'已导入 {num_illusts} 条详情， {num_bookmarks} 条收藏\n'
+
+            try:
+                batch = decoder.finish()
+            except NdjsonError as e:
+                raise WahuRuntimeError(str(e)) from e
+
+            await write(batch)
+            num_illusts += len(batch[0])
+            num_bookmarks += len(batch[1])
+
+            yield f'导入完成，共 {num_illusts} 条详情， {num_bookmarks} 条收藏\n'
+
+        return gen()
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_import_ndjson_file(
+        cls, ctx: WahuContext, name: str, path: str
+    ) -> tuple[int, int]:
+        """
+        将服务器上的 NDJSON 文件 `path` 导入数据库，逐行读取，每 `NDJSON_BATCH_SIZE` 行提交一次
+        - `:return:` `(导入的详情数, 导入的收藏数)`
+        """
+
+        def load(ibd: IllustBookmarkDatabase) -> tuple[int, int]:
+            with open(path, 'r', encoding='utf-8') as f:
+                return load_ndjson(ibd, f, NDJSON_BATCH_SIZE)
+
+        try:
+            return await ctx.ilst_bmdbs[name].run(load)
+        except NdjsonError as e:
+            raise WahuRuntimeError(str(e)) from e
 
-        d = json.loads(json_str)
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_import_snapshot(
+        cls, ctx: WahuContext, name: str, path: str
+    ) -> tuple[int, int]:
+        """
+        将服务器上的快照文件 `path` 导入数据库，每 `NDJSON_BATCH_SIZE` 行提交一次
+        - `:return:` `(导入的详情数, 导入的收藏数)`
+        """
 
         try:
-            illusts: list[IllustDetail] = []
+            return await ctx.ilst_bmdbs[name].run(
+                lambda ibd: load_snapshot(ibd, path, NDJSON_BATCH_SIZE))
+        except SnapshotError as e:
+            raise WahuRuntimeError(str(e)) from e
+
+    @classmethod
+    @wahu_methodize(middlewares=[_check_db_name])
+    async def ibd_import_json(
+        cls, ctx: WahuContext, name: str, json_str: str
+    ) -> None:
+        """将旧版本导出的 JSON 文件导入数据库；新的导出格式见 `ibd_import_ndjson`"""
 
-            for d_ilst in d['illusts']:
-                d_ilst['user'] = PixivUserSummery(**d_ilst['user'])
-                d_ilst['tags'] = [
-                    IllustTag(n, t)
-                    for n, t in d_ilst['tags']
-                ]
-                illusts.append(IllustDetail(**d_ilst))
+        try:
+            d = json.loads(json_str)
 
+            illusts = [illust_from_dict(d_ilst) for d_ilst in d['illusts']]
             bookmarks = [IllustBookmark(**d_bm) for d_bm in d['bookmarks']]
 
-        except TypeError or KeyError as e:
+        except (TypeError, KeyError, ValueError) as e:
             raise WahuRuntimeError('不合法的 Export 文件') from e
 
-        with await ctx.ilst_bmdbs[name](readonly=False) as ibd:
+        def write(ibd: IllustBookmarkDatabase) -> None:
             ibd.illusts_te.insert(illusts)
             ibd.bookmarks_te.insert(bookmarks)
 
+        await ctx.ilst_bmdbs[name].run(write)
+
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
     async def ibd_update(
-        cls, ctx: WahuContext, name: str
-    ) -> None:
-        """更新数据库中的插画详情"""
+        cls, ctx: WahuContext, name: str, update_all: bool = False
+    ) -> AsyncGenerator[str, Optional[str]]:
+        """
+        更新数据库中缺失的，以及超过配置的刷新时间的插画详情，返回输出进度的管道.
+        详情分批写入并提交，中断后再次更新会跳过已经写入的插画
+        - `:param update_all:` 重新获取所有详情；此时中断后再次更新仍会从头开始
+        """
 
-        with await ctx.ilst_bmdbs[name](readonly=False) as ibd:
-            await ibd.update_detail(ctx.papi.pool_illust_detail)
+        if update_all:
+            max_age: Optional[float] = 0
+        elif ctx.config.ibd_refresh_days > 0:
+            max_age = ctx.config.ibd_refresh_days * 24 * 3600
+        else:
+            max_age = None
+
+        dcm = ctx.ilst_bmdbs[name]
+        iids = await dcm.run(lambda ibd: ibd.stale_detail_iids(max_age), readonly=True)
+
+        pipe = AsyncGenPipe()
+
+        async def write(details: list[IllustDetail]) -> None:
+            await dcm.run(lambda ibd: ibd.illusts_te.insert(details))
+
+        async def coro():
+            try:
+                failed = await fetch_details(
+                    iids, ctx.papi.pool_illust_detail, write,
+                    concurrency=ctx.config.ibd_update_concurrency,
+                    chunk_size=ctx.config.ibd_update_chunk_size,
+                    pipe=pipe
+                )
+                pipe.output(f'更新了 {len(iids) - len(failed)} 条插画详情，{len(failed)} 条失败\n')
+            except Exception as e:
+                logger.exception('ibd_update: 更新 %s 失败' % name)
+                pipe.output(f'更新中止: {e}\n')
+            finally:
+                pipe.close()
+
+        asyncio.create_task(coro())
+
+        return pipe
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -363,8 +649,8 @@ class WahuIllustDatabaseMethods:
     ) -> IllustBookmarkingConfig:
         """获取数据库配置"""
 
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-            return ibd.config_table_editor.all()
+        return await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.config_table_editor.all(), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_db_name])
@@ -383,8 +669,8 @@ class WahuIllustDatabaseMethods:
           except KeyError as ke:
               raise WahuRuntimeError(f'缺少配置项 {ke.args}')
 
-        with await ctx.ilst_bmdbs[name](readonly=False) as ibd:
-            ibd.config_table_editor.setall(cfg)
+        await ctx.ilst_bmdbs[name].run(
+            lambda ibd: ibd.config_table_editor.setall(cfg))
 
 
     @classmethod
@@ -398,7 +684,9 @@ class WahuIllustDatabaseMethods:
             coro_update, pipe = await ibd.update_subscrip(
                 get_user_bookmarks=ctx.papi.user_bookmarks_illusts,
                 get_user_illusts=ctx.papi.user_illusts,
-                page_num=page_num
+                page_num=page_num,
+                concurrency=ctx.config.ibd_subscribe_concurrency,
+                rate=ctx.config.ibd_subscribe_rate
             )
         
         async def coro():
@@ -3,16 +3,17 @@ import itertools
 from dataclasses import dataclass
 from functools import reduce
 from pathlib import Path
-from typing import TYPE_CHECKING, TypeVar, Type
+from typing import TYPE_CHECKING, Optional, TypeVar, Type
 
 from ..aiopixivpy import IllustDetail
 from ..file_tracing import FileEntry, FileTracer
-from ..illust_bookmarking import IllustBookmark
+from ..illust_bookmarking import IllustBookmark, IllustBookmarkDatabase
 from ..sqlite_tools.database_ctx_man import DatabaseContextManager
 from ..wahu_core import (GenericWahuMethod, WahuArguments, WahuContext,
                          wahu_methodize)
 from ..wahu_core.core_exceptions import WahuRuntimeError
 from ..wahu_core.repo_db_link import RepoEntry
+from .jobs import add_repo_jobs, remove_repo_jobs
 from .lib_logger import logger
 
 if TYPE_CHECKING:
@@ -56,6 +57,28 @@ class RepoSyncAddReport:
     entries: list[FileEntryWithURL]
 
 # ------------------------------------------------------------------- 工具
+async def download_to_repo(
+    ctx: WahuContext, name: str, file_entries_withurl: list[FileEntryWithURL]
+) -> None:
+    """下载到储存库 `name` ，所有下载结束后返回. 单个文件下载失败不影响其他文件"""
+
+    root_path = ctx.ilst_repos[name].dd.root_path
+
+    async def dl_coro(fewu: FileEntryWithURL):
+        file_path = root_path / fewu.path
+        if not file_path.exists():
+
+            await ctx.image_pool.download_to(fewu.url, file_path, descript=str(fewu.path))
+        else:
+            logger.warn(f'ir_download: 文件 {file_path} 已存在，不再下载')
+
+    results = await asyncio.gather(
+        *(dl_coro(fewu) for fewu in file_entries_withurl), return_exceptions=True)
+
+    for fewu, r in zip(file_entries_withurl, results):
+        if isinstance(r, Exception):
+            logger.error(f'ir_download: 下载 {fewu.path} 失败: {r!r}')
+
 INVALID_CHAR_CVT = [
     ('?', '？'), ( '/', '-'), ( '\\', '、'), ( ',', '：'),
     ('*', '^'), ( '"', "'"), ( '<', '《'), ( '>', '》'), ( '|', '+')
@@ -90,6 +113,8 @@ class IllustRepoMethods:
         )
         ctx.repo_db_link.write()
 
+        add_repo_jobs(cls, ctx, name)
+
     @classmethod
     @wahu_methodize()
     async def ir_list(cls, ctx: WahuContext) -> list[str]:
@@ -134,55 +159,65 @@ class IllustRepoMethods:
         db_file_entries: list[tuple[str, set[FileEntryWithURL]]] = []
 
         for ibd_ctxman in ctx.repo_db_link.dfr(name):
-            with await ibd_ctxman(readonly=True) as ibd:
+            fetched_details: list[IllustDetail] = []
 
+            def read_db(
+                ibd: IllustBookmarkDatabase
+            ) -> tuple[str, list[IllustBookmark], dict[int, Optional[IllustDetail]]]:
                 bms = ibd.all_bookmarks()
+                return ibd.name, bms, {bm.iid: ibd.query_detail(bm.iid) for bm in bms}
 
-                # 获取详情：首先从数据库，如果没有则从 PixivAPI
-                async def get_detail(iid: int) -> IllustDetail:
-                    dtl = ibd.query_detail(iid)
-
-                    if dtl is not None:
-                        return dtl
-
-                    dtl = await ctx.papi.pool_illust_detail(iid)
+            db_name, bms, stored_details = await ibd_ctxman.run(read_db, readonly=True)
 
-                    # 顺便加入数据库
-                    ibd.illusts_te.insert([dtl])
+            # 获取详情：首先从数据库，如果没有则从 PixivAPI
+            async def get_detail(iid: int) -> IllustDetail:
+                dtl = stored_details[iid]
 
+                if dtl is not None:
                     return dtl
 
-                async def get_file_entries(bm: IllustBookmark) -> list[FileEntryWithURL]:
-                    dtl = await get_detail(bm.iid)
-                    ext = dtl.image_origin[0].split('.')[-1]
-                    return [
-                        FileEntryWithURL(
-                            # 此处的路径不包括储存库根目录
-                            Path(
-                                _cvt_invalid_path_char(  # 去除 Windows 无法作为路径的字符
-                                    ctx.config.file_name_template.format(
-                                    dtl, i) + f'.{ext}'
-                                )
-                            ),
-                            fid,
-                            dtl.image_origin[i]
-                        )
-                        for i, fid in enumerate(bm.as_fids())
-                    ]
-
-                file_entrie_list: list[list[FileEntryWithURL]] = await asyncio.gather(
-                    *(get_file_entries(bm) for bm in bms)
-                )
+                dtl = await ctx.papi.pool_illust_detail(iid)
+
+                # 顺便加入数据库
+                fetched_details.append(dtl)
+
+                return dtl
+
+            async def get_file_entries(bm: IllustBookmark) -> list[FileEntryWithURL]:
+                dtl = await get_detail(bm.iid)
+                ext = dtl.image_origin[0].split('.')[-1]
+                return [
+                    FileEntryWithURL(
+                        # 此处的路径不包括储存库根目录
+                        Path(
+                            _cvt_invalid_path_char(  # 去除 Windows 无法作为路径的字符
+                                ctx.config.file_name_template.format(
+                                dtl, i) + f'.{ext}'
+                            )
+                        ),
+                        fid,
+                        dtl.image_origin[i]
+                    )
+                    for i, fid in enumerate(bm.as_fids())
+                ]
+
+            file_entrie_list: list[list[FileEntryWithURL]] = await asyncio.gather(
+                *(get_file_entries(bm) for bm in bms)
+            )
 
-                # 压平
-                file_entries: set[FileEntryWithURL] = set(
-                    itertools.chain(*file_entrie_list)
-                )
+            # 压平
+            file_entries: set[FileEntryWithURL] = set(
+                itertools.chain(*file_entrie_list)
+            )
+
+            db_file_entries.append((db_name, file_entries))
 
-                db_file_entries.append((ibd.name, file_entries))
+            if fetched_details != []:
+                await ibd_ctxman.run(
+                    lambda ibd: ibd.illusts_te.insert(fetched_details))
 
-        with await ctx.ilst_repos[name](readonly=True) as ft:
-            ft_file_entries = set(ft.all_index())
+        ft_file_entries = set(await ctx.ilst_repos[name].run(
+            lambda ft: ft.all_index(), readonly=True))
 
         to_add_db_file_entries: list[RepoSyncAddReport] = [
             RepoSyncAddReport(db_name, list(file_entries.difference(ft_file_entries)))
@@ -210,8 +245,7 @@ class IllustRepoMethods:
         # 去重
         file_entries = list(set(file_entries))
 
-        with await ctx.ilst_repos[name](readonly=False) as ft:
-            ft.add_cache(file_entries)
+        await ctx.ilst_repos[name].run(lambda ft: ft.add_cache(file_entries))
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
@@ -220,19 +254,7 @@ class IllustRepoMethods:
     ) -> None:
         """下载到储存库. 路径为相对路径"""
 
-        root_path = ctx.ilst_repos[name].dd.root_path
-
-        async def dl_coro(fewu: FileEntryWithURL):
-            file_path = root_path / fewu.path
-            if not file_path.exists():
-
-                image = await ctx.image_pool.get_image(fewu.url, descript=str(fewu.path))
-                with open(file_path, 'wb') as wf:
-                    wf.write(image)
-            else:
-                logger.warn(f'ir_download: 文件 {file_path} 已存在，不再下载')
-
-        [asyncio.create_task(dl_coro(fewu)) for fewu in file_entries_withurl]
+        asyncio.create_task(download_to_repo(ctx, name, file_entries_withurl))
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
@@ -241,8 +263,7 @@ class IllustRepoMethods:
     ) -> list[FileEntry]:
         """检查本地文件，将 cached 中下载完成的移入 indexed"""
 
-        with await ctx.ilst_repos[name](readonly=False) as ft:
-            return ft.update_index()
+        return await ctx.ilst_repos[name].run(lambda ft: ft.update_index())
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
@@ -251,8 +272,7 @@ class IllustRepoMethods:
     ) -> None:
         """从 indexed 删除"""
 
-        with await ctx.ilst_repos[name](readonly=False) as ft:
-            ft.remove_index(index_fids)
+        await ctx.ilst_repos[name].run(lambda ft: ft.remove_index(index_fids))
 
 
     @classmethod
@@ -262,11 +282,13 @@ class IllustRepoMethods:
     ) -> tuple[list[FileEntry], list[Path]]:
         """校验文件和索引是否有效. 路径为绝对路径"""
 
-        with await ctx.ilst_repos[name](readonly=True) as ft:
-            return (
+        return await ctx.ilst_repos[name].run(
+            lambda ft: (
                 ft.validate_index(),
                 ft.validate_files()
-            )
+            ),
+            readonly=True
+        )
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
@@ -289,8 +311,8 @@ class IllustRepoMethods:
     ) -> list[FileEntry]:
         """获取 cached 表"""
 
-        with await ctx.ilst_repos[name](readonly=True) as ft:
-            return ft.all_cache()
+        return await ctx.ilst_repos[name].run(
+            lambda ft: ft.all_cache(), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
@@ -299,8 +321,8 @@ class IllustRepoMethods:
     ) -> list[FileEntry]:
         """获取 indexed 表"""
 
-        with await ctx.ilst_repos[name](readonly=True) as ft:
-            return ft.all_index()
+        return await ctx.ilst_repos[name].run(
+            lambda ft: ft.all_index(), readonly=True)
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
@@ -309,14 +331,16 @@ class IllustRepoMethods:
     ) -> None:
         """清除 cached 表"""
 
-        with await ctx.ilst_repos[name](readonly=False) as ft:
-            ft.empty_cache()
+        await ctx.ilst_repos[name].run(lambda ft: ft.empty_cache())
 
     @classmethod
     @wahu_methodize(middlewares=[_check_repo_name])
     async def ir_remove(cls, ctx: WahuContext, name: str) -> None:
         """移除储存库"""
 
+        await remove_repo_jobs(ctx, name)
+
+        await ctx.ilst_repos[name].close()
         ctx.ilst_repos.pop(name)
         ctx.repo_db_link.repos.pop(name)
         ctx.repo_db_link.update_rfd()
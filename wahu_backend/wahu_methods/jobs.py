@@ -0,0 +1,119 @@
+"""
+后台定时任务. 为每个数据库和储存库注册任务，间隔由配置中的 `[jobs]` 决定；
+新建和删除数据库、储存库时同时添加和删除它们的任务
+- `update_subs:<数据库名>` 更新订阅
+- `update_detail:<数据库名>` 更新缺失或过旧的详情
+- `sync_repo:<储存库名>` 计算储存库的同步，把新增的条目加入缓存并下载，然后更新索引；不会删除条目
+"""
+
+from typing import TYPE_CHECKING, AsyncGenerator, Optional
+
+from ..wahu_core import WahuContext, wahu_methodize
+from ..wahu_core.job_scheduler import JobStatus
+from .lib_logger import logger
+
+if TYPE_CHECKING:
+    from . import WahuMethods
+
+IBD_JOBS = ('update_subs', 'update_detail')
+REPO_JOBS = ('sync_repo', )
+
+
+async def _drain(pipe: AsyncGenerator[str, Optional[str]]) -> None:
+    """等待管道关闭"""
+
+    async for _ in pipe:
+        pass
+
+
+def add_ibd_jobs(cls: type['WahuMethods'], ctx: WahuContext, name: str) -> None:
+    """添加数据库 `name` 的任务，间隔为 0 的任务不添加"""
+
+    cfg = ctx.config
+
+    if cfg.job_update_subs_interval > 0:
+        async def update_subs():
+            await _drain(await cls.ibd_update_subs(ctx, name, None))
+
+        ctx.jobs.add(
+            f'update_subs:{name}', cfg.job_update_subs_interval * 60,
+            update_subs, [f'ibd:{name}'])
+
+    if cfg.job_update_detail_interval > 0:
+        async def update_detail():
+            await _drain(await cls.ibd_update(ctx, name))
+
+        ctx.jobs.add(
+            f'update_detail:{name}', cfg.job_update_detail_interval * 60,
+            update_detail, [f'ibd:{name}'])
+
+
+def add_repo_jobs(cls: type['WahuMethods'], ctx: WahuContext, name: str) -> None:
+    """添加储存库 `name` 的任务，间隔为 0 时不添加"""
+
+    cfg = ctx.config
+
+    if cfg.job_sync_repo_interval <= 0:
+        return
+
+    async def sync_repo():
+        # `illust_repo` 依赖本模块，因此在此处导入
+        from .illust_repo import download_to_repo
+
+        _, to_add = await cls.ir_calc_sync(ctx, name)
+        entries = list({fe for report in to_add for fe in report.entries})
+
+        await cls.ir_add_cache(ctx, name, entries)
+        await download_to_repo(ctx, name, entries)
+        indexed = await cls.ir_update_index(ctx, name)
+
+        logger.info(f'sync_repo: 储存库 {name} 新增了 {len(indexed)} 项')
+
+    def resources() -> list[str]:
+        # 连接的数据库可能在注册后改变，每次运行前重新求得
+        linked = ctx.repo_db_link.repos[name].linked_databases
+        return [f'ir:{name}', *(f'ibd:{db}' for db in linked if db in ctx.ilst_bmdbs.keys())]
+
+    ctx.jobs.add(
+        f'sync_repo:{name}', cfg.job_sync_repo_interval * 60, sync_repo, resources)
+
+
+async def remove_ibd_jobs(ctx: WahuContext, name: str) -> None:
+    """删除数据库 `name` 的任务，正在运行的会被取消"""
+
+    for job in IBD_JOBS:
+        await ctx.jobs.remove(f'{job}:{name}')
+
+
+async def remove_repo_jobs(ctx: WahuContext, name: str) -> None:
+    """删除储存库 `name` 的任务，正在运行的会被取消"""
+
+    for job in REPO_JOBS:
+        await ctx.jobs.remove(f'{job}:{name}')
+
+
+def register_jobs(cls: type['WahuMethods'], ctx: WahuContext) -> None:
+    """为所有数据库和储存库添加任务"""
+
+    for name in ctx.ilst_bmdbs.keys():
+        add_ibd_jobs(cls, ctx, name)
+
+    for name in ctx.repo_db_link.repos.keys():
+        add_repo_jobs(cls, ctx, name)
+
+
+class WahuJobMethods:
+
+    @classmethod
+    @wahu_methodize()
+    async def job_status(cls, ctx: WahuContext) -> list[JobStatus]:
+        """所有后台任务的状态"""
+
+        return ctx.jobs.status()
+
+    @classmethod
+    @wahu_methodize()
+    async def job_run(cls, ctx: WahuContext, name: str) -> None:
+        """立即运行后台任务 `name`"""
+
+        ctx.jobs.run_now(name)
@@ -38,10 +38,7 @@ class WahuMiscMethods:
         if path.exists():
             logger.warn(f'文件 {path} 已存在')
 
-        image = await ctx.image_pool.get_image(url, descript=str(path))
-
-        with open(path, 'wb') as wf:
-            wf.write(image)
+        await ctx.image_pool.download_to(url, path, descript=str(path))
 
     @classmethod
     @wahu_methodize()
@@ -1,4 +1,3 @@
-import itertools
 from collections import Counter
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, AsyncGenerator, Optional, Type, TypeVar
@@ -56,9 +55,10 @@ async def get_tag_groups(ctx: WahuContext, *names: str) -> list[list[IllustTag]]
     tag_groups: list[list[IllustTag]] = []
 
     for name in names:
-        with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-
-            tag_groups += [r[0] for r in ibd.illusts_te.select_cols(cols=['tags'])]
+        tag_groups += await ctx.ilst_bmdbs[name].run(
+            lambda ibd: [r[0] for r in ibd.illusts_te.select_cols(cols=['tags'])],
+            readonly=True
+        )
 
     return tag_groups
 
@@ -81,16 +81,14 @@ class WahuTagStatisticMethods:
         返回：[(IllustTag，次数), ...]
         """
 
-        tags: list[IllustTag] = []
+        cntr: Counter[IllustTag] = Counter()
 
         for name in names:
-            with await ctx.ilst_bmdbs[name](readonly=True) as ibd:
-
-                tags += itertools.chain(
-                    *(r[0] for r in ibd.illusts_te.select_cols(cols=['tags']))
-                )
-
-        cntr = Counter(tags)
+            for tag, count in await ctx.ilst_bmdbs[name].run(
+                lambda ibd: ibd.illusts_te.tag_count(),
+                readonly=True
+            ):
+                cntr[tag] += count
 
         result = cntr.most_common()
 
@@ -39,8 +39,8 @@ def register(app: web.Application, ctx: WahuContext) -> None:
         if repo_name not in ctx.ilst_repos.keys():
             return web.Response(status=404, reason='找不到储存库')
 
-        with await ctx.ilst_repos[repo_name](readonly=True) as ft:
-            pth = ft.checkout(fid)
+        pth = await ctx.ilst_repos[repo_name].run(
+            lambda ft: ft.checkout(fid), readonly=True)
 
         if pth is not None:
             if not pth.exists():
@@ -65,42 +65,42 @@ def register(app: web.Application, ctx: WahuContext) -> None:
 
         if db_name in ctx.ilst_bmdbs.keys():
             for ft_ctxman in ctx.repo_db_link.rfd(db_name):
-                with await ft_ctxman(readonly=True) as ft:
-                    pth = ft.checkout(f'{iid}-{p}')
-
-                    if pth is not None:
-
-                        if not pth.exists():
-                            app.logger.warn('Server: ilstdbimage: 索引中的文件 %s 不存在' % str(pth))
-                        else:
-                            with open(pth, 'rb') as rf:
-                                return web.Response(
-                                    body=rf.read(),
-                                    content_type='image/jpeg',
-                                    headers={'Local': '1'}
-                                )
-
-        with await ctx.ilst_bmdbs[db_name](readonly=True) as ibd:
-            ilst = ibd.query_detail(iid)
-
-            if ilst is not None:
-                if p >= ilst.page_count:
-                    return web.Response(status=404, reason='找不到指定插画页')
-
-                match ctx.config.fallback_image_size:
-                    case 'original':
-                        image_url = ilst.image_origin[p]
-                    case 'medium':
-                        image_url = ilst.image_medium[p]
-                    case 'large':
-                        image_url = ilst.image_large[p]
-                    case 'square_medium':
-                        image_url = ilst.image_sqmedium[p]
-                    case _:
-                        raise RuntimeError(f'不支持的图片大小 {ctx.config.fallback_image_size}')
-
-                raise web.HTTPFound(f'/image/{image_url}')
-
-            return web.Response(status=404, reason='数据库中找不到插画')
+                pth = await ft_ctxman.run(
+                    lambda ft: ft.checkout(f'{iid}-{p}'), readonly=True)
+
+                if pth is not None:
+
+                    if not pth.exists():
+                        app.logger.warn('Server: ilstdbimage: 索引中的文件 %s 不存在' % str(pth))
+                    else:
+                        with open(pth, 'rb') as rf:
+                            return web.Response(
+                                body=rf.read(),
+                                content_type='image/jpeg',
+                                headers={'Local': '1'}
+                            )
+
+        ilst = await ctx.ilst_bmdbs[db_name].run(
+            lambda ibd: ibd.query_detail(iid), readonly=True)
+
+        if ilst is not None:
+            if p >= ilst.page_count:
+                return web.Response(status=404, reason='找不到指定插画页')
+
+            match ctx.config.fallback_image_size:
+                case 'original':
+                    image_url = ilst.image_origin[p]
+                case 'medium':
+                    image_url = ilst.image_medium[p]
+                case 'large':
+                    image_url = ilst.image_large[p]
+                case 'square_medium':
+                    image_url = ilst.image_sqmedium[p]
+                case _:
+                    raise RuntimeError(f'不支持的图片大小 {ctx.config.fallback_image_size}')
+
+            raise web.HTTPFound(f'/image/{image_url}')
+
+        return web.Response(status=404, reason='数据库中找不到插画')
 
     app.add_routes(routes)
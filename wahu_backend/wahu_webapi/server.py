@@ -3,6 +3,8 @@ from aiohttp import web
 from importlib import resources
 
 from ..wahu_core import WahuContext
+from ..wahu_methods import WahuMethods
+from ..wahu_methods.jobs import register_jobs
 from .api_image import register as reg_image_api
 from .api_rpc import register as reg_rpc_api
 
@@ -24,6 +26,18 @@ def create_app(ctx: WahuContext) -> web.Application:
     reg_image_api(app, ctx)
     reg_rpc_api(app, ctx)
 
+    # 后台任务随服务器启动和关闭
+    register_jobs(WahuMethods, ctx)
+
+    async def start_jobs(app: web.Application):
+        ctx.jobs.start()
+
+    async def stop_jobs(app: web.Application):
+        await ctx.jobs.stop()
+
+    app.on_startup.append(start_jobs)
+    app.on_cleanup.append(stop_jobs)
+
     try:
         res_path = resources.path('wahu_frontend', 'index.html').__enter__()
         app.logger.debug('Server: 使用 wahu_frontend 包中的静态文件')
@@ -1,13 +1,9 @@
-import itertools
-from typing import TYPE_CHECKING, Iterable, Literal, Optional
+from typing import TYPE_CHECKING, Literal, Optional
 
 import click
-from collections import Counter
-from wahu_backend.aiopixivpy.datastructure_illust import PixivUserSummery
 
 
 if TYPE_CHECKING:
-    from wahu_backend.aiopixivpy.datastructure_illust import IllustTag
     from wahu_backend.wahu_core import CliClickCtxObj
 
 from wahu_backend.wahu_core.wahu_cli_util import less, wahu_cli_wrap
@@ -51,33 +47,21 @@ def mount(parent_group: click.Group):
         if num == -1:
             num = None
 
-        with await wctx.ilst_bmdbs[name](readonly=True) as ibd:
+        if target == 'tag':
+            tag_result = await wctx.ilst_bmdbs[name].run(
+                lambda ibd: ibd.illusts_te.tag_count(num), readonly=True)
 
-            if target == 'tag':
-                tags: Iterable[IllustTag] = itertools.chain(
-                    *(r[0] for r in ibd.illusts_te.select_cols(cols=['tags']))
-                )
+            tbl.field_names = ['名', '译', '次数']
+            tbl.add_rows([
+                (it.name, it.translated if it.translated is not None else '', n)
+                for it, n in tag_result
+            ])
 
-                cntr = Counter(tags)
+        else:
+            user_result = await wctx.ilst_bmdbs[name].run(
+                lambda ibd: ibd.illusts_te.user_count(num), readonly=True)
 
-                result = cntr.most_common(num)
-
-                tbl.field_names = ['名', '译', '次数']
-                tbl.add_rows([
-                    (it.name, it.translated if it.translated is not None else '', n)
-                    for it, n in result
-                ])
-
-            else:
-                users: Iterable[PixivUserSummery] = (
-                    r[0] for r in ibd.illusts_te.select_cols(cols=['user'])
-                )
-
-                cntr = Counter(users)
-
-                result = cntr.most_common(num)
-
-                tbl.field_names = ['UID', '名', '次数']
-                tbl.add_rows([(u.uid, u.name, n) for u, n in result])
+            tbl.field_names = ['UID', '名', '次数']
+            tbl.add_rows([(u.uid, u.name, n) for u, n in user_result])
 
         await less(tbl.get_string(), pipe)
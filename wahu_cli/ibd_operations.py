@@ -1,4 +1,4 @@
-import itertools
+from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 import click
 
@@ -10,6 +10,7 @@ if TYPE_CHECKING:
 from wahu_backend.wahu_core.wahu_cli_util import (dumps_dataclass,
                                                     print_help, wahu_cli_wrap)
 from wahu_backend.constants import illustDbImageURL
+from wahu_backend.illust_bookmarking.snapshot import is_snapshot
 from wahu_backend.wahu_methods import WahuMethods
 
 from ibd_count import mount as mount_ibd_count
@@ -183,6 +184,49 @@ def mount(wexe: click.Group):
             obj.pipe.putline(str(bm.pages))
 
 
+    @ibd.command()
+    @click.argument('name', type=str, required=True)
+    @click.option(
+        '--num', '-n', type=int, default=50,
+        help='显示的收藏数. -1 代表全部'
+    )
+    @click.option(
+        '--page-size', type=int, default=200,
+        help='每次从数据库读取的收藏数'
+    )
+    @wahu_cli_wrap
+    async def ls_bm(
+        cctx: click.Context,
+        name: str,
+        num: int,
+        page_size: int
+    ):
+        """按添加时间由新到旧列出数据库 NAME 中的收藏
+        """
+
+        obj: 'CliClickCtxObj' = cctx.obj
+
+        if name not in obj.wctx.ilst_bmdbs.keys():
+            raise KeyError(f'fatal: 数据库 {name} 不存在')
+
+        after: Optional[list[int]] = None
+
+        while num != 0:
+            limit = page_size if num < 0 else min(num, page_size)
+            bms, after = await WahuMethods.ibd_page_bm(
+                obj.wctx, name, after, limit)
+
+            tbl = table_factory()
+            tbl.add_rows([
+                (bm.iid, datetime.fromtimestamp(bm.add_timestamp), bm.pages)
+                for bm in bms
+            ])
+            obj.pipe.putline(tbl.get_string())
+
+            num -= len(bms)
+            if after is None:
+                break
+
     @ibd.command()
     @click.argument('name', type=str, required=True)
     @click.argument('iid', type=int, required=True)
@@ -236,13 +280,11 @@ def mount(wexe: click.Group):
         if name not in obj.wctx.ilst_bmdbs.keys():
             raise KeyError(f'fatal: 数据库 {name} 不存在')
 
-        with await obj.wctx.ilst_bmdbs[name](readonly=True) as ibd:
-            illusts = ibd.all_illusts()
-
-        urls = itertools.chain(
-            *([f'{server_url}{url}' for url in ilst.image_origin]
-              for ilst in illusts)
-        )
+        urls = await obj.wctx.ilst_bmdbs[name].run(
+            lambda ibd: [f'{server_url}{url}'
+                         for ilst in ibd.iter_illusts()
+                         for url in ilst.image_origin],
+            readonly=True)
 
         if output is None:
             obj.pipe.putline('\n'.join(urls))
@@ -252,13 +294,74 @@ def mount(wexe: click.Group):
 
     @ibd.command()
     @click.argument('name', type=str, required=True)
+    @click.option('--all', '-a', 'update_all', is_flag=True, help='更新所有详情，而不仅是缺失或过旧的')
     @wahu_cli_wrap
-    async def update(cctx: click.Context, name: str):
+    async def update(cctx: click.Context, name: str, update_all: bool):
         """更新数据库 NAME 中的详情
+        中断后再次执行会跳过已经写入的详情
+        """
+
+        obj: 'CliClickCtxObj' = cctx.obj
+
+        pipe = await WahuMethods.ibd_update(obj.wctx, name, update_all)
+
+        async for line in pipe:
+            obj.pipe.putline(line.rstrip('\n'))
+
+    @ibd.command()
+    @click.argument('name', type=str, required=True)
+    @click.argument('target', type=str, required=True)
+    @click.option('--pages', '-p', type=click.Choice(['source', 'target', 'union']),
+                  default='union', help='两边都收藏了的插画的收藏页')
+    @wahu_cli_wrap
+    async def merge(cctx: click.Context, name: str, target: str, pages: str):
+        """将数据库 NAME 合并到 TARGET
         """
 
         obj: 'CliClickCtxObj' = cctx.obj
 
-        num = await WahuMethods.ibd_update(obj.wctx, name)
+        num_illusts, num_bookmarks = await WahuMethods.ibd_merge(
+            obj.wctx, name, target, pages)
+
+        obj.pipe.putline(f'复制了 {num_illusts} 条详情， {num_bookmarks} 条收藏')
+
+    @ibd.command()
+    @click.argument('name', type=str, required=True)
+    @click.argument('output', type=str, required=True)
+    @click.option('--format', '-f', 'fmt', type=click.Choice(['ndjson', 'snapshot']),
+                  default='ndjson', help='导出格式；快照是紧凑的二进制格式')
+    @wahu_cli_wrap
+    async def export(cctx: click.Context, name: str, output: str, fmt: str):
+        """将数据库 NAME 导出为文件 OUTPUT
+        """
+
+        obj: 'CliClickCtxObj' = cctx.obj
+        path = str(obj.wctx.config.wpath(output))
+
+        if fmt == 'snapshot':
+            num_illusts, num_bookmarks = await WahuMethods.ibd_export_snapshot(
+                obj.wctx, name, path)
+            obj.pipe.putline(f'导出了 {num_illusts} 条详情， {num_bookmarks} 条收藏')
+        else:
+            await WahuMethods.ibd_export_ndjson_file(obj.wctx, name, path)
+
+    @ibd.command('import')
+    @click.argument('name', type=str, required=True)
+    @click.argument('input_file', metavar='INPUT', type=str, required=True)
+    @wahu_cli_wrap
+    async def import_(cctx: click.Context, name: str, input_file: str):
+        """将 NDJSON 或快照文件 INPUT 导入数据库 NAME
+        中断时已经提交的部分会保留
+        """
+
+        obj: 'CliClickCtxObj' = cctx.obj
+        path = obj.wctx.config.wpath(input_file)
+
+        if is_snapshot(path):
+            num_illusts, num_bookmarks = await WahuMethods.ibd_import_snapshot(
+                obj.wctx, name, str(path))
+        else:
+            num_illusts, num_bookmarks = await WahuMethods.ibd_import_ndjson_file(
+                obj.wctx, name, str(path))
 
-        obj.pipe.putline(f'更新了 {num} 条插画详情')
+        obj.pipe.putline(f'导入了 {num_illusts} 条详情， {num_bookmarks} 条收藏')
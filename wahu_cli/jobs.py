@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+import click
+
+if TYPE_CHECKING:
+    from wahu_backend.wahu_core import CliClickCtxObj
+
+from wahu_backend.wahu_core.wahu_cli_util import wahu_cli_wrap, print_help
+from wahu_backend.wahu_methods import WahuMethods
+
+from helpers import table_factory
+
+NAME = '后台任务'
+DESCRIPTION = '查看和运行定时更新订阅、详情和同步储存库的后台任务'
+
+
+def _fmt_time(t: Optional[float]) -> str:
+    return '-' if t is None else datetime.fromtimestamp(t).strftime('%m-%d %H:%M:%S')
+
+
+def mount(wexe: click.Group):
+
+    @wexe.group()
+    @click.option('--help', is_flag=True, callback=print_help,
+                  expose_value=False, is_eager=True)
+    def jobs():
+        """管理后台任务"""
+        pass
+
+    @jobs.command()
+    @wahu_cli_wrap
+    async def status(cctx: click.Context):
+        """打印后台任务的状态"""
+
+        obj: 'CliClickCtxObj' = cctx.obj
+
+        tbl = table_factory()
+        tbl.header = True
+        tbl.field_names = ['任务', '状态', '次数', '上次开始', '耗时', '下次运行', '错误']
+
+        for s in await WahuMethods.job_status(obj.wctx):
+            tbl.add_row((
+                s.name,
+                '运行中' if s.running else '等待',
+                s.run_count,
+                _fmt_time(s.last_start),
+                '-' if s.last_latency is None else f'{s.last_latency:.1f}s',
+                _fmt_time(s.next_run),
+                s.last_error or ''
+            ))
+
+        obj.pipe.putline(tbl.get_string())
+
+    @jobs.command()
+    @click.argument('name', type=str, required=True)
+    @wahu_cli_wrap
+    async def run(cctx: click.Context, name: str):
+        """立即运行后台任务 NAME"""
+
+        obj: 'CliClickCtxObj' = cctx.obj
+
+        await WahuMethods.job_run(obj.wctx, name)
+
+        obj.pipe.putline(f'已触发任务 {name}')
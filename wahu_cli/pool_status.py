@@ -1,11 +1,14 @@
+import asyncio
 from typing import TYPE_CHECKING, Optional, Literal
 
 import click
 
 if TYPE_CHECKING:
+    from wahu_backend.pixiv_image import PixivImagePool
     from wahu_backend.wahu_core import CliClickCtxObj
 
 from wahu_backend.wahu_core.wahu_cli_util import less, wahu_cli_wrap, print_help
+from wahu_backend.illust_bookmarking import ngram_index
 
 from helpers import table_factory
 
@@ -13,6 +16,35 @@ NAME = '池状态'
 DESCRIPTION = '插画缓存池、图片缓存池、生成器缓存池状态'
 
 
+def image_pool_rows(image_pool: 'PixivImagePool') -> list[tuple[str, str, str]]:
+    """图片缓存池两个部分和磁盘缓存的占用，以及命中、未命中和淘汰的次数"""
+
+    rows = []
+    for name, lru in (('缩略图', image_pool.thumbnails), ('原图', image_pool.originals)):
+        lookups = lru.hits + lru.misses
+        rows += [
+            (f'图片缓存池 {name}',
+            f'{len(lru)} 张 {lru.used / 2 ** 20:.1f} / {lru.budget / 2 ** 20:.1f} MiB',
+            f'{lru.used * 100 / lru.budget:.3f}%'),
+            (f'图片缓存池 {name} 命中/未命中/淘汰',
+            f'{lru.hits} / {lru.misses} / {lru.evictions}',
+            f'命中率 {lru.hits * 100 / lookups:.1f}%' if lookups > 0 else '')
+        ]
+
+    disk = image_pool.disk_cache
+    if disk is not None:
+        lookups = disk.hits + disk.misses
+        rows += [
+            ('图片磁盘缓存',
+            f'{len(disk)} 张 {disk.used / 2 ** 20:.1f} / {disk.budget / 2 ** 20:.1f} MiB',
+            f'{disk.used * 100 / disk.budget:.3f}%'),
+            ('图片磁盘缓存 命中/未命中/淘汰',
+            f'{disk.hits} / {disk.misses} / {disk.evictions}',
+            f'命中率 {disk.hits * 100 / lookups:.1f}%' if lookups > 0 else '')
+        ]
+    return rows
+
+
 def mount(wexe: click.Group):
 
     @wexe.group()
@@ -46,31 +78,45 @@ def mount(wexe: click.Group):
                 ('插画缓存池',
                 f'{len(wctx.papi.ilst_pool)} / {wctx.papi.ilst_pool_size}',
                 f'{len(wctx.papi.ilst_pool) * 100 / wctx.papi.ilst_pool_size:.3f}%'),
-                ('图片缓存池',
-                f'{len(wctx.image_pool.pool)} / {wctx.image_pool.size}',
-                f'{len(wctx.image_pool.pool) * 100 / wctx.image_pool.size:.3f}%'),
+                *image_pool_rows(wctx.image_pool),
                 ('生成器缓存池',
                 f'{len(wctx.agenerator_pool.pool)} / {wctx.agenerator_pool.size}',
                 f'{len(wctx.agenerator_pool.pool) * 100 / wctx.agenerator_pool.size:.3f}%')
             ])
 
+            if ngram_index.MEMORY_INDEX:
+                for name, dcm in wctx.ilst_bmdbs.items():
+                    index = dcm.dd.ngram_index
+                    if index.built:
+                        tbl.add_row((
+                            f'数据库 {name} 内存索引',
+                            f'{index.size} 条',
+                            f'{index.memory_usage() / 1024 / 1024:.2f} MiB'))
+                    else:
+                        tbl.add_row((f'数据库 {name} 内存索引', '未建立', ''))
+
             obj.pipe.putline(tbl.get_string())
 
         else:
             if verbose == 'ilst':
                 keys = [str(k) for k in wctx.papi.ilst_pool.keys()]
             elif verbose == 'img':
-                keys = list(wctx.image_pool.pool.keys())
+                keys = [*wctx.image_pool.thumbnails.keys(), *wctx.image_pool.originals.keys()]
+                if wctx.image_pool.disk_cache is not None:
+                    keys += [f'{k} (磁盘)' for k in wctx.image_pool.disk_cache.keys()]
             elif verbose == 'gen':
                 keys = list(wctx.agenerator_pool.pool.keys())
 
             await less('\n'.join(keys), obj.pipe)
 
     @pool.command()
-    @click.argument('name', type=click.Choice(['img', 'ilst', 'gen']))
+    @click.argument('name', type=click.Choice(['img', 'img-disk', 'ilst', 'gen']))
     @wahu_cli_wrap
-    async def clean(cctx: click.Context, name: Literal['ilst', 'img', 'gen']):
-        """清空缓存池"""
+    async def clean(cctx: click.Context, name: Literal['ilst', 'img', 'img-disk', 'gen']):
+        """清空缓存池
+
+        img-disk 会删除磁盘上缓存的所有图片.
+        """
 
         obj: CliClickCtxObj = cctx.obj
         wctx = obj.wctx
@@ -78,7 +124,10 @@ def mount(wexe: click.Group):
         if name == 'ilst':
             wctx.papi.ilst_pool.clear()
         elif name == 'img':
-            wctx.image_pool.pool.clear()
+            wctx.image_pool.clear()
+        elif name == 'img-disk':
+            if wctx.image_pool.disk_cache is not None:
+                await asyncio.to_thread(wctx.image_pool.disk_cache.clear)
         elif name == 'gen':
             wctx.agenerator_pool.pool.clear()
 
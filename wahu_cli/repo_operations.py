@@ -18,6 +18,8 @@ DESCRIPTION = '一些对插画储存库的操作'
 
 
 async def ignore_dl_error(coro: Coroutine[None, None, None]) -> None:
+    """重试后仍然失败的下载留下 `.part` 文件，再次同步时从中断处继续"""
+
     try:
         await coro
     except PixivImageGetError as pige: